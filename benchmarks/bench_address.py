@@ -0,0 +1,127 @@
+"""
+    Compares recursive schema walk with compiled schemas on recorded reverse geocoding responses:
+    formatting of parsed address by every schema, and parsing of response with building
+    of CoordinatesAddress parts as refresh_value does.
+
+    python -m benchmarks.bench_address [--repeat 20000] [--responses path/to/responses.json]
+"""
+import argparse
+import json
+import os
+import time
+from typing import List
+
+from geo_garry.federal_subjects import FEDERAL_SUBJECT_CODES
+from geo_garry.gmaps.address import ADDRESS_SCHEMAS, GoogleMapsAddress, extract_address_parts
+
+RESPONSES = os.path.join(os.path.dirname(__file__), 'data', 'gmaps_reverse_geocode.json')
+
+
+def parse_components(address_components: List[dict]) -> dict:
+    """Components parsing as it was done before, type by type."""
+    components = {}
+    for component in address_components:
+        for component_type in component.get('types', []):
+            if component_type in GoogleMapsAddress.TERMS:
+                components[component_type] = component.get('long_name', '').replace(chr(769), '')
+    return components
+
+
+def walk_term(components: dict, term) -> List[str]:
+    """Schema walk as it was done before compilation, on every format call."""
+    if isinstance(term, str) and term in components:
+        if term in ['bus_station', 'transit_station']:
+            return ['ост. ' + components[term]]
+        return [components[term]]
+    if isinstance(term, list):
+        subresult: List[str] = []
+        for subterm in term:
+            subresult += walk_term(components, subterm)
+        return subresult
+    if isinstance(term, tuple):
+        for subterm in term:
+            subresult = walk_term(components, subterm)
+            if subresult:
+                return subresult
+    return []
+
+
+def walk_format(components: dict, schema) -> str:
+    return ', '.join(walk_term(components, schema))
+
+
+def walk_parts(raw_addresses: list) -> tuple:
+    raw_addresses = list(raw_addresses)
+    components = parse_components(raw_addresses.pop(0))
+    address = walk_format(components, ADDRESS_SCHEMAS['as_desc_string'])
+    city = walk_format(components, ADDRESS_SCHEMAS['city'])
+    federal_subject = walk_format(components, ADDRESS_SCHEMAS['federal_subject'])
+    federal_code = FEDERAL_SUBJECT_CODES.get(federal_subject)
+    while not federal_code and raw_addresses:
+        components = parse_components(raw_addresses.pop(0))
+        federal_subject = walk_format(components, ADDRESS_SCHEMAS['federal_subject'])
+        federal_code = FEDERAL_SUBJECT_CODES.get(federal_subject)
+    return address, city, federal_code
+
+
+def compiled_parts(raw_addresses: list) -> tuple:
+    parts = extract_address_parts(raw_addresses)
+    return parts.address, parts.city, FEDERAL_SUBJECT_CODES.get(parts.federal_subject)
+
+
+def measure(name, func, operations):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print('{:<32} {:>10.1f} ops/s {:>8.2f} us/op'.format(
+        name, operations / elapsed, elapsed / operations * 1e6,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20000)
+    parser.add_argument('--responses', default=RESPONSES, help='JSON list of reverse_geocode responses')
+    args = parser.parse_args()
+
+    with open(args.responses, encoding='utf-8') as responses_file:
+        responses = [
+            [result['address_components'] for result in response] for response in json.load(responses_file)
+        ]
+    for raw_addresses in responses:
+        assert walk_parts(raw_addresses) == compiled_parts(raw_addresses), raw_addresses
+    parsed = [GoogleMapsAddress(raw_addresses[0]) for raw_addresses in responses]
+    schemas = list(ADDRESS_SCHEMAS.values())
+    operations = args.repeat * len(responses)
+
+    def format_walk():
+        for _ in range(args.repeat):
+            for address in parsed:
+                for schema in schemas:
+                    walk_format(address.components, schema)
+
+    def format_compiled():
+        for _ in range(args.repeat):
+            for address in parsed:
+                for schema in schemas:
+                    address.format(schema)
+
+    def parts_walk():
+        for _ in range(args.repeat):
+            for raw_addresses in responses:
+                walk_parts(raw_addresses)
+
+    def parts_compiled():
+        for _ in range(args.repeat):
+            for raw_addresses in responses:
+                compiled_parts(raw_addresses)
+
+    print('{} recorded responses'.format(len(responses)))
+    measure('format, schema walk', format_walk, operations)
+    measure('format, compiled', format_compiled, operations)
+    measure('address parts, schema walk', parts_walk, operations)
+    measure('address parts, compiled', parts_compiled, operations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+    Replays address queries and compares forward geocoding cache hit rate of raw keys,
+    case and whitespace insensitive keys (hashed key scheme) and normalize_address keys.
+    Corpus lines are '<place id>\\t<query>', queries of the same place id are the same address,
+    so keys merging different places are counted too. Without --corpus spelling variants
+    of generated addresses are replayed.
+
+    python -m benchmarks.bench_normalize [--corpus queries.tsv] [--places 2000] [--queries 20000]
+"""
+import argparse
+import random
+import time
+from typing import Callable, List, Tuple
+
+from geo_garry.gmaps.cache import normalize_key_address
+from geo_garry.normalize import normalize_address
+
+CITIES = ('Москва', 'Санкт-Петербург', 'Мытищи', 'Королёв', 'Казань', 'Екатеринбург')
+STREET_TYPES = (
+    ('ул.', 'ул', 'улица', 'Ул.'),
+    ('пр-т', 'просп.', 'проспект'),
+    ('пер.', 'переулок'),
+    ('ш.', 'шоссе'),
+    ('б-р', 'бульвар'),
+)
+STREET_NAMES = (
+    'Ленина', 'Мира', 'Гагарина', 'Профсоюзная', 'Тверская-Ямская', 'Зелёная', 'Садовая', 'Лесная',
+    'Центральная', 'Молодёжная', 'Школьная', 'Советская', 'Набережная', 'Победы', 'Кирова',
+)
+LETTERS = ('', '', '', 'а', 'б')
+
+
+def generate_corpus(places: int, queries: int, seed: int) -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    addresses = []
+    for _ in range(places):
+        city = rng.choice(CITIES)
+        street_type = rng.randrange(len(STREET_TYPES))
+        street = rng.choice(STREET_NAMES)
+        house = '{}{}'.format(rng.randint(1, 120), rng.choice(LETTERS))
+        addresses.append((city, street_type, street, house))
+
+    def spell(city: str, street_type: int, street: str, house: str) -> str:
+        city = rng.choice((city, 'г. ' + city, 'г ' + city, city.upper()))
+        street_words = [rng.choice(STREET_TYPES[street_type]), street]
+        if rng.random() < 0.3:
+            street_words.reverse()
+        house = rng.choice((house, 'д. ' + house, 'д.' + house, 'дом ' + house))
+        parts = [city, ' '.join(street_words), house]
+        if rng.random() < 0.2:
+            parts = parts[1:] + parts[:1]
+        if rng.random() < 0.1:
+            parts.insert(0, 'Россия, 1{:05d}'.format(rng.randint(0, 99999)))
+        text = rng.choice((', ', ' ', ',  ')).join(parts)
+        if rng.random() < 0.2:
+            text = text.replace('ё', 'е')
+        return text
+
+    # popular addresses are queried more often
+    weights = [1 / (rank + 1) for rank in range(places)]
+    corpus = []
+    for place in rng.choices(range(places), weights=weights, k=queries):
+        corpus.append((str(place), spell(*addresses[place])))
+    return corpus
+
+
+def read_corpus(path: str) -> List[Tuple[str, str]]:
+    with open(path, encoding='utf-8') as corpus_file:
+        lines = [line.rstrip('\n') for line in corpus_file]
+    return [tuple(line.split('\t', 1)) for line in lines if '\t' in line]  # type: ignore
+
+
+def replay(name: str, key: Callable[[str], str], corpus: List[Tuple[str, str]]) -> None:
+    started = time.perf_counter()
+    keys = [key(query) for _, query in corpus]
+    elapsed = time.perf_counter() - started
+    places = {}
+    hits = 0
+    for (place, _), query_key in zip(corpus, keys):
+        if query_key in places:
+            hits += 1
+        places.setdefault(query_key, set()).add(place)
+    merged = sum(1 for key_places in places.values() if len(key_places) > 1)
+    print('{:<24} hit rate {:6.2%}  keys {:6d}  merged places keys {:4d}  {:5.2f} us/key'.format(
+        name, hits / len(corpus), len(places), merged, elapsed / len(corpus) * 1e6,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', help='file of <place id>\\t<query> lines')
+    parser.add_argument('--places', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = read_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.places, args.queries, args.seed)
+    distinct = len({place for place, _ in corpus})
+    print('{} queries of {} places, best possible hit rate {:.2%}'.format(
+        len(corpus), distinct, 1 - distinct / len(corpus),
+    ))
+    replay('raw', lambda query: query, corpus)
+    replay('case and whitespace', normalize_key_address, corpus)
+    replay('normalize_address', normalize_address, corpus)
+
+
+if __name__ == '__main__':
+    main()
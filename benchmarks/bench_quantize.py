@@ -0,0 +1,66 @@
+"""
+    Compares reverse geocoding cache hit rate and worst cell error of legacy 4 decimals rounding
+    with equal-area cells, for repeated GPS fixes of the same places at different latitudes.
+
+    python -m benchmarks.bench_quantize [--places 2000] [--fixes 20] [--noise 5] [--cell-size 8 10]
+"""
+import argparse
+import math
+import random
+
+from geo_garry.dataclasses import Coordinates
+from geo_garry.geometry import METERS_PER_DEGREE
+from geo_garry.gmaps.cache import CacheStorageAddress
+
+LATITUDES = (43.6, 55.75, 59.95, 64.5, 69.0)  # Sochi, Moscow, St. Petersburg, Arkhangelsk, Murmansk
+
+
+def distance_meters(point1: Coordinates, point2: Coordinates) -> float:
+    latitude_meters = (point1.latitude - point2.latitude) * METERS_PER_DEGREE
+    longitude_meters = (point1.longitude - point2.longitude) * METERS_PER_DEGREE * \
+        math.cos(math.radians(point1.latitude))
+    return math.hypot(latitude_meters, longitude_meters)
+
+
+def simulate(storage: CacheStorageAddress, latitude: float, args) -> str:
+    rng = random.Random(args.seed)
+    seen = set()
+    hits = queries = 0
+    worst = 0.0
+    meters_per_longitude = METERS_PER_DEGREE * math.cos(math.radians(latitude))
+    for _ in range(args.places):
+        place = Coordinates(latitude + rng.uniform(-0.05, 0.05), 37.6 + rng.uniform(-0.05, 0.05))
+        for _ in range(args.fixes):
+            fix = Coordinates(
+                place.latitude + rng.gauss(0, args.noise) / METERS_PER_DEGREE,
+                place.longitude + rng.gauss(0, args.noise) / meters_per_longitude,
+            )
+            key = storage.get_key(fix)
+            latitude_text, longitude_text = key.split(':')[1].split(',')
+            worst = max(worst, distance_meters(fix, Coordinates(float(latitude_text), float(longitude_text))))
+            queries += 1
+            if key in seen:
+                hits += 1
+            seen.add(key)
+    return 'hit rate {:6.2%}  keys {:6d}  worst error {:5.1f} m'.format(hits / queries, len(seen), worst)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--places', type=int, default=2000)
+    parser.add_argument('--fixes', type=int, default=20, help='GPS fixes per place')
+    parser.add_argument('--noise', type=float, default=5, help='GPS error sigma, meters')
+    parser.add_argument('--cell-size', type=float, nargs='+', default=[8, 10])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for latitude in LATITUDES:
+        print('latitude {}'.format(latitude))
+        print('  {:<12} {}'.format('4 decimals', simulate(CacheStorageAddress(None), latitude, args)))
+        for cell_size in args.cell_size:
+            storage = CacheStorageAddress(None, cell_size=cell_size)
+            print('  {:<12} {}'.format('{:g} m cells'.format(cell_size), simulate(storage, latitude, args)))
+
+
+if __name__ == '__main__':
+    main()
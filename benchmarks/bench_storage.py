@@ -0,0 +1,70 @@
+"""
+    Compares SqliteStorage with in-memory baseline on cache-like workload.
+
+    python -m benchmarks.bench_storage [--keys 10000] [--batch 500] [--path /tmp/geo_garry_bench.db]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from geo_garry.cache import InMemoryStorage
+from geo_garry.sqlite_storage import SqliteStorage
+
+
+def measure(name, func, operations):
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+    print('{:<32} {:>10.1f} ops/s {:>8.2f} us/op'.format(
+        name, operations / elapsed, elapsed / operations * 1e6,
+    ))
+
+
+def bench(title, storage, keys, batch):
+    print(title)
+    values = ['{:.6f},{:.6f}'.format(55 + index * 1e-5, 37 + index * 1e-5) for index in range(len(keys))]
+
+    def set_single():
+        for key, value in zip(keys, values):
+            storage.set(key, value, ex=3600)
+
+    def set_pipeline():
+        for start in range(0, len(keys), batch):
+            pipeline = storage.pipeline(transaction=False)
+            for key, value in zip(keys[start:start + batch], values[start:start + batch]):
+                pipeline.set(key, value, ex=3600)
+            pipeline.execute()
+
+    def get_single():
+        for key in keys:
+            storage.get(key)
+
+    def get_bulk():
+        for start in range(0, len(keys), batch):
+            storage.mget(keys[start:start + batch])
+
+    measure('set', set_single, len(keys))
+    measure('set pipeline x{}'.format(batch), set_pipeline, len(keys))
+    measure('get', get_single, len(keys))
+    measure('mget x{}'.format(batch), get_bulk, len(keys))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--path')
+    args = parser.parse_args()
+
+    keys = ['geo:{:.4f},{:.4f}'.format(55 + index * 1e-4, 37 + index * 1e-4) for index in range(args.keys)]
+    bench('InMemoryStorage', InMemoryStorage(), keys, args.batch)
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.path or os.path.join(directory, 'cache.db')
+        storage = SqliteStorage(path)
+        bench('SqliteStorage ({})'.format(path), storage, keys, args.batch)
+        storage.close()
+
+
+if __name__ == '__main__':
+    main()
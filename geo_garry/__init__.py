@@ -1,2 +1,2 @@
-from .dataclasses import Coordinates, CoordinatesAddress
+from .dataclasses import Coordinates, CoordinatesAddress, CoordinatesBatch
 from . import geocode, geometry, distance, gmaps
@@ -0,0 +1,64 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Sequence, TypeVar
+
+T = TypeVar('T')  # pylint: disable=invalid-name
+
+
+class RateLimiter:
+    """Thread safe limiter, spreads calls evenly to not exceed rate calls per second."""
+
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_time, now)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    chunk: List[T] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_concurrently(
+        func: Callable[[Any], Any],
+        items: Sequence[Any],
+        *,
+        workers: int,
+        rate_limiter: Optional[RateLimiter] = None,
+) -> List[Any]:
+    """
+        Calls func for every item on bounded thread pool, keeping items order.
+        Exceptions are not raised but returned in place of result, so one failed item doesn't fail others.
+    """
+    def call(item):
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            return func(item)
+        except Exception as exc:  # pylint: disable=broad-except
+            return exc
+
+    if workers <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        # context variables of caller (f.e. gmaps caller tag) are visible in workers
+        futures = [executor.submit(contextvars.copy_context().run, call, item) for item in items]
+        return [future.result() for future in futures]
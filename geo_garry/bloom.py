@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import math
+import threading
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .cache import StorageInterface, set_if_equal
+from .sketch import key_bytes
+from .snapshot import KEY_PREFIXES
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class BloomFilter:
+    """Set membership with false positives (about error_rate at capacity keys) and no false negatives."""
+
+    def __init__(self, capacity: int = 1000000, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _positions(self, key: Any) -> np.ndarray:
+        digest = hashlib.blake2b(key_bytes(key), digest_size=16).digest()
+        first, second = np.frombuffer(digest, dtype=np.uint64)
+        return (first + second * np.arange(self.hashes, dtype=np.uint64)) % np.uint64(self.size)
+
+    def add(self, key: Any) -> None:
+        positions = self._positions(key)
+        with self.lock:
+            np.bitwise_or.at(self.bits, positions // 8, (1 << (positions % 8)).astype(np.uint8))
+            self.count += 1
+
+    def __contains__(self, key: Any) -> bool:
+        positions = self._positions(key)
+        return bool(np.all(self.bits[positions // 8] & (1 << (positions % 8)).astype(np.uint8)))
+
+
+@dataclass
+class BloomStats:
+    lookups: int = 0
+    skipped: int = 0  # remote lookups saved, key is certainly absent
+    false_positives: int = 0  # filter said maybe, storage had no key
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Measured share of absent keys which were not filtered out."""
+        negatives = self.skipped + self.false_positives
+        return self.false_positives / negatives if negatives else 0.0
+
+
+class BloomGuardedStorage(StorageInterface):  # pylint: disable=too-many-instance-attributes
+    """
+        Storage wrapper skipping remote reads of keys which were never written.
+        Filter is updated by this process sets and rebuilt by scan of storage keys,
+        keys written by other processes are seen after rebuild. Keys without guarded prefixes pass through,
+        by default only cache entries are guarded, so keys written by other commands (costs counters,
+        leases) are read as is. prefixes=[''] guards all keys.
+    """
+
+    def __init__(
+            self,
+            storage: Any,
+            *,
+            capacity: int = 1000000,
+            error_rate: float = 0.01,
+            prefixes: Sequence[str] = KEY_PREFIXES,
+    ):
+        self.storage = storage
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.prefixes = tuple(prefixes)
+        self.filter = BloomFilter(capacity, error_rate)
+        self.building: Optional[BloomFilter] = None  # filter being rebuilt, gets keys set during scan
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()
+        self.stats = BloomStats()
+
+    def is_guarded(self, key: Any) -> bool:
+        return (key.decode() if isinstance(key, bytes) else key).startswith(self.prefixes)
+
+    def might_exist(self, key: Any) -> bool:
+        if not self.is_guarded(key):
+            return True
+        self.stats.lookups += 1
+        if key in self.filter:
+            return True
+        self.stats.skipped += 1
+        return False
+
+    def add_key(self, key: Any) -> None:
+        """Adds key to the filter and to the one being rebuilt, so keys set during rebuild scan are kept."""
+        with self.lock:
+            self.filter.add(key)
+            if self.building is not None:
+                self.building.add(key)
+
+    def _check_found(self, key: Any, found: bool) -> None:
+        if not found and self.is_guarded(key):
+            self.stats.false_positives += 1
+
+    def rebuild(self, scan: Optional[Callable[[], Iterable[Any]]] = None) -> int:
+        """Builds new filter from scan keys (guarded prefixes of storage by default), returns keys count."""
+        if scan is None:
+            def scan():
+                for prefix in self.prefixes:
+                    yield from self.storage.scan_iter(match=prefix + '*', count=1000)
+        with self.rebuild_lock:
+            bloom_filter = BloomFilter(self.capacity, self.error_rate)
+            with self.lock:
+                self.building = bloom_filter
+            try:
+                for key in scan():
+                    bloom_filter.add(key)
+            except BaseException:
+                with self.lock:
+                    self.building = None
+                raise
+            with self.lock:
+                self.filter, self.building = bloom_filter, None
+        logger.info('Фильтр Блума кеша перестроен', extra=dict(bloom_keys=bloom_filter.count))
+        return bloom_filter.count
+
+    def get(self, key):
+        if not self.might_exist(key):
+            return None
+        value = self.storage.get(key)
+        self._check_found(key, value is not None)
+        return value
+
+    def mget(self, keys):
+        keys = list(keys)
+        maybe = [index for index, key in enumerate(keys) if self.might_exist(key)]
+        values: List[Any] = [None] * len(keys)
+        if maybe:
+            for index, value in zip(maybe, self.storage.mget([keys[index] for index in maybe])):
+                self._check_found(keys[index], value is not None)
+                values[index] = value
+        return values
+
+    def exists(self, *keys) -> int:
+        maybe = [key for key in keys if self.might_exist(key)]
+        if not maybe:
+            return 0
+        found = self.storage.exists(*maybe)
+        if len(maybe) == 1:
+            self._check_found(maybe[0], bool(found))
+        return found
+
+    def set(self, key, value, **kwargs):
+        self.add_key(key)
+        return self.storage.set(key, value, **kwargs)
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        self.add_key(key)
+        return set_if_equal(self.storage, key, value, lock_key, token, ex=ex, px=px)
+
+    def pipeline(self, transaction=True) -> 'BloomGuardedPipeline':
+        return BloomGuardedPipeline(self, self.storage.pipeline(transaction=transaction))
+
+    def flushall(self):
+        with self.lock:
+            self.filter = BloomFilter(self.capacity, self.error_rate)
+        return self.storage.flushall()
+
+    def __getattr__(self, name: str) -> Any:
+        # pttl, scan_iter, delete and other commands go to storage as is
+        if name.startswith('_') or name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+
+class BloomGuardedPipeline:
+    """Adds keys of pipeline sets to filter, other commands are passed to storage pipeline."""
+
+    def __init__(self, storage: BloomGuardedStorage, pipeline: Any):
+        self.storage = storage
+        self.pipeline = pipeline
+
+    def set(self, key, value, **kwargs):
+        self.storage.add_key(key)
+        self.pipeline.set(key, value, **kwargs)
+        return self
+
+    def execute(self) -> list:
+        return self.pipeline.execute()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name == 'pipeline':
+            raise AttributeError(name)
+        return getattr(self.pipeline, name)
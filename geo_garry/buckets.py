@@ -0,0 +1,249 @@
+import math
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .cache import StorageInterface, set_if_equal
+
+BUCKET_PREFIXES = ('distance', 'geo')
+
+Location = Tuple[str, str]  # bucket key, field
+
+
+def as_str(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def encode_field(value: Any, expire_at: int) -> bytes:
+    """Field value is prefixed with expire unix timestamp, 0 - never expires."""
+    value = value if isinstance(value, bytes) else str(value).encode()
+    return b'%d|' % expire_at + value
+
+
+def decode_field(raw: Optional[bytes], now: float) -> Tuple[Optional[bytes], int]:
+    """Returns value (None if absent or expired) and expire timestamp."""
+    if raw is None:
+        return None, 0
+    expire_at, _, value = raw.partition(b'|')
+    expire_at = int(expire_at)
+    if expire_at and expire_at <= now:
+        return None, expire_at
+    return value, expire_at
+
+
+class BucketedStorage(StorageInterface):
+    """
+        Storage wrapper keeping '<prefix>:<latitude>,<longitude>' keys (distance: and geo: by default)
+        as fields of redis hashes, one hash per cell_size degrees spatial cell.
+        Small hashes are stored compactly by redis (hash-max-listpack-entries, 128 by default),
+        so choose cell_size to keep typical cells below that number of points.
+        Every field keeps own expire timestamp for logical TTL, reads delete expired fields they meet,
+        bucket expires ex seconds after the last write. Fields set without ex don't expire themselves,
+        but are lost with their bucket, so don't mix them with expiring keys of the same prefix.
+        Other keys are passed to storage as is.
+    """
+
+    def __init__(self, storage: Any, *, cell_size: float = 0.01, prefixes: Sequence[str] = BUCKET_PREFIXES):
+        self.storage = storage
+        self.cell_size = cell_size
+        self.prefixes = tuple(prefixes)
+
+    def cell_key(self, prefix: str, latitude: float, longitude: float) -> str:
+        return '{}:cell:{}:{}'.format(
+            prefix, math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size),
+        )
+
+    def locate(self, key: Any) -> Optional[Location]:
+        """Returns bucket key and field for bucketed key, None for other keys."""
+        prefix, _, field = as_str(key).partition(':')
+        if prefix not in self.prefixes:
+            return None
+        try:
+            latitude, longitude = map(float, field.split(','))
+        except ValueError:
+            return None
+        return self.cell_key(prefix, latitude, longitude), field
+
+    def pipeline(self, transaction=True) -> 'BucketedPipeline':
+        return BucketedPipeline(self, self.storage.pipeline(transaction=False))
+
+    def _run(self, command: str, *args, **kwargs) -> Any:
+        pipeline = self.pipeline()
+        getattr(pipeline, command)(*args, **kwargs)
+        return pipeline.execute()[0]
+
+    def get(self, key):
+        return self._run('get', key)
+
+    def set(self, key, value, ex=None, px=None, **kwargs):
+        if kwargs:
+            # conditional sets of other keys, f.e. single-flight leases
+            if self.locate(key) is not None:
+                raise TypeError('Bucketed keys support only ex and px options')
+            return self.storage.set(key, value, ex=ex, px=px, **kwargs)
+        return self._run('set', key, value, ex=ex, px=px)
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """
+            Atomic for other keys only: lease and bucket live in different keys (and shards),
+            so lease of bucketed key is checked before write by separate command.
+        """
+        if self.locate(key) is None:
+            return set_if_equal(self.storage, key, value, lock_key, token, ex=ex, px=px)
+        if self.storage.get(lock_key) != (token if isinstance(token, bytes) else str(token).encode()):
+            return False
+        self.set(key, value, ex=ex, px=px)
+        return True
+
+    def delete(self, *keys) -> int:
+        pipeline = self.pipeline()
+        for key in keys:
+            pipeline.delete(key)
+        return sum(pipeline.execute())
+
+    def exists(self, *keys) -> int:
+        pipeline = self.pipeline()
+        for key in keys:
+            pipeline.exists(key)
+        return sum(pipeline.execute())
+
+    def pttl(self, key) -> int:
+        return self._run('pttl', key)
+
+    def mget(self, keys):
+        pipeline = self.pipeline()
+        for key in keys:
+            pipeline.get(key)
+        return pipeline.execute()
+
+    def get_cell(self, prefix: str, latitude: float, longitude: float) -> Dict[str, bytes]:
+        """
+            Returns all not expired '<prefix>:<latitude>,<longitude>' keys and values of point cell
+            in one command, f.e. to prefetch neighbourhood. Expired fields are deleted.
+        """
+        bucket = self.cell_key(prefix, latitude, longitude)
+        now = time.time()
+        values = {}
+        expired = []
+        for field, raw in self.storage.hgetall(bucket).items():
+            value, _ = decode_field(raw, now)
+            if value is None:
+                expired.append(field)
+            else:
+                values['{}:{}'.format(prefix, as_str(field))] = value
+        if expired:
+            self.storage.hdel(bucket, *expired)
+        return values
+
+    def delete_fields(self, locations: Sequence[Location]) -> None:
+        """Deletes fields in one round trip, one HDEL per bucket."""
+        fields: Dict[str, List[str]] = {}
+        for bucket, field in locations:
+            fields.setdefault(bucket, []).append(field)
+        pipeline = self.storage.pipeline(transaction=False)
+        for bucket, bucket_fields in fields.items():
+            pipeline.hdel(bucket, *bucket_fields)
+        pipeline.execute()
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[str]:
+        """Yields keys of bucketed prefixes as if they were stored separately, supports 'prefix*' patterns."""
+        pattern = (match or '').rstrip('*')
+        for prefix in self.prefixes:
+            if not (prefix + ':').startswith(pattern) and not pattern.startswith(prefix + ':'):
+                continue
+            for bucket in self.storage.scan_iter(match='{}:cell:*'.format(prefix), count=count):
+                for key in self.get_cell(prefix, *self._cell_point(bucket)):
+                    if key.startswith(pattern):
+                        yield key
+        for key in self.storage.scan_iter(match=match, count=count):
+            if self.locate(key) is None and ':cell:' not in as_str(key):
+                yield key
+
+    def _cell_point(self, bucket: Any) -> Tuple[float, float]:
+        """Returns point inside bucket cell."""
+        _, _, row, column = as_str(bucket).split(':')
+        return (int(row) + 0.5) * self.cell_size, (int(column) + 0.5) * self.cell_size
+
+    def flushall(self):
+        return self.storage.flushall()
+
+
+class BucketedPipeline:
+    """
+        Translates key commands of bucketed keys to hash commands, results are decoded on execute.
+        Expired fields met by reads are deleted after execute.
+    """
+
+    def __init__(self, storage: BucketedStorage, pipeline: Any):
+        self.storage = storage
+        self.pipeline = pipeline
+        self.decoders: List[Tuple[int, Callable[[list, float], Any]]] = []  # results count, decoder
+        self.expired: List[Location] = []
+
+    def set(self, key, value, ex=None, px=None):
+        location = self.storage.locate(key)
+        if location is None:
+            self.pipeline.set(key, value, ex=ex, px=px)
+            self.decoders.append((1, lambda results, now: results[0]))
+            return self
+        if px:
+            ex = math.ceil(px / 1000)
+        bucket, field = location
+        self.pipeline.hset(bucket, field, encode_field(value, int(time.time() + ex) if ex else 0))
+        if ex:
+            self.pipeline.expire(bucket, int(ex))
+        self.decoders.append((2 if ex else 1, lambda results, now: True))
+        return self
+
+    def _hget(
+            self, key, decode: Callable[[Optional[bytes], int, float], Any], command: str,
+    ) -> 'BucketedPipeline':
+        location = self.storage.locate(key)
+        if location is None:
+            getattr(self.pipeline, command)(key)
+            self.decoders.append((1, lambda results, now: results[0]))
+        else:
+            self.pipeline.hget(*location)
+
+            def decode_hget(results: list, now: float) -> Any:
+                value, expire_at = decode_field(results[0], now)
+                if value is None and expire_at:
+                    self.expired.append(location)
+                return decode(value, expire_at, now)
+            self.decoders.append((1, decode_hget))
+        return self
+
+    def get(self, key):
+        return self._hget(key, lambda value, expire_at, now: value, 'get')
+
+    def delete(self, key):
+        location = self.storage.locate(key)
+        if location is None:
+            self.pipeline.delete(key)
+        else:
+            self.pipeline.hdel(*location)
+        self.decoders.append((1, lambda results, now: results[0]))
+        return self
+
+    def exists(self, key):
+        return self._hget(key, lambda value, expire_at, now: int(value is not None), 'exists')
+
+    def pttl(self, key):
+        def decode(value, expire_at, now):
+            if value is None:
+                return -2
+            return int((expire_at - now) * 1000) if expire_at else -1
+        return self._hget(key, decode, 'pttl')
+
+    def execute(self) -> list:
+        results = self.pipeline.execute()
+        now = time.time()
+        decoded = []
+        position = 0
+        for count, decode in self.decoders:
+            decoded.append(decode(results[position:position + count], now))
+            position += count
+        self.decoders = []
+        if self.expired:
+            self.storage.delete_fields(self.expired)
+            self.expired = []
+        return decoded
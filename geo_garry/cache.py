@@ -1,5 +1,11 @@
-from typing import Any, Optional, Type
+from typing import (
+    Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type,
+)
 import logging
+import threading
+import time
+
+from .batch import RateLimiter, chunked, run_concurrently
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
@@ -12,6 +18,56 @@ class CacheValueNotFound(Exception):
     pass
 
 
+MISSING = object()  # marks bulk lookup misses, None is valid cached value for null storages
+NULL_VALUE = b'\x00'  # empty result marker of null storages, see CacheNullStorageAbstract
+
+
+# deletes KEYS[1] only if it holds ARGV[1]
+DELETE_IF_EQUAL_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+)
+# sets KEYS[1] to ARGV[1] (expiring in ARGV[3] milliseconds if set) only if KEYS[2] holds ARGV[2]
+SET_IF_EQUAL_SCRIPT = (
+    "if redis.call('get', KEYS[2]) ~= ARGV[2] then return 0 end "
+    "if ARGV[3] == '' then redis.call('set', KEYS[1], ARGV[1]) "
+    "else redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[3]) end return 1"
+)
+
+
+def set_if_equal(storage: Any, key, value, lock_key, token, ex=None, px=None) -> bool:
+    """
+        Sets key only if lock_key holds token (f.e. lease of its owner), returns if key was set.
+        Check and write are atomic with set_if_equal of storage (InMemoryStorage, SqliteStorage, wrappers)
+        or EVAL (redis, keys should share node). Other storages check and write by separate commands.
+    """
+    method = getattr(storage, 'set_if_equal', None)
+    if method is not None:
+        return bool(method(key, value, lock_key, token, ex=ex, px=px))
+    if hasattr(storage, 'eval'):
+        px = px or (int(ex * 1000) if ex else None)
+        return bool(storage.eval(SET_IF_EQUAL_SCRIPT, 2, key, lock_key, value, token, px or ''))
+    token = token if isinstance(token, bytes) else str(token).encode()
+    if storage.get(lock_key) != token:
+        return False
+    storage.set(key, value, **{name: ttl for name, ttl in (('ex', ex), ('px', px)) if ttl is not None})
+    return True
+
+
+def delete_if_equal(storage: Any, key, value) -> int:
+    """
+        Deletes key only if it holds value (f.e. lease of its owner), returns deleted keys count.
+        Atomic with delete_if_equal of storage or EVAL (redis), other storages use GET and DELETE.
+    """
+    method = getattr(storage, 'delete_if_equal', None)
+    if method is not None:
+        return method(key, value)
+    if hasattr(storage, 'eval'):
+        return storage.eval(DELETE_IF_EQUAL_SCRIPT, 1, key, value)
+    if storage.get(key) != (value if isinstance(value, bytes) else str(value).encode()):
+        return 0
+    return storage.delete(key)  # key may expire and be set again between the commands
+
+
 class StorageInterface:
     def get(self, key):
         pass
@@ -22,6 +78,251 @@ class StorageInterface:
     def flushall(self):
         pass
 
+    # Bulk operations used by batch APIs (redis.StrictRedis has them), defaults run single key commands
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return CommandPipeline(self, transaction)
+
+
+class CommandPipeline:
+    """
+        Collects commands like redis pipeline and runs them on execute.
+        Consecutive sets are written with one storage.set_many((key, value, ex, px)) call
+        if storage has it, by single sets otherwise.
+        With transaction commands run inside storage.atomic() context if storage has it,
+        so other clients don't see partial results, as redis MULTI/EXEC does.
+    """
+
+    def __init__(self, storage: Any, transaction: bool = False):
+        self.storage = storage
+        self.transaction = transaction
+        self.commands: List[Tuple[str, tuple]] = []
+
+    def set(self, key, value, ex=None, px=None):
+        self.commands.append(('set', (key, value, ex, px)))
+        return self
+
+    def get(self, key):
+        self.commands.append(('get', (key,)))
+        return self
+
+    def exists(self, key):
+        self.commands.append(('exists', (key,)))
+        return self
+
+    def pttl(self, key):
+        self.commands.append(('pttl', (key,)))
+        return self
+
+    def delete(self, *keys):
+        self.commands.append(('delete', keys))
+        return self
+
+    def incrbyfloat(self, key, amount):
+        self.commands.append(('incrbyfloat', (key, amount)))
+        return self
+
+    def expire(self, key, seconds):
+        self.commands.append(('expire', (key, seconds)))
+        return self
+
+    def hget(self, key, field):
+        self.commands.append(('hget', (key, field)))
+        return self
+
+    def hset(self, key, field, value):
+        self.commands.append(('hset', (key, field, value)))
+        return self
+
+    def hgetall(self, key):
+        self.commands.append(('hgetall', (key,)))
+        return self
+
+    def hdel(self, key, *fields):
+        self.commands.append(('hdel', (key, *fields)))
+        return self
+
+    def execute(self) -> list:
+        atomic = getattr(self.storage, 'atomic', None)
+        if self.transaction and atomic is not None:
+            with atomic():
+                return self._execute()
+        return self._execute()
+
+    def _execute(self) -> list:
+        results: list = []
+        pending_sets: list = []
+        for name, args in self.commands:
+            if name == 'set':
+                pending_sets.append(args)
+                results.append(True)
+                continue
+            if pending_sets:
+                self._set_many(pending_sets)
+                pending_sets = []
+            results.append(getattr(self.storage, name)(*args))
+        if pending_sets:
+            self._set_many(pending_sets)
+        self.commands = []
+        return results
+
+    def _set_many(self, items: list) -> None:
+        if hasattr(self.storage, 'set_many'):
+            self.storage.set_many(items)
+            return
+        for key, value, ex, px in items:
+            expire = {name: ttl for name, ttl in (('ex', ex), ('px', px)) if ttl is not None}
+            self.storage.set(key, value, **expire)
+
+
+class InMemoryStorage(StorageInterface):
+    """Thread safe process local StorageInterface with TTL, for tests and as benchmarks baseline."""
+
+    def __init__(self):
+        self.data: Dict[str, Tuple[Any, Optional[float]]] = {}  # key -> (bytes or hash dict, expire_at)
+        self.lock = threading.RLock()  # reentrant for commands of atomic pipeline
+
+    @staticmethod
+    def _key(key) -> str:
+        return key.decode() if isinstance(key, bytes) else key
+
+    def _get(self, key, now: float) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self.data.get(self._key(key))
+        if item is None or (item[1] is not None and item[1] <= now):
+            return None
+        return item
+
+    def get(self, key):
+        item = self._get(key, time.time())
+        return item[0] if item else None
+
+    def mget(self, keys):
+        now = time.time()
+        with self.lock:
+            items = [self._get(key, now) for key in keys]
+        return [item[0] if item else None for item in items]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        """With nx sets only absent key, returns None if key exists, as redis does."""
+        if not nx:
+            self.set_many([(key, value, ex, px)])
+            return True
+        now = time.time()
+        with self.lock:
+            if self._get(key, now) is not None:
+                return None
+            self._store(key, value, ex, px, now)
+        return True
+
+    def _store(self, key, value, ex, px, now: float) -> None:
+        expire_at = now + ex if ex else (now + px / 1000 if px else None)
+        value = value if isinstance(value, bytes) else str(value).encode()
+        self.data[self._key(key)] = (value, expire_at)
+
+    def set_many(self, items: Sequence[Tuple[Any, Any, Optional[float], Optional[float]]]) -> None:
+        now = time.time()
+        with self.lock:
+            for key, value, ex, px in items:
+                self._store(key, value, ex, px, now)
+
+    def exists(self, *keys) -> int:
+        now = time.time()
+        return sum(self._get(key, now) is not None for key in keys)
+
+    def delete(self, *keys) -> int:
+        with self.lock:
+            return sum(self.data.pop(self._key(key), None) is not None for key in keys)
+
+    def incrbyfloat(self, key, amount) -> float:
+        """Adds amount to float value of key (0 if absent) keeping its expiry, as redis does."""
+        with self.lock:
+            item = self._get(key, time.time())
+            value = (float(item[0]) if item else 0.0) + amount
+            self.data[self._key(key)] = (repr(value).encode(), item[1] if item else None)
+            return value
+
+    def delete_if_equal(self, key, value) -> int:
+        """Atomically deletes key if it holds value, f.e. lease of its owner."""
+        value = value if isinstance(value, bytes) else str(value).encode()
+        with self.lock:
+            item = self._get(key, time.time())
+            if item is None or item[0] != value:
+                return 0
+            del self.data[self._key(key)]
+            return 1
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """Atomically sets key if lock_key holds token, see set_if_equal."""
+        token = token if isinstance(token, bytes) else str(token).encode()
+        now = time.time()
+        with self.lock:
+            item = self._get(lock_key, now)
+            if item is None or item[0] != token:
+                return False
+            self._store(key, value, ex, px, now)
+            return True
+
+    def pttl(self, key) -> int:
+        now = time.time()
+        item = self._get(key, now)
+        if item is None:
+            return -2
+        return -1 if item[1] is None else int((item[1] - now) * 1000)
+
+    def expire(self, key, seconds) -> bool:
+        with self.lock:
+            item = self._get(key, time.time())
+            if item is None:
+                return False
+            self.data[self._key(key)] = (item[0], time.time() + seconds)
+            return True
+
+    def hget(self, key, field) -> Optional[bytes]:
+        item = self._get(key, time.time())
+        return item[0].get(self._key(field)) if item else None
+
+    def hgetall(self, key) -> Dict[bytes, bytes]:
+        item = self._get(key, time.time())
+        return {field.encode(): value for field, value in item[0].items()} if item else {}
+
+    def hset(self, key, field, value) -> int:
+        with self.lock:
+            item = self._get(key, time.time()) or ({}, None)
+            field = self._key(field)
+            created = field not in item[0]
+            item[0][field] = value if isinstance(value, bytes) else str(value).encode()
+            self.data[self._key(key)] = item
+            return int(created)
+
+    def hdel(self, key, *fields) -> int:
+        with self.lock:
+            item = self._get(key, time.time())
+            if item is None:
+                return 0
+            return sum(item[0].pop(self._key(field), None) is not None for field in fields)
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[str]:
+        """Supports 'prefix*' patterns only."""
+        prefix = (match or '').rstrip('*')
+        now = time.time()
+        with self.lock:
+            keys = [key for key in self.data if key.startswith(prefix)]
+        return (key for key in keys if self._get(key, now) is not None)
+
+    def atomic(self) -> ContextManager:
+        """Other threads wait until commands inside the context are done."""
+        return self.lock
+
+    def pipeline(self, transaction=True) -> CommandPipeline:
+        return CommandPipeline(self, transaction)
+
+    def flushall(self):
+        with self.lock:
+            self.data.clear()
+
 
 class CacheStorageAbstract:
     expire_time = 60 * 60 * 24 * 30  # 30 days
@@ -44,29 +345,87 @@ class CacheStorageAbstract:
         value = self.cache_storage.get(key)
         if not value:
             return None
+        return self.load_value(value)
+
+    def load_value(self, value: bytes) -> Any:
+        """Deserializes stored value, storages may keep it in envelope."""
         return self.deserialize_value(value)
 
+    def encode_value(self, instance: Any, value: Any) -> str:
+        """Serializes value stored for instance, storages may add instance data to it."""
+        return self.serialize_value(value)
+
     def set(self, instance: Any, value: Any) -> None:
         key = self.get_key(instance)
-        self.cache_storage.set(key, self.serialize_value(value), ex=self.expire_time)
+        self.cache_storage.set(key, self.encode_value(instance, value), ex=self.expire_time)
+
+    def is_bulk_hit(self, value: Optional[bytes]) -> bool:
+        return bool(value)
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Reads keys in one MGET if storage supports it."""
+        mget = getattr(self.cache_storage, 'mget', None)
+        return mget(keys) if mget and keys else [self.cache_storage.get(key) for key in keys]
+
+    def get_many(self, instances: Sequence[Any]) -> List[Any]:
+        """Returns values for instances in one MGET if storage supports it, MISSING for not found."""
+        values = self.mget([self.get_key(instance) for instance in instances])
+        return [
+            self.load_value(value) if self.is_bulk_hit(value) else MISSING
+            for value in values
+        ]
+
+    def set_many(self, items: Sequence[Tuple[Any, Any]]) -> None:
+        """Sets (instance, value) pairs in one pipeline if storage supports it."""
+        pipeline_factory = getattr(self.cache_storage, 'pipeline', None)
+        storage = pipeline_factory(transaction=False) if pipeline_factory else self.cache_storage
+        for instance, value in items:
+            storage.set(self.get_key(instance), self.encode_value(instance, value), ex=self.expire_time)
+        if pipeline_factory:
+            storage.execute()
 
 
 class CacheNullStorageAbstract(CacheStorageAbstract):  # pylint: disable=abstract-method
+    """
+        Caches empty results too. One GET tells value (hit), empty value or NULL_VALUE
+        (cached empty result) and None (miss) apart.
+        Empty result is written as empty value, which older versions read, until write_null_value
+        is switched on in the next release. Both markers are read.
+    """
     allow_empty = True
+    write_null_value = False
 
     def get(self, instance: Any) -> Optional[Any]:
-        key = self.get_key(instance)
-        value = self.cache_storage.get(key)
-        if not value and not self.cache_storage.exists(key):
+        value = self.cache_storage.get(self.get_key(instance))
+        if value is None:
             raise CacheValueNotFound()
-        return self.deserialize_value(value)
+        return self.load_value(value)
+
+    def load_value(self, value: bytes) -> Any:
+        return self.deserialize_value(b'' if value == NULL_VALUE else value)
+
+    def encode_value(self, instance: Any, value: Any) -> str:
+        return self.serialize_value(value) or (NULL_VALUE.decode() if self.write_null_value else '')
+
+    def is_bulk_hit(self, value: Optional[bytes]) -> bool:
+        # MGET returns None for absent keys
+        return value is not None
 
 
 class CacheableServiceAbstract:
+    batch_size = 1000  # keys per bulk cache lookup and write
+    batch_workers = 8  # concurrent refresh_value calls in batch
+    batch_qps: Optional[float] = None  # refresh_value calls per second limit in batch
+    fallback_errors: Tuple[Type[Exception], ...] = ()  # provider is skipped, f.e. its budget is spent
+
     def __init__(self, **kwargs):
         self.cache_storage: StorageInterface = kwargs.pop('storage')
         if not self.cache_storage:
             raise CacheStorageNotFound()
+        self.storage_options: Dict[str, Any] = kwargs.pop('storage_options', None) or {}
+        self.access_trackers: List[Callable[[Any], None]] = []  # called with every requested key
+        self._storage: Optional[CacheStorageAbstract] = None
+        self.single_flight: Any = None  # SingleFlight refreshing misses of get, see singleflight.py
         super().__init__(**kwargs)
 
     storage_class: Type[CacheStorageAbstract]
@@ -74,20 +433,166 @@ class CacheableServiceAbstract:
     def refresh_value(self, key: Any) -> Any:
         raise NotImplementedError
 
+    def make_storage(self) -> CacheStorageAbstract:
+        return self.storage_class(self.cache_storage, **self.storage_options)
+
+    @property
+    def storage(self) -> CacheStorageAbstract:
+        """Storage instance shared by get and get_many calls."""
+        if self._storage is None:
+            self._storage = self.make_storage()
+        return self._storage
+
+    def track_access(self, key: Any) -> None:
+        for tracker in self.access_trackers:
+            tracker(key)
+
     def get(self, key: Any) -> Any:
-        storage = self.storage_class(self.cache_storage)
+        self.track_access(key)
+        storage = self.storage
+        cached_value = self.get_cached(storage, key)
+        if cached_value is not MISSING:
+            logger.info(
+                'Получено значение из кеша',
+                extra=dict(cache_key=key, cache_value=cached_value)
+            )
+            return cached_value
+        return self.refresh_and_save(storage, key)
+
+    @staticmethod
+    def get_cached(storage: CacheStorageAbstract, key: Any) -> Any:
+        """Cached value of key, MISSING on miss."""
         try:
             cached_value = storage.get(key)
         except CacheValueNotFound:
-            pass
-        else:
-            if cached_value or (not cached_value and storage.allow_empty):
-                logger.info(
-                    'Получено значение из кеша',
-                    extra=dict(cache_key=key, cache_value=cached_value)
-                )
-                return cached_value
+            return MISSING
+        if cached_value or storage.allow_empty:
+            return cached_value
+        return MISSING
 
-        refreshed_value = self.refresh_value(key)
-        storage.set(key, refreshed_value)
+    def refresh_and_save(self, storage: CacheStorageAbstract, key: Any) -> Any:
+        try:
+            if self.single_flight is not None:
+                return self.single_flight.refresh(self, storage, key)
+            refreshed_value = self.refresh_value(key)
+        except self.fallback_errors:
+            return self.fallback_value(key)
+        self.save_value(storage, key, refreshed_value)
         return refreshed_value
+
+    def fallback_value(self, key: Any) -> Any:
+        """
+            Value of missed key when refresh_value raises one of fallback_errors, it is not cached.
+            Services with fallback_errors define it.
+        """
+        raise NotImplementedError
+
+    # Fallbacks of deadline-aware get, see deadline.get_within
+
+    def get_stale(self, key: Any) -> Any:
+        """Expired value of key if cache storage keeps stale copies (StaleCopyStorage), MISSING otherwise."""
+        stale_view = getattr(self.cache_storage, 'stale_view', None)
+        if not callable(stale_view):
+            return MISSING
+        return self.get_cached(self.storage_class(stale_view(), **self.storage_options), key)
+
+    def nearby_keys(self, key: Any) -> List[Any]:
+        """Keys whose values are acceptable approximation of key value."""
+        return []
+
+    def get_nearby(self, key: Any) -> Any:
+        """The first cached non empty value of nearby keys, MISSING if there is none."""
+        keys = self.nearby_keys(key)
+        for value in self.storage.get_many(keys) if keys else []:
+            if value is not MISSING and value:
+                return value
+        return MISSING
+
+    def estimate_value(self, key: Any) -> Any:
+        """Cheap local approximation of key value, MISSING if service can't estimate it."""
+        return MISSING
+
+    def save_value(self, storage: CacheStorageAbstract, key: Any, value: Any) -> None:
+        """Caches refreshed value, services writing more cache entries per refresh override it."""
+        storage.set(key, value)
+
+    def save_values(self, storage: CacheStorageAbstract, items: Sequence[Tuple[Any, Any]]) -> None:
+        """Caches refreshed (key, value) pairs of batch."""
+        storage.set_many(items)
+
+    def get_many(
+            self,
+            keys: Iterable[Any],
+            *,
+            workers: Optional[int] = None,
+            qps: Optional[float] = None,
+            return_exceptions: bool = False,
+    ) -> List[Any]:
+        """
+            Batch version of get, returns values in keys order.
+            Keys are grouped by cache key (f.e. coordinates rounded to the same cell), each group is
+            looked up once and only its first key is refreshed on miss, value is shared by the group.
+            Cache is read and written in bulk, misses are refreshed concurrently
+            on bounded pool limited by qps.
+            Failed refresh doesn't fail batch: its value is None (or exception if return_exceptions)
+            and is not cached.
+        """
+        keys = list(keys)
+        if self.access_trackers:
+            for key in keys:
+                self.track_access(key)
+        storage = self.storage
+        rate_limiter = RateLimiter(qps or self.batch_qps)
+        cache_keys = [storage.get_key(key) for key in keys]
+        groups: Dict[str, Any] = {}
+        for cache_key, key in zip(cache_keys, keys):
+            groups.setdefault(cache_key, key)
+
+        values = {}
+        for chunk in chunked(groups.items(), self.batch_size):
+            values.update(self._get_chunk(
+                storage, chunk, workers=workers or self.batch_workers, rate_limiter=rate_limiter,
+            ))
+
+        results = []
+        for cache_key in cache_keys:
+            value = values[cache_key]
+            if isinstance(value, Exception) and not return_exceptions:
+                value = None
+            results.append(value)
+        return results
+
+    def _get_chunk(
+            self,
+            storage: CacheStorageAbstract,
+            groups: List[Tuple[str, Any]],
+            *,
+            workers: int,
+            rate_limiter: RateLimiter,
+    ) -> Dict[str, Any]:
+        cache_keys = [cache_key for cache_key, _ in groups]
+        values = dict(zip(cache_keys, storage.get_many([key for _, key in groups])))
+        misses = [(cache_key, key) for cache_key, key in groups if values[cache_key] is MISSING]
+        logger.info(
+            'Получены значения из кеша пакетом',
+            extra=dict(cache_keys_count=len(groups), cache_misses_count=len(misses))
+        )
+
+        refreshed = run_concurrently(
+            self.refresh_value, [key for _, key in misses], workers=workers, rate_limiter=rate_limiter,
+        )
+        to_cache = []
+        for (cache_key, key), value in zip(misses, refreshed):
+            if isinstance(value, self.fallback_errors):
+                value = self.fallback_value(key)
+            elif isinstance(value, Exception):
+                logger.warning(
+                    'Не удалось обновить значение кеша',
+                    extra=dict(cache_key=key, error=repr(value))
+                )
+            else:
+                to_cache.append((key, value))
+            values[cache_key] = value
+        if to_cache:
+            self.save_values(storage, to_cache)
+        return values
@@ -0,0 +1,437 @@
+import argparse
+import contextlib
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+from urllib.parse import urlsplit
+
+from .batch import RateLimiter, chunked, run_concurrently
+from .dataclasses import Coordinates
+from .snapshot import KEY_PREFIXES, export_snapshot, import_snapshot
+from .sqlite_storage import SqliteStorage
+
+OPERATIONS = ('geocode', 'reverse', 'federal_code', 'mkad', 'kad')
+OUTPUT_FIELDS = {
+    'geocode': ['geo_latitude', 'geo_longitude'],
+    'reverse': ['geo_address'],
+    'federal_code': ['geo_federal_code'],
+    'mkad': ['mkad_distance'],
+    'kad': ['kad_distance'],
+}
+ERROR_FIELD = 'geo_error'
+
+
+def make_gmaps_client(key: str):
+    import googlemaps  # pylint: disable=import-outside-toplevel
+    return googlemaps.Client(key=key)
+
+
+def make_storage(url: str):
+    """Creates cache storage by url: redis://host:port/db or sqlite:///relative.db, sqlite:////absolute.db"""
+    parsed = urlsplit(url)
+    if parsed.scheme in ('redis', 'rediss', 'unix'):
+        import redis  # pylint: disable=import-outside-toplevel
+        return redis.StrictRedis.from_url(url)
+    if parsed.scheme == 'sqlite' and not parsed.netloc and len(parsed.path) > 1:
+        return SqliteStorage(parsed.path[1:], compaction_interval=60)
+    raise ValueError('Unsupported cache storage url: {}'.format(url))
+
+
+@contextlib.contextmanager
+def open_storage(url: str) -> Iterator[Any]:
+    """make_storage closing storage (and its background threads) on exit."""
+    storage = make_storage(url)
+    try:
+        yield storage
+    finally:
+        close = getattr(storage, 'close', None)
+        if close:
+            close()
+
+
+def detect_format(path: str, fmt: Optional[str]) -> str:
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_csv_header(path: str) -> List[str]:
+    with open(path, newline='', encoding='utf-8') as stream:
+        return next(csv.reader(stream), [])
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+class RecordWriter:
+    """Writes jsonl records as is, csv records with fieldnames columns, in the same order in every run."""
+
+    def __init__(self, stream: TextIO, fmt: str, fieldnames: List[str], write_header: bool):
+        self.stream = stream
+        self.fmt = fmt
+        self.fieldnames = fieldnames
+        self.write_header = write_header
+        self.csv_writer: Optional[csv.DictWriter] = None
+
+    def write(self, records: Iterable[Dict[str, Any]]) -> None:
+        for record in records:
+            if self.fmt == 'jsonl':
+                self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+                continue
+            if not self.csv_writer:
+                self.csv_writer = csv.DictWriter(
+                    self.stream, fieldnames=self.fieldnames, extrasaction='ignore', lineterminator='\n',
+                )
+                if self.write_header:
+                    self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+
+
+class Pipeline:  # pylint: disable=too-many-instance-attributes
+    """Runs operations on chunk of records with batch APIs, adds results and errors to records."""
+
+    def __init__(
+            self,
+            operations: Iterable[str],
+            *,
+            geocoder=None,
+            mkad_calculator=None,
+            kad_calculator=None,
+            workers: int = 8,
+            qps: Optional[float] = None,
+            address_field: str = 'address',
+            latitude_field: str = 'latitude',
+            longitude_field: str = 'longitude',
+    ):
+        self.operations = list(operations)
+        unknown = set(self.operations) - set(OPERATIONS)
+        if unknown:
+            raise ValueError('Unknown operations: {}'.format(', '.join(sorted(unknown))))
+        self.geocoder = geocoder
+        self.calculators = {'mkad': mkad_calculator, 'kad': kad_calculator}
+        self.workers = workers
+        self.rate_limiter = RateLimiter(qps)
+        self.qps = qps
+        self.address_field = address_field
+        self.latitude_field = latitude_field
+        self.longitude_field = longitude_field
+
+    @property
+    def fields(self) -> List[str]:
+        return [field for operation in self.operations for field in OUTPUT_FIELDS[operation]] + [ERROR_FIELD]
+
+    def get_coordinates(self, record: Dict[str, Any]) -> Optional[Coordinates]:
+        """Returns record coordinates, or geocoded ones if record has no coordinates."""
+        for latitude_field, longitude_field in [
+                (self.latitude_field, self.longitude_field),
+                ('geo_latitude', 'geo_longitude'),
+        ]:
+            try:
+                return Coordinates(float(record[latitude_field]), float(record[longitude_field]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return None
+
+    def geocode(self, records: List[Dict[str, Any]], errors: List[List[str]]) -> None:
+        """Adds coordinates of records addresses, records with empty address get an error."""
+        addresses = [str(record.get(self.address_field) or '') for record in records]
+        with_address = [index for index, address in enumerate(addresses) if address.strip()]
+        coordinates = dict(zip(with_address, self.geocoder.get_coordinates_many(
+            [addresses[index] for index in with_address],
+            workers=self.workers, qps=self.qps, return_exceptions=True,
+        )))
+        for index, record in enumerate(records):
+            value = coordinates.get(index)
+            if index not in coordinates:
+                errors[index].append('geocode: empty address')
+            elif isinstance(value, Exception):
+                errors[index].append('geocode: {!r}'.format(value))
+                value = None
+            record['geo_latitude'] = value.latitude if value else None
+            record['geo_longitude'] = value.longitude if value else None
+
+    def process(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        errors: List[List[str]] = [[] for _ in records]
+
+        def collect(values: List[Any], operation: str, indexes: Optional[List[int]] = None) -> List[Any]:
+            result = []
+            for index, value in zip(range(len(values)) if indexes is None else indexes, values):
+                if isinstance(value, Exception):
+                    errors[index].append('{}: {!r}'.format(operation, value))
+                    value = None
+                result.append(value)
+            return result
+
+        if 'geocode' in self.operations:
+            self.geocode(records, errors)
+
+        points = [self.get_coordinates(record) for record in records]
+        located = [index for index, point in enumerate(points) if point]
+        for index, point in enumerate(points):
+            if not point and set(self.operations) - {'geocode'}:
+                errors[index].append('no coordinates')
+
+        if {'reverse', 'federal_code'} & set(self.operations):
+            addresses = collect(self.geocoder.reverse_geocode_service.get_many(
+                [points[index] for index in located],
+                workers=self.workers, qps=self.qps, return_exceptions=True,
+            ), 'reverse', located)
+            for index, value in zip(located, addresses):
+                if 'reverse' in self.operations:
+                    records[index]['geo_address'] = value.address if value else None
+                if 'federal_code' in self.operations:
+                    records[index]['geo_federal_code'] = value.federal_code if value else None
+
+        for operation in ('mkad', 'kad'):
+            if operation not in self.operations:
+                continue
+            distances = collect(run_concurrently(
+                self.calculators[operation].get_distance,
+                [points[index] for index in located],
+                workers=self.workers,
+                rate_limiter=self.rate_limiter,
+            ), operation, located)
+            for index, value in zip(located, distances):
+                records[index][operation + '_distance'] = value
+
+        for record, record_errors in zip(records, errors):
+            record[ERROR_FIELD] = '; '.join(record_errors) or None
+        return records
+
+
+class Checkpoint:
+    """Count of processed input records and output size, saved atomically after every chunk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self.output_offset = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as checkpoint_file:
+            data = json.load(checkpoint_file)
+        self.records, self.output_offset = data['records'], data['output_offset']
+        return True
+
+    def save(self) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as checkpoint_file:
+            json.dump({'records': self.records, 'output_offset': self.output_offset}, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def run(
+        pipeline: Pipeline,
+        input_path: str,
+        output_path: str,
+        *,
+        fmt: Optional[str] = None,
+        chunk_size: int = 500,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = False,
+        progress: Optional[TextIO] = sys.stderr,
+) -> int:
+    """
+        Processes input file by chunks, returns number of processed records.
+        After every chunk output is flushed and checkpoint saved, so after crash
+        run with resume skips processed records and drops partially written output.
+    """
+    fmt = detect_format(input_path, fmt)
+    checkpoint = Checkpoint(checkpoint_path or output_path + '.checkpoint')
+    if not (resume and checkpoint.load()):
+        checkpoint = Checkpoint(checkpoint.path)
+
+    if checkpoint.output_offset and os.path.exists(output_path):
+        with open(output_path, 'r+b') as output_file:
+            output_file.truncate(checkpoint.output_offset)
+    mode = 'a' if checkpoint.output_offset else 'w'
+    fieldnames: List[str] = []
+    if fmt == 'csv' and checkpoint.output_offset:
+        fieldnames = read_csv_header(output_path)  # appended rows follow header of written part
+    elif fmt == 'csv':
+        fieldnames = read_csv_header(input_path)
+        fieldnames += [field for field in pipeline.fields if field not in fieldnames]
+
+    started_at = time.monotonic()
+    processed = 0
+    with open(input_path, newline='', encoding='utf-8') as input_stream, \
+            open(output_path, mode, newline='', encoding='utf-8') as output_stream:
+        writer = RecordWriter(output_stream, fmt, fieldnames, write_header=not checkpoint.output_offset)
+        records = read_records(input_stream, fmt)
+        for _ in range(checkpoint.records):
+            next(records, None)
+
+        for chunk in chunked(records, chunk_size):
+            writer.write(pipeline.process(chunk))
+            output_stream.flush()
+            os.fsync(output_stream.fileno())
+            processed += len(chunk)
+            checkpoint.records += len(chunk)
+            checkpoint.output_offset = output_stream.tell()
+            checkpoint.save()
+            if progress:
+                elapsed = time.monotonic() - started_at
+                progress.write('processed {} records ({} total), {:.1f} records/s\n'.format(
+                    processed, checkpoint.records, processed / elapsed if elapsed else 0,
+                ))
+    return processed
+
+
+def command_process(args: argparse.Namespace) -> None:
+    from .geocode import GoogleGeocoder  # pylint: disable=import-outside-toplevel
+    from .distance import (  # pylint: disable=import-outside-toplevel
+        KadDistanceCalculator, MkadDistanceCalculator,
+    )
+
+    with open_storage(args.cache) as storage:
+        gmaps_client = make_gmaps_client(args.google_key)
+        operations = args.operations.split(',')
+        pipeline = Pipeline(
+            operations,
+            geocoder=GoogleGeocoder(storage=storage, gmaps_client=gmaps_client),
+            mkad_calculator=MkadDistanceCalculator(storage, gmaps_client) if 'mkad' in operations else None,
+            kad_calculator=KadDistanceCalculator(storage, gmaps_client) if 'kad' in operations else None,
+            workers=args.workers,
+            qps=args.qps,
+            address_field=args.address_field,
+            latitude_field=args.latitude_field,
+            longitude_field=args.longitude_field,
+        )
+        run(
+            pipeline,
+            args.input,
+            args.output,
+            fmt=args.format,
+            chunk_size=args.chunk_size,
+            checkpoint_path=args.checkpoint,
+            resume=args.resume,
+        )
+
+
+def command_warmup(args: argparse.Namespace) -> None:
+    from .geocode import GoogleGeocoder  # pylint: disable=import-outside-toplevel
+    from .distance import (  # pylint: disable=import-outside-toplevel
+        KadDistanceCalculator, MkadDistanceCalculator,
+    )
+    from .warmup import CacheWarmer, count_queries, iter_grid  # pylint: disable=import-outside-toplevel
+
+    with open_storage(args.cache) as storage:
+        gmaps_client = make_gmaps_client(args.google_key)
+        operations = args.operations.split(',')
+        geocoder = GoogleGeocoder(storage=storage, gmaps_client=gmaps_client)
+        calculators = []
+        if 'mkad' in operations:
+            calculators.append(MkadDistanceCalculator(storage, gmaps_client))
+        if 'kad' in operations:
+            calculators.append(KadDistanceCalculator(storage, gmaps_client))
+        warmer = CacheWarmer(
+            geocode_service=geocoder.geocode_service if 'geocode' in operations else None,
+            reverse_geocode_service=geocoder.reverse_geocode_service if 'reverse' in operations else None,
+            distance_calculators=calculators,
+            qps=args.qps,
+            budget=args.budget,
+            workers=args.workers,
+        )
+        if args.queries:
+            with open(args.queries, encoding='utf-8') as queries_file:
+                queries = count_queries(queries_file)
+            sys.stderr.write('queries: {}\n'.format(warmer.warm_queries(queries, min_count=args.min_count)))
+        if args.grid:
+            south, west, north, east = [float(value) for value in args.grid.split(',')]
+            grid = iter_grid(south, west, north, east, args.grid_step)
+            sys.stderr.write('grid: {}\n'.format(warmer.warm_grid(grid)))
+
+
+def command_export(args: argparse.Namespace) -> None:
+    with open_storage(args.cache) as storage, open(args.snapshot, 'wb') as stream:
+        count = export_snapshot(storage, stream, prefixes=args.prefixes.split(','))
+    sys.stderr.write('exported {} keys\n'.format(count))
+
+
+def command_import(args: argparse.Namespace) -> None:
+    with open_storage(args.cache) as storage:
+        count = import_snapshot(storage, args.snapshot)
+    sys.stderr.write('imported {} keys\n'.format(count))
+
+
+def add_connection_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        '--cache', default=os.environ.get('GEO_GARRY_CACHE_URL', 'redis://localhost:6379/0'),
+        help='cache storage url, default from GEO_GARRY_CACHE_URL',
+    )
+    parser.add_argument(
+        '--google-key', default=os.environ.get('GOOGLE_MAPS_API_KEY'),
+        help='Google Maps API key, default from GOOGLE_MAPS_API_KEY',
+    )
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='geo-garry', description='Geocoding and distance calculations')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    process = commands.add_parser('process', help='run operations over CSV/JSONL file')
+    process.add_argument('input')
+    process.add_argument('output')
+    process.add_argument(
+        '--operations', required=True, help='comma separated: {}'.format(','.join(OPERATIONS)),
+    )
+    process.add_argument('--format', choices=['csv', 'jsonl'], help='default by input file extension')
+    process.add_argument('--address-field', default='address')
+    process.add_argument('--latitude-field', default='latitude')
+    process.add_argument('--longitude-field', default='longitude')
+    process.add_argument('--chunk-size', type=int, default=500, help='records per batch and checkpoint')
+    process.add_argument('--workers', type=int, default=8, help='concurrent API calls')
+    process.add_argument('--qps', type=float, help='API calls per second limit')
+    process.add_argument('--checkpoint', help='checkpoint file, default OUTPUT.checkpoint')
+    process.add_argument('--resume', action='store_true', help='continue from checkpoint')
+    add_connection_arguments(process)
+    process.set_defaults(handler=command_process)
+
+    warmup = commands.add_parser('warmup', help='fill cache from past queries and grid of popular area')
+    warmup.add_argument('--queries', help='file with past query per line: address or "latitude,longitude"')
+    warmup.add_argument('--min-count', type=int, default=1, help='skip queries seen less times')
+    warmup.add_argument('--grid', help='distances grid bounding box: south,west,north,east')
+    warmup.add_argument('--grid-step', type=float, default=500, help='grid step in meters')
+    warmup.add_argument(
+        '--operations', default='geocode,reverse,mkad,kad', help='comma separated: geocode,reverse,mkad,kad',
+    )
+    warmup.add_argument('--workers', type=int, default=4, help='concurrent API calls')
+    warmup.add_argument('--qps', type=float, help='API calls per second limit')
+    warmup.add_argument('--budget', type=int, help='max API calls')
+    add_connection_arguments(warmup)
+    warmup.set_defaults(handler=command_warmup)
+
+    export = commands.add_parser('export', help='export cached geo results to snapshot file')
+    export.add_argument('snapshot')
+    export.add_argument('--prefixes', default=','.join(KEY_PREFIXES), help='comma separated key prefixes')
+    add_connection_arguments(export)
+    export.set_defaults(handler=command_export)
+
+    import_ = commands.add_parser('import', help='load snapshot file into cache storage')
+    import_.add_argument('snapshot')
+    add_connection_arguments(import_)
+    import_.set_defaults(handler=command_import)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = make_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
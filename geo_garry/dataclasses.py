@@ -1,8 +1,39 @@
-from typing import Tuple, Optional
+from typing import Any, Iterable, Iterator, List, Tuple, Optional, Union
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 
+import numpy as np
 
+
+def with_slots(cls):
+    """
+        Recreates frozen dataclass with __slots__ instead of per-instance __dict__,
+        as dataclass(slots=True) does since python 3.10.
+    """
+    inherited = {name for base in cls.__mro__[1:] for name in getattr(base, '__slots__', ())}
+    field_names = tuple(field.name for field in fields(cls))
+    cls_dict = dict(cls.__dict__)
+    cls_dict['__slots__'] = tuple(name for name in field_names if name not in inherited)
+    for name in field_names:
+        cls_dict.pop(name, None)  # defaults are kept by generated __init__
+    cls_dict.pop('__dict__', None)
+    cls_dict.pop('__weakref__', None)
+
+    def __getstate__(self):
+        return [getattr(self, name) for name in field_names]
+
+    def __setstate__(self, state):
+        for name, value in zip(field_names, state):
+            object.__setattr__(self, name, value)  # frozen dataclass forbids setattr
+
+    cls_dict['__getstate__'] = __getstate__
+    cls_dict['__setstate__'] = __setstate__
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
+
+
+@with_slots
 @dataclass(frozen=True)
 class Coordinates:
     latitude: float
@@ -15,6 +46,7 @@ class Coordinates:
         return self.latitude, self.longitude
 
 
+@with_slots
 @dataclass(frozen=True)
 class CoordinatesAddress(Coordinates):
     address: str
@@ -28,3 +60,60 @@ class CoordinatesAddress(Coordinates):
             self.city or '',
             self.federal_code or '',
         )
+
+
+class CoordinatesBatch:
+    """
+        Columnar container of many coordinates, backed by latitudes and longitudes float64 numpy arrays.
+        Slicing returns views, iteration yields Coordinates. Accepted by all batch APIs.
+    """
+    __slots__ = ('latitudes', 'longitudes')
+
+    def __init__(self, latitudes: Any, longitudes: Any):
+        self.latitudes: np.ndarray = np.asarray(latitudes, dtype=np.float64)
+        self.longitudes: np.ndarray = np.asarray(longitudes, dtype=np.float64)
+        if self.latitudes.shape != self.longitudes.shape or self.latitudes.ndim != 1:
+            raise ValueError('Latitudes and longitudes should be one dimensional arrays of the same length')
+
+    @classmethod
+    def from_buffer(cls, buffer: Any) -> 'CoordinatesBatch':
+        """Zero-copy batch over buffer of interleaved latitude, longitude doubles."""
+        points = np.frombuffer(buffer, dtype=np.float64).reshape(-1, 2)
+        return cls(points[:, 0], points[:, 1])
+
+    @classmethod
+    def from_points(cls, points: Iterable[Union[Coordinates, Tuple[float, float]]]) -> 'CoordinatesBatch':
+        latitudes: List[float] = []
+        longitudes: List[float] = []
+        for point in points:
+            latitude, longitude = point.as_tuple() if isinstance(point, Coordinates) else point
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+        return cls(latitudes, longitudes)
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    def __iter__(self) -> Iterator[Coordinates]:
+        for latitude, longitude in zip(self.latitudes.tolist(), self.longitudes.tolist()):
+            yield Coordinates(latitude, longitude)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Coordinates(float(self.latitudes[index]), float(self.longitudes[index]))
+        return CoordinatesBatch(self.latitudes[index], self.longitudes[index])
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CoordinatesBatch):
+            return NotImplemented
+        return np.array_equal(self.latitudes, other.latitudes) and \
+            np.array_equal(self.longitudes, other.longitudes)
+
+    __hash__ = None  # type: ignore
+
+    def as_array(self) -> np.ndarray:
+        """Returns (N, 2) array of latitude, longitude pairs."""
+        return np.column_stack([self.latitudes, self.longitudes])
+
+    def as_tuples(self) -> List[Tuple[float, float]]:
+        return list(zip(self.latitudes.tolist(), self.longitudes.tolist()))
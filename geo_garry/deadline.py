@@ -0,0 +1,181 @@
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from dataclasses import dataclass
+
+from .cache import MISSING, CacheableServiceAbstract
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+FRESH = 'fresh'  # refreshed by provider within deadline
+CACHED = 'cached'
+STALE = 'stale'  # expired cached value, see geo_garry.stale.StaleCopyStorage
+NEARBY = 'nearby'  # cached value of neighbouring key, f.e. of adjacent reverse geocoding cell
+ESTIMATE = 'estimate'  # local approximation, f.e. straight line distance
+QUALITIES = (FRESH, CACHED, STALE, NEARBY, ESTIMATE)  # the best first
+DEGRADED = (STALE, NEARBY, ESTIMATE)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Qualified:
+    value: Any
+    quality: str
+
+    @property
+    def degraded(self) -> bool:
+        return self.quality in DEGRADED
+
+
+class Deadline:
+    """
+        Time budget of request, passed to every call made for it.
+        Records quality of values served under it, so caller can tell approximate answer.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expire_at = time.monotonic() + timeout
+        self.qualities: List[str] = []
+
+    def remaining(self) -> float:
+        return max(self.expire_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expire_at
+
+    def serve(self, value: Any, quality: str) -> Qualified:
+        self.qualities.append(quality)
+        return Qualified(value, quality)
+
+    @property
+    def quality(self) -> Optional[str]:
+        """The worst quality of served values, None if nothing was served."""
+        if not self.qualities:
+            return None
+        return max(self.qualities, key=QUALITIES.index)
+
+    @property
+    def degraded(self) -> bool:
+        return any(quality in DEGRADED for quality in self.qualities)
+
+
+class BackgroundCalls:
+    """
+        Runs calls on shared bounded thread pool, calls of the same key share one future,
+        so callers timing out on the same miss don't pile up provider requests.
+        At most max_queued calls wait for a free worker, further calls are refused.
+    """
+
+    def __init__(self, workers: int = 8, max_queued: int = 64):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.calls: Dict[Hashable, Future] = {}  # running and queued
+        self.lock = threading.Lock()
+        self.refused = 0
+
+    def submit(self, key: Hashable, func: Callable[[], Any]) -> Optional[Future]:
+        """Future of call, None if queue is full."""
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                return future
+            if len(self.calls) >= self.workers + self.max_queued:
+                self.refused += 1
+                return None
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='geo_garry')
+            # context variables of caller (f.e. gmaps caller tag) are visible in background call
+            future = self.calls[key] = self.executor.submit(contextvars.copy_context().run, func)
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+        if future.exception() is not None:
+            logger.warning(
+                'Фоновое обновление значения не удалось',
+                extra=dict(deadline_key=key, error=repr(future.exception()))
+            )
+
+
+BACKGROUND_CALLS = BackgroundCalls()
+
+
+def call_within(
+        key: Hashable,
+        func: Callable[[], Any],
+        deadline: Deadline,
+        fallbacks: Sequence[Tuple[str, Callable[[], Any]]] = (),
+) -> Qualified:
+    """
+        Runs func in background and waits for it until deadline. On timeout returns value
+        of the first (quality, lookup) fallback which doesn't return MISSING, func is left to finish
+        in background. When background queue is full func is skipped and fallback is returned at once.
+        Raises DeadlineExceeded if there is no fallback value.
+    """
+    future = BACKGROUND_CALLS.submit(key, func)
+    if future is None:
+        logger.warning(
+            'Очередь фоновых обновлений переполнена, обновление пропущено', extra=dict(deadline_key=key),
+        )
+    else:
+        try:
+            return deadline.serve(future.result(timeout=deadline.remaining()), FRESH)
+        except FutureTimeoutError:
+            pass
+    for quality, lookup in fallbacks:
+        value = lookup()
+        if value is not MISSING:
+            logger.warning(
+                'Значение не получено до дедлайна, возвращено приближенное',
+                extra=dict(deadline_key=key, deadline_timeout=deadline.timeout, deadline_quality=quality)
+            )
+            return deadline.serve(value, quality)
+    logger.warning(
+        'Значение не получено до дедлайна', extra=dict(deadline_key=key, deadline_timeout=deadline.timeout),
+    )
+    raise DeadlineExceeded()
+
+
+def get_within(service: CacheableServiceAbstract, key: Any, deadline: Deadline) -> Qualified:
+    """
+        Deadline-aware service.get. Miss is refreshed in background, when refresh doesn't finish
+        before deadline stale copy, cached value of nearby key or estimate is returned, refresh
+        still caches its value. Cache lookups run on caller thread and are not bounded by deadline,
+        keep storage socket timeout below deadlines.
+    """
+    service.track_access(key)
+    storage = service.storage
+    value = service.get_cached(storage, key)
+    if value is not MISSING:
+        return deadline.serve(value, CACHED)
+    return call_within(
+        (id(service), storage.get_key(key)),
+        partial(service.refresh_and_save, storage, key),
+        deadline,
+        [
+            (STALE, partial(service.get_stale, key)),
+            (NEARBY, partial(service.get_nearby, key)),
+            (ESTIMATE, partial(service.estimate_value, key)),
+        ],
+    )
+
+
+def get_by_deadline(service: CacheableServiceAbstract, key: Any, deadline: Optional[Deadline] = None) -> Any:
+    """service.get without deadline, value of get_within with it."""
+    if deadline is None:
+        return service.get(key)
+    return get_within(service, key, deadline).value
@@ -1,14 +1,17 @@
-from typing import Tuple, List, Optional
+from functools import partial
+from typing import Any, Tuple, List, Optional
 
 import logging
-from scipy.spatial import KDTree
-from shapely.geometry import Polygon
+from shapely.geometry import Point, Polygon
 
 from . import geometry
 from .dataclasses import Coordinates
-from .cache import CacheableServiceAbstract
+from .deadline import ESTIMATE, FRESH, Deadline, Qualified, call_within, get_within
+from .spatial import NearestPointsIndex
+from .cache import MISSING, CacheableServiceAbstract
 from .gmaps.cache import CacheStorageDistance
 from .gmaps.api import GoogleMapsApi
+from .gmaps.costs import REDUCED, BudgetExhausted, CostAccountant
 from .polygons import MKAD_POLYGON, KAD_POLYGON
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
@@ -110,32 +113,93 @@ MKAD_EXITS_COORDINATES = [
     (55.90738403567146, 37.5979956303702),
 ]
 
-MKAD_TREE = KDTree(MKAD_EXITS_COORDINATES)
+MKAD_TREE = NearestPointsIndex(MKAD_EXITS_COORDINATES)
 
 KAD_CENTER = Coordinates(59.95, 30.305)
 
 
 class DistanceCalculatorAbstract:
+    road_factor = 1.4  # driving distance to straight distance ratio of estimates
+
     def __init__(self, *, polygon: Polygon):
         self.polygon = polygon
 
-    def get_distance(self, coordinates: Coordinates) -> int:
-        """Returns distance from coordinates to polygon in kilometers."""
+    def get_distance(self, coordinates: Coordinates, deadline: Optional[Deadline] = None) -> int:
+        """
+            Returns distance from coordinates to polygon in kilometers.
+            With deadline see get_distance_within, quality of distance is recorded by deadline.
+        """
+        if deadline is not None:
+            return self.get_distance_within(coordinates, deadline).value
         if not self.polygon or geometry.is_inside_polygon(coordinates, self.polygon):
             return 0
 
-        distance = self.calc_distance(coordinates)
+        distance = self.calc_distance_on_budget(coordinates)
+        return self.to_kilometers(distance)
 
-        distance = round(float(distance) / 1000) if distance > 1000 else 1
-        return distance
+    def get_distance_within(self, coordinates: Coordinates, deadline: Deadline) -> Qualified:
+        """
+            Distance in kilometers calculated before deadline, or stale, nearby or estimated
+            distance with quality flag if calculation is late, it is finished in background.
+        """
+        if not self.polygon or geometry.is_inside_polygon(coordinates, self.polygon):
+            return deadline.serve(0, FRESH)
+        distance = self.calc_distance_within(coordinates, deadline)
+        return Qualified(self.to_kilometers(distance.value), distance.quality)
+
+    @staticmethod
+    def to_kilometers(distance: float) -> int:
+        return round(float(distance) / 1000) if distance > 1000 else 1
 
     def calc_distance(self, coordinates: Coordinates) -> float:
         """Caclulates distance from coordinates to polygon in meters using some strategy."""
         raise NotImplementedError
 
+    def calc_distance_within(self, coordinates: Coordinates, deadline: Deadline) -> Qualified:
+        return call_within(
+            (id(self), coordinates),
+            partial(self.calc_distance_on_budget, coordinates),
+            deadline,
+            [(ESTIMATE, partial(self.estimate_value, coordinates))],
+        )
+
+    def estimate_distance(self, coordinates: Coordinates) -> float:
+        """Cheap local approximation of calc_distance in meters, strategies which can estimate define it."""
+        raise NotImplementedError
+
+    def estimate_value(self, coordinates: Coordinates) -> Any:
+        try:
+            return self.estimate_distance(coordinates)
+        except NotImplementedError:
+            return MISSING
+
+    def calc_distance_on_budget(self, coordinates: Coordinates) -> float:
+        """calc_distance, estimate when provider budget is spent."""
+        try:
+            return self.calc_distance(coordinates)
+        except BudgetExhausted:
+            distance = self.estimate_on_budget(coordinates)
+            if distance is None:
+                raise
+            return distance
+
+    def estimate_on_budget(self, coordinates: Coordinates) -> Optional[float]:
+        """Estimate served instead of provider request when budget is spent, None if it can't be estimated."""
+        try:
+            distance = self.estimate_distance(coordinates)
+        except NotImplementedError:
+            return None
+        logger.warning(
+            'Бюджет GoogleMaps израсходован, расстояние оценено',
+            extra=dict(geo_distance=distance, geo_coordinates=coordinates.as_str())
+        )
+        return distance
+
 
 class NearestExitsGoogleDistanceCalculator(DistanceCalculatorAbstract):
     log_message = 'Рассчитано расстояние от ближайших выездов с полигона (в метрах)'
+    nearest_exits_count = 7
+    reduced_exits_count = 3  # when budget is running out, distance_matrix is billed per exit
 
     def __init__(
             self,
@@ -143,18 +207,28 @@ class NearestExitsGoogleDistanceCalculator(DistanceCalculatorAbstract):
             api: GoogleMapsApi,
             polygon: Polygon,
             exits_coordinates: List[PointTuple],
-            exits_tree: Optional[KDTree] = None,
+            exits_tree: Optional[Any] = None,
     ):
+        """exits_tree is any index with KDTree compatible query method, f.e. NearestPointsIndex."""
         super().__init__(polygon=polygon)
         self.api = api
         self.exits = exits_coordinates
-        self.kdtree = exits_tree if exits_tree else KDTree(exits_coordinates)
+        self.kdtree = exits_tree if exits_tree else NearestPointsIndex(exits_coordinates)
+
+    def get_nearest_exits(self, coordinates: Coordinates) -> List[PointTuple]:
+        count = self.reduced_exits_count if self.api.level >= REDUCED else self.nearest_exits_count
+        _, indexes = self.kdtree.query(coordinates.as_tuple(), k=count)
+        return [self.exits[index] for index in indexes]
+
+    def estimate_distance(self, coordinates: Coordinates) -> float:
+        """Straight distance to the nearest exit times road_factor."""
+        return self.road_factor * min(
+            geometry.get_straight_distance(coordinates, Coordinates(*exit_coordinates))
+            for exit_coordinates in self.get_nearest_exits(coordinates)
+        )
 
     def calc_distance(self, coordinates: Coordinates) -> float:
-        dists, indexes = self.kdtree.query((coordinates.latitude, coordinates.longitude), k=7)
-        nearest_coordinates = list()
-        for _, index in zip(dists, indexes):
-            nearest_coordinates.append(self.exits[index])
+        nearest_coordinates = self.get_nearest_exits(coordinates)
 
         distance = float(self.api.get_distance_from_points(nearest_coordinates, coordinates.as_tuple()))
         logger.info(
@@ -172,6 +246,13 @@ class PolygonCenterGoogleDistanceCalculator(DistanceCalculatorAbstract):
         self.api = api
         self.center = center
 
+    def estimate_distance(self, coordinates: Coordinates) -> float:
+        """Straight distance to the nearest point of polygon border times road_factor."""
+        border = self.polygon.exterior
+        nearest = border.interpolate(border.project(Point(coordinates.latitude, coordinates.longitude)))
+        nearest_point = Coordinates(nearest.x, nearest.y)
+        return self.road_factor * geometry.get_straight_distance(coordinates, nearest_point)
+
     def calc_distance(self, coordinates: Coordinates) -> float:
         driving_path = self.api.get_driving_path(self.center.as_tuple(), coordinates.as_tuple())
         distance = 0
@@ -191,24 +272,35 @@ class PolygonCenterGoogleDistanceCalculator(DistanceCalculatorAbstract):
         return distance
 
 
-class CachedDistanceCalculator(CacheableServiceAbstract, DistanceCalculatorAbstract):
+class CachedDistanceCalculator(  # pylint: disable=abstract-method
+        CacheableServiceAbstract, DistanceCalculatorAbstract,
+):
     storage_class = CacheStorageDistance
+    fallback_errors = (BudgetExhausted,)
+    estimate_value = DistanceCalculatorAbstract.estimate_value  # not the one of CacheableServiceAbstract
 
     def refresh_value(self, key: Coordinates) -> int:
         return super().calc_distance(key)
 
+    def fallback_value(self, key: Coordinates) -> Optional[float]:
+        # estimates of spent budget are not cached
+        return self.estimate_on_budget(key)
+
     def calc_distance(self, coordinates: Coordinates) -> int:
         return self.get(coordinates)
 
+    def calc_distance_within(self, coordinates: Coordinates, deadline: Deadline) -> Qualified:
+        return get_within(self, coordinates, deadline)
+
 
 class MkadDistanceCalculator(CachedDistanceCalculator, NearestExitsGoogleDistanceCalculator):
     expire_time = 60 * 60 * 24 * 30  # 30 days
     log_message = 'Рассчитано расстояние от МКАД (в метрах)'
 
-    def __init__(self, storage, gmaps_client):
+    def __init__(self, storage, gmaps_client, accountant: Optional[CostAccountant] = None):
         super().__init__(
             storage=storage,
-            api=GoogleMapsApi(gmaps_client),
+            api=GoogleMapsApi(gmaps_client, accountant),
             polygon=MKAD_POLYGON,
             exits_coordinates=MKAD_EXITS_COORDINATES,
             exits_tree=MKAD_TREE,
@@ -219,10 +311,10 @@ class KadDistanceCalculator(CachedDistanceCalculator, PolygonCenterGoogleDistanc
     expire_time = 60 * 60 * 24 * 30  # 30 days
     log_message = 'Рассчитано расстояние от КАД (в метрах)'
 
-    def __init__(self, storage, gmaps_client):
+    def __init__(self, storage, gmaps_client, accountant: Optional[CostAccountant] = None):
         super().__init__(
             storage=storage,
-            api=GoogleMapsApi(gmaps_client),
+            api=GoogleMapsApi(gmaps_client, accountant),
             polygon=KAD_POLYGON,
             center=KAD_CENTER
         )
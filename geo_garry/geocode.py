@@ -1,10 +1,13 @@
 import logging
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Sequence
 
 from .dataclasses import Coordinates, CoordinatesAddress
+from .deadline import Deadline
 from .federal_subjects import FEDERAL_SUBJECT_CODES
 from .osm import OpenStreetMapsApi, OSM_ADDRESS_SCHEMAS
 from .gmaps.api import GoogleMapsApi
+from .gmaps.cache import RAW_KEYS, CachePopulator
+from .gmaps.costs import CostAccountant
 from .gmaps.geocode import (
     GmapsCacheableGeocodeService,
     GmapsCacheableReverseGeocodeService,
@@ -30,25 +33,130 @@ class Geocoder:
 
 class GoogleGeocoder(Geocoder):
 
-    def __init__(self, *, storage, gmaps_client):
-        self.api = GoogleMapsApi(gmaps_client)
+    def __init__(
+            self,
+            *,
+            storage,
+            gmaps_client,
+            address_key_scheme: str = RAW_KEYS,
+            normalize_addresses: bool = False,
+            reverse_cell_size: Optional[float] = None,
+            populate_caches: bool = False,
+            cache_ttls: Optional[Dict[str, int]] = None,
+            accountant: Optional[CostAccountant] = None,
+            osm_fallback: bool = False,
+    ):
+        """
+            address_key_scheme - keys of address caches: raw, hashed or dual (hashed with raw fallback).
+            normalize_addresses - canonicalize russian addresses before key generation,
+            see geo_garry.normalize.normalize_address.
+            reverse_cell_size - size in meters of equal-area reverse geocoding cache cells,
+            by default coordinates are rounded to 4 decimals.
+            populate_caches - geocoding of address caches also geo_by_address entry of address
+            and geo entry of geocoded point, so one Google request serves all three caches.
+            cache_ttls - expire seconds of populated entries by key prefix: coordinates, geo_by_address, geo.
+            accountant - counts Google spend, when budget is spent misses are not geocoded:
+            coordinates are None, federal code is found by local polygons, address is empty
+            or requested from OSM with osm_fallback. Fallback results are not cached.
+        """
+        self.api = GoogleMapsApi(gmaps_client, accountant)
         self.storage = storage
+        self.address_storage_options = dict(key_scheme=address_key_scheme, normalize=normalize_addresses)
+        reverse_storage_options = dict(cell_size=reverse_cell_size)
+        self.populator: Optional[CachePopulator] = None
+        if populate_caches:
+            self.populator = CachePopulator(
+                storage,
+                ttls=cache_ttls,
+                address_storage_options=self.address_storage_options,
+                reverse_storage_options=reverse_storage_options,
+            )
+        self.geocode_service = GmapsCacheableGeocodeService(
+            storage=self.storage,
+            api=self.api,
+            storage_options=self.address_storage_options,
+            populator=self.populator,
+        )
+        self.reverse_geocode_service = GmapsCacheableReverseGeocodeService(
+            storage=self.storage,
+            api=self.api,
+            storage_options=reverse_storage_options,
+            osm_fallback=osm_fallback,
+        )
+        self.reverse_by_address_service = GmapsCacheableReverseByAddressService(
+            storage=self.storage,
+            api=self.api,
+            storage_options=self.address_storage_options,
+            populator=self.populator,
+        )
 
-    def get_coordinates(self, address: str) -> Optional[Coordinates]:
-        return GmapsCacheableGeocodeService(storage=self.storage, api=self.api).get_coordinates(address)
+    def get_coordinates(self, address: str, deadline: Optional[Deadline] = None) -> Optional[Coordinates]:
+        """
+            With deadline geocoding late for it is finished in background, stale or nearby cached value
+            is returned instead, its quality is recorded by deadline. DeadlineExceeded is raised without it.
+            The same is for other methods accepting deadline.
+        """
+        return self.geocode_service.get_coordinates(address, deadline)
+
+    def get_coordinates_many(
+            self,
+            addresses: Sequence[str],
+            *,
+            workers: Optional[int] = None,
+            qps: Optional[float] = None,
+            return_exceptions: bool = False,
+    ) -> List[Optional[Coordinates]]:
+        """
+            Returns coordinates for addresses in the same order.
+            Duplicates are geocoded once, cache is used in bulk, misses are geocoded
+            by workers threads not faster than qps requests per second.
+            Failed addresses get None, or exception if return_exceptions.
+        """
+        return self.geocode_service.get_coordinates_many(
+            addresses, workers=workers, qps=qps, return_exceptions=return_exceptions,
+        )
 
-    def get_address(self, coordinates: Coordinates) -> Optional[str]:
-        service = GmapsCacheableReverseGeocodeService(storage=self.storage, api=self.api)
-        return service.get_address(coordinates)
+    def get_address(self, coordinates: Coordinates, deadline: Optional[Deadline] = None) -> Optional[str]:
+        return self.reverse_geocode_service.get_address(coordinates, deadline)
+
+    def get_federal_code(
+            self, coordinates: Coordinates, deadline: Optional[Deadline] = None,
+    ) -> Optional[int]:
+        return self.reverse_geocode_service.get_federal_code(coordinates, deadline)
+
+    def get_address_many(
+            self,
+            coordinates: Iterable[Coordinates],
+            *,
+            workers: Optional[int] = None,
+            qps: Optional[float] = None,
+            return_exceptions: bool = False,
+    ) -> List[Optional[str]]:
+        """
+            Returns addresses for coordinates in the same order.
+            Coordinates falling into the same cache cell are looked up and geocoded once,
+            so cache and API calls scale with distinct cells. See get_coordinates_many for arguments.
+        """
+        return self.reverse_geocode_service.get_address_many(
+            coordinates, workers=workers, qps=qps, return_exceptions=return_exceptions,
+        )
 
-    def get_federal_code(self, coordinates: Coordinates) -> Optional[int]:
-        service = GmapsCacheableReverseGeocodeService(storage=self.storage, api=self.api)
-        return service.get_federal_code(coordinates)
+    def get_federal_code_many(
+            self,
+            coordinates: Iterable[Coordinates],
+            *,
+            workers: Optional[int] = None,
+            qps: Optional[float] = None,
+            return_exceptions: bool = False,
+    ) -> List[Optional[int]]:
+        """Returns federal codes for coordinates in the same order, same as get_address_many."""
+        return self.reverse_geocode_service.get_federal_code_many(
+            coordinates, workers=workers, qps=qps, return_exceptions=return_exceptions,
+        )
 
-    def get_geo(self, address: str) -> Optional[CoordinatesAddress]:
+    def get_geo(self, address: str, deadline: Optional[Deadline] = None) -> Optional[CoordinatesAddress]:
         """Return address coordinates and geocoded address by template."""
-        service = GmapsCacheableReverseByAddressService(storage=self.storage, api=self.api)
-        return service.get_geo(address)
+        return self.reverse_by_address_service.get_geo(address, deadline)
 
 
 class OpenStreetMapsGeocoder(Geocoder):
@@ -1,8 +1,32 @@
+import math
+import sys
+import weakref
+from fractions import Fraction
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 from shapely.geometry import Point, Polygon, LineString
 
-from .dataclasses import Coordinates
+from .dataclasses import Coordinates, CoordinatesBatch
 from .polygons import FEDERAL_POLYGONS
 
+NO_FEDERAL_CODE = 0
+METERS_PER_DEGREE = 111320  # of latitude, and of longitude on equator
+# relative error bound of float orientation determinant (Shewchuk's ccwerrboundA)
+ORIENTATION_ERROR_BOUND = (3 + 16 * sys.float_info.epsilon) * sys.float_info.epsilon
+
+
+def quantize(latitude: float, longitude: float, cell_size: float) -> Coordinates:
+    """
+        Returns center of roughly cell_size x cell_size meters cell containing point.
+        Longitude step grows with 1 / cos(latitude), so cells are equal-area at any latitude.
+    """
+    latitude_step = cell_size / METERS_PER_DEGREE
+    center_latitude = round(latitude / latitude_step) * latitude_step
+    longitude_step = latitude_step / max(math.cos(math.radians(center_latitude)), 0.01)
+    center_longitude = round(longitude / longitude_step) * longitude_step
+    return Coordinates(round(center_latitude, 7), round(center_longitude, 7))
+
 
 def get_line(point1: Coordinates, point2: Coordinates):
     return LineString([point1.as_tuple(), point2.as_tuple()])
@@ -18,8 +42,155 @@ def get_part_outside_polygon(line: LineString, polygon: Polygon) -> float:
     return float(line.difference(polygon).length) / float(line.length)
 
 
+def get_straight_distance(point1: Coordinates, point2: Coordinates) -> float:
+    """Great-circle distance in meters."""
+    latitude1, latitude2 = math.radians(point1.latitude), math.radians(point2.latitude)
+    haversine = math.sin((latitude2 - latitude1) / 2) ** 2 + math.cos(latitude1) * math.cos(latitude2) * \
+        math.sin(math.radians(point2.longitude - point1.longitude) / 2) ** 2
+    return 2 * math.asin(math.sqrt(haversine)) * METERS_PER_DEGREE * 180 / math.pi
+
+
+def get_neighbours(coordinates: Coordinates, cell_size: Optional[float] = None) -> List[Coordinates]:
+    """
+        Points of 8 cells around coordinates cell: cell_size meters equal-area cells (see quantize),
+        or 4 decimals cells if cell_size is not set.
+    """
+    latitude_step = cell_size / METERS_PER_DEGREE if cell_size else 1e-4
+    longitude_step = latitude_step
+    if cell_size:
+        longitude_step = latitude_step / max(math.cos(math.radians(coordinates.latitude)), 0.01)
+    return [
+        Coordinates(coordinates.latitude + latitude_shift * latitude_step,
+                    coordinates.longitude + longitude_shift * longitude_step)
+        for latitude_shift in (-1, 0, 1) for longitude_shift in (-1, 0, 1)
+        if latitude_shift or longitude_shift
+    ]
+
+
 def get_federal_code(coordinates: Coordinates):
     for region_polygon, federal_code in FEDERAL_POLYGONS:
         if is_inside_polygon(coordinates, region_polygon):
             return federal_code
     return None
+
+
+# one array per edge coordinate and bound keeps vectorized tests free of column slicing
+class PolygonEdges:  # pylint: disable=too-many-instance-attributes
+    """Polygon rings (exterior and holes) as flat edge arrays, prepared for vectorized tests."""
+
+    def __init__(self, polygon: Polygon):
+        edges = []
+        for ring in [polygon.exterior, *polygon.interiors]:
+            coords = np.asarray(ring.coords, dtype=np.float64)[:, :2]
+            edges.append(np.hstack([coords[:-1], coords[1:]]))
+        self.x1, self.y1, self.x2, self.y2 = np.vstack(edges).T.copy()
+        self.y_min = np.minimum(self.y1, self.y2)
+        self.y_max = np.maximum(self.y1, self.y2)
+        self.x_min = np.minimum(self.x1, self.x2)
+        self.x_max = np.maximum(self.x1, self.x2)
+        self.bounds = polygon.bounds
+
+    def orientation(self, edge: int, px: np.ndarray, py: np.ndarray) -> np.ndarray:
+        """
+            Exact signs of points orientation to edge line: 1 on the left, -1 on the right, 0 on the line.
+            Float determinant is trusted outside of its error bound, points within it are computed
+            in fractions, so results are the same as of shapely (GEOS) predicates.
+        """
+        x1, y1, x2, y2 = self.x1[edge], self.y1[edge], self.x2[edge], self.y2[edge]
+        left = (x1 - px) * (y2 - py)
+        right = (y1 - py) * (x2 - px)
+        signs = np.sign(left - right).astype(np.int8)
+        error_bound = ORIENTATION_ERROR_BOUND * (np.abs(left) + np.abs(right))
+        for index in np.flatnonzero(np.abs(left - right) <= error_bound):
+            point = Fraction(px[index]), Fraction(py[index])
+            exact = (Fraction(x1) - point[0]) * (Fraction(y2) - point[1]) \
+                - (Fraction(y1) - point[1]) * (Fraction(x2) - point[0])
+            signs[index] = (exact > 0) - (exact < 0)
+        return signs
+
+
+_PREPARED_POLYGONS: Dict[int, Tuple[weakref.ref, PolygonEdges]] = {}
+
+
+def prepare_polygon(polygon: Polygon) -> PolygonEdges:
+    """Returns cached edge arrays for polygon, cache entry is dropped with polygon."""
+    prepared = _PREPARED_POLYGONS.get(id(polygon))
+    if prepared is None or prepared[0]() is not polygon:
+        prepared = (weakref.ref(polygon), PolygonEdges(polygon))
+        _PREPARED_POLYGONS[id(polygon)] = prepared
+        weakref.finalize(polygon, _PREPARED_POLYGONS.pop, id(polygon), None)
+    return prepared[1]
+
+
+def as_coordinate_arrays(latitudes: Any, longitudes: Any = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Converts input to latitudes and longitudes float64 arrays without copying when possible.
+        Accepts CoordinatesBatch, two arrays, (N, 2) array,
+        or buffer of interleaved latitude, longitude doubles.
+    """
+    if isinstance(latitudes, CoordinatesBatch):
+        return latitudes.latitudes, latitudes.longitudes
+    if longitudes is not None:
+        return np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64)
+    if isinstance(latitudes, (bytes, bytearray, memoryview)):
+        points = np.frombuffer(latitudes, dtype=np.float64)
+    else:
+        points = np.asarray(latitudes, dtype=np.float64)
+    points = points.reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def contains_many(polygon: Polygon, latitudes: Any, longitudes: Any = None) -> np.ndarray:
+    """
+        Vectorized is_inside_polygon: tests if points inside polygon and not on the borders.
+        Returns boolean array, same as is_inside_polygon for every point: crossings and borders
+        are decided by exact orientation, as in GEOS.
+        Points are matched against edges whose longitude range covers them,
+        so cost grows with points near the polygon, not with points count times edges count.
+    """
+    latitudes, longitudes = as_coordinate_arrays(latitudes, longitudes)
+    result = np.zeros(len(latitudes), dtype=bool)
+    edges = prepare_polygon(polygon)
+    min_x, min_y, max_x, max_y = edges.bounds
+
+    candidates = np.flatnonzero(
+        (latitudes >= min_x) & (latitudes <= max_x) & (longitudes >= min_y) & (longitudes <= max_y)
+    )
+    if candidates.size == 0:
+        return result
+
+    order = candidates[np.argsort(longitudes[candidates], kind='stable')]
+    sorted_y = longitudes[order]
+    starts = np.searchsorted(sorted_y, edges.y_min, side='left')
+    ends = np.searchsorted(sorted_y, edges.y_max, side='right')
+
+    inside = np.zeros(len(latitudes), dtype=bool)
+    on_border = np.zeros(len(latitudes), dtype=bool)
+    for edge in np.flatnonzero(ends > starts):
+        band = order[starts[edge]:ends[edge]]
+        px, py = latitudes[band], longitudes[band]
+        orientation = edges.orientation(edge, px, py)
+
+        # band is within edge longitude range, so collinear point inside its latitude range is on the edge
+        on_border[band] |= (orientation == 0) & (px >= edges.x_min[edge]) & (px <= edges.x_max[edge])
+
+        # ray to greater latitudes crosses edge if point is on the left of edge directed upwards
+        y1, y2 = edges.y1[edge], edges.y2[edge]
+        inside[band] ^= ((y1 > py) != (y2 > py)) & (orientation == (1 if y2 > y1 else -1))
+
+    result[candidates] = inside[candidates] & ~on_border[candidates]
+    return result
+
+
+def get_federal_code_many(latitudes: Any, longitudes: Any = None) -> np.ndarray:
+    """Vectorized get_federal_code. Returns codes array, NO_FEDERAL_CODE for points outside polygons."""
+    latitudes, longitudes = as_coordinate_arrays(latitudes, longitudes)
+    codes = np.full(len(latitudes), NO_FEDERAL_CODE, dtype=np.int16)
+    remaining = np.arange(len(latitudes))
+    for region_polygon, federal_code in FEDERAL_POLYGONS:
+        if remaining.size == 0:
+            break
+        matched = contains_many(region_polygon, latitudes[remaining], longitudes[remaining])
+        codes[remaining[matched]] = federal_code
+        remaining = remaining[~matched]
+    return codes
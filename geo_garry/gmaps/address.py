@@ -1,7 +1,11 @@
-from typing import Tuple, List, Union, Dict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
 
+from ..federal_subjects import FEDERAL_SUBJECT_CODES
 
 Schema = List[Union[List, Tuple, str]]
+Components = Dict[str, str]
+Formatter = Callable[[Components], str]
+TermCollector = Callable[[Components, List[str]], None]
 ADDRESS_SCHEMAS: Dict[str, Schema] = {
     'as_desc_string': [  # Returns address build from most specific to least specific
         (
@@ -35,6 +39,95 @@ ADDRESS_SCHEMAS: Dict[str, Schema] = {
 }
 
 
+STOP_TERMS = frozenset(('bus_station', 'transit_station'))
+ACCENT = chr(769)
+
+
+def _compile_term(term) -> TermCollector:
+    """Returns function appending values of schema term to result list, see GoogleMapsAddress.format."""
+    if isinstance(term, str):
+        prefix = 'ост. ' if term in STOP_TERMS else ''
+
+        def collect_component(components: Components, result: List[str]) -> None:
+            value = components.get(term)
+            if value is not None:
+                result.append(prefix + value)
+        return collect_component
+    if isinstance(term, list):
+        collectors = tuple(_compile_term(subterm) for subterm in term)
+
+        def collect_all(components: Components, result: List[str]) -> None:
+            for collect in collectors:
+                collect(components, result)
+        return collect_all
+    if isinstance(term, tuple):
+        alternatives = tuple(_compile_term(subterm) for subterm in term)
+
+        def collect_first(components: Components, result: List[str]) -> None:
+            # the next alternative is tried only if previous ones added nothing
+            size = len(result)
+            for collect in alternatives:
+                collect(components, result)
+                if len(result) > size:
+                    return
+        return collect_first
+    return lambda components, result: None
+
+
+def compile_schemas(terms_schemas: Sequence[Schema]) -> Callable[[Components], Tuple[str, ...]]:
+    """
+        Compiles schemas to nested closures once, so schemas are not interpreted on every format call.
+        Returned function formats components by every schema in one call.
+    """
+    collectors = tuple(_compile_term(list(terms_schema)) for terms_schema in terms_schemas)
+
+    def formatter(components: Components) -> Tuple[str, ...]:
+        results = []
+        for collect in collectors:
+            result: List[str] = []
+            collect(components, result)
+            results.append(', '.join(result))
+        return tuple(results)
+    return formatter
+
+
+def compile_schema(terms_schema: Schema) -> Formatter:
+    formatter = compile_schemas([terms_schema])
+    return lambda components: formatter(components)[0]
+
+
+COMPILED_SCHEMAS: Dict[str, Formatter] = {
+    name: compile_schema(schema) for name, schema in ADDRESS_SCHEMAS.items()
+}
+COMPILED_BY_ID: Dict[int, Formatter] = {
+    id(schema): COMPILED_SCHEMAS[name] for name, schema in ADDRESS_SCHEMAS.items()
+}
+COMPILED_BY_REPR: Dict[str, Formatter] = {}
+
+
+def get_formatter(terms_schema: Schema) -> Formatter:
+    """Compiled schema, other than ADDRESS_SCHEMAS are compiled once per distinct schema."""
+    formatter = COMPILED_BY_ID.get(id(terms_schema))
+    if formatter is not None:
+        return formatter
+    key = repr(terms_schema)  # list and tuple terms differ in repr, as they do in meaning
+    formatter = COMPILED_BY_REPR.get(key)
+    if formatter is None:
+        formatter = COMPILED_BY_REPR.setdefault(key, compile_schema(terms_schema))
+    return formatter
+
+
+extract_parts = compile_schemas([  # pylint: disable=invalid-name
+    ADDRESS_SCHEMAS['as_desc_string'], ADDRESS_SCHEMAS['city'], ADDRESS_SCHEMAS['federal_subject'],
+])
+
+
+class AddressParts(NamedTuple):
+    address: str
+    city: str
+    federal_subject: str
+
+
 class GoogleMapsAddress:
     TERMS = (
         'country',
@@ -47,32 +140,20 @@ class GoogleMapsAddress:
         'bus_station',
         'transit_station',
     )
+    TERMS_SET = frozenset(TERMS)
     default_schema = ADDRESS_SCHEMAS['as_desc_string']
 
     def __init__(self, address_components: List[dict]):
-        self.components: dict = {}
+        self.components: Components = {}
         for component in address_components:
-            for component_type in component.get('types', []):
-                if component_type in self.TERMS:
-                    self.components[component_type] = component.get('long_name', '').replace(chr(769), '')
-                    continue
-
-    def _handle_term(self, term) -> List[str]:
-        if isinstance(term, str) and term in self.components:
-            if term in ['bus_station', 'transit_station']:
-                return ['ост. ' + self.components[term]]
-            return [self.components[term]]
-        if isinstance(term, list):
-            subresult: List[str] = []
-            for subterm in term:
-                subresult += self._handle_term(subterm)
-            return subresult
-        if isinstance(term, tuple):
-            for subterm in term:
-                subresult = self._handle_term(subterm)
-                if subresult:
-                    return subresult
-        return []
+            long_name = None
+            for component_type in component.get('types', ()):
+                if component_type in self.TERMS_SET:
+                    if long_name is None:  # cleaned once per component
+                        long_name = component.get('long_name', '')
+                        if ACCENT in long_name:
+                            long_name = long_name.replace(ACCENT, '')
+                    self.components[component_type] = long_name
 
     def format(self, terms_schema: Schema = None) -> str:
         """
@@ -82,8 +163,29 @@ class GoogleMapsAddress:
         """
         if not terms_schema or not isinstance(terms_schema, list):
             terms_schema = self.default_schema
+        return get_formatter(terms_schema)(self.components)
+
+    def parts(self) -> AddressParts:
+        """Address, city and federal subject in one pass over parsed components."""
+        return AddressParts(*extract_parts(self.components))
+
 
-        result: List[str] = []
-        for term in terms_schema:
-            result += self._handle_term(term)
-        return ', '.join(result)
+def extract_address_parts(raw_addresses: Iterable[List[dict]]) -> Optional[AddressParts]:
+    """
+        Parts of the first of geocoded addresses,
+        federal subject is taken from the first address having known one.
+        Fallback addresses are parsed only until federal subject is found.
+    """
+    addresses = iter(raw_addresses)
+    first = next(addresses, None)
+    if first is None:
+        return None
+    parts = GoogleMapsAddress(first).parts()
+    if parts.federal_subject in FEDERAL_SUBJECT_CODES:
+        return parts
+    for address_components in addresses:
+        components = GoogleMapsAddress(address_components).components
+        federal_subject = COMPILED_SCHEMAS['federal_subject'](components)
+        if federal_subject in FEDERAL_SUBJECT_CODES:
+            return AddressParts(parts.address, parts.city, federal_subject)
+    return parts
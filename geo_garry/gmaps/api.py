@@ -2,14 +2,36 @@ from typing import Tuple, List, Optional, cast, Dict, Any
 
 import logging
 
+from .costs import (
+    CACHE_ONLY, DIRECTIONS, DISTANCE_MATRIX, GEOCODE, NORMAL, REVERSE_GEOCODE,
+    BudgetExhausted, CostAccountant,
+)
+
 # gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)  # pylint: disable=invalid-name
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
 class GoogleMapsApi:
-    def __init__(self, gmaps_client):
+    def __init__(self, gmaps_client, accountant: Optional[CostAccountant] = None):
+        """accountant counts spend of requests, services degrade by its level."""
         self.gmaps_client = gmaps_client
+        self.accountant = accountant
+
+    @property
+    def level(self) -> int:
+        """Budget degradation level, see gmaps.costs."""
+        return self.accountant.level if self.accountant else NORMAL
+
+    def check_budget(self, endpoint: str) -> None:
+        """Refuses requests at CACHE_ONLY level, so no code path spends spent budget."""
+        if self.level >= CACHE_ONLY:
+            raise BudgetExhausted(endpoint)
+
+    def record(self, endpoint: str, units: int = 1) -> None:
+        """Counts sent request, failed ones too: provider may have billed it before the error."""
+        if self.accountant:
+            self.accountant.record(endpoint, units)
 
     def get_distance_from_points(
             self,
@@ -23,11 +45,15 @@ class GoogleMapsApi:
                 gmaps_origins=origins
             ),
         )
-        distance_matrix = self.gmaps_client.distance_matrix(
-            origins=origins,
-            destinations=destination,
-            mode='driving',
-        )
+        self.check_budget(DISTANCE_MATRIX)
+        try:
+            distance_matrix = self.gmaps_client.distance_matrix(
+                origins=origins,
+                destinations=destination,
+                mode='driving',
+            )
+        finally:
+            self.record(DISTANCE_MATRIX, len(origins))
 
         try:
             return cast(int, min(
@@ -44,6 +70,48 @@ class GoogleMapsApi:
             )
             return 0
 
+    def get_distance_matrix(
+            self,
+            origins: List[Tuple[float, float]],
+            destinations: List[Tuple[float, float]],
+    ) -> List[List[Optional[int]]]:
+        """Distances in meters, row per origin and column per destination, None if route is not found."""
+        logger.debug(
+            'Отправлен запрос GoogleMaps.distance_matrix',
+            extra=dict(
+                gmaps_destinations=destinations,
+                gmaps_origins=origins
+            ),
+        )
+        self.check_budget(DISTANCE_MATRIX)
+        try:
+            distance_matrix = self.gmaps_client.distance_matrix(
+                origins=origins,
+                destinations=destinations,
+                mode='driving',
+            )
+        finally:
+            self.record(DISTANCE_MATRIX, len(origins) * len(destinations))
+
+        try:
+            rows = [
+                [element.get('distance', {}).get('value') for element in row['elements']]
+                for row in distance_matrix['rows']
+            ]
+        except (KeyError, TypeError, AttributeError):
+            rows = []
+        if len(rows) != len(origins) or any(len(row) != len(destinations) for row in rows):
+            logger.warning(
+                'Не удалось получить расстояние GoogleMaps из переданных координат',
+                extra=dict(
+                    gmaps_response=distance_matrix,
+                    gmaps_destinations=destinations,
+                    gmaps_origins=origins
+                ),
+            )
+            return [[None] * len(destinations) for _ in origins]
+        return rows
+
     def get_driving_path(
             self,
             point: Tuple[float, float],
@@ -56,7 +124,11 @@ class GoogleMapsApi:
                 gmaps_origin=point
             ),
         )
-        api_response = self.gmaps_client.directions(point, destination)
+        self.check_budget(DIRECTIONS)
+        try:
+            api_response = self.gmaps_client.directions(point, destination)
+        finally:
+            self.record(DIRECTIONS)
         try:
             return cast(List[dict], api_response[0]['legs'][0]['steps'])
         except KeyError:
@@ -75,10 +147,14 @@ class GoogleMapsApi:
             'Отправлен запрос GoogleMaps.geocode',
             extra=dict(gmaps_place=place)
         )
-        api_response = self.gmaps_client.geocode(
-            place,
-            language="ru",
-        )
+        self.check_budget(GEOCODE)
+        try:
+            api_response = self.gmaps_client.geocode(
+                place,
+                language="ru",
+            )
+        finally:
+            self.record(GEOCODE)
         if not api_response:
             logger.warning(
                 'Геокодирование адреса GoogleMaps вернуло пустой ответ',
@@ -103,11 +179,15 @@ class GoogleMapsApi:
             'Отправлен запрос GoogleMaps.reverse_geocode',
             extra=dict(gmaps_coordinates=coordinates)
         )
-        api_response = self.gmaps_client.reverse_geocode(
-            coordinates,
-            language="ru",
-            result_type='street_address|bus_station|transit_station'
-        )
+        self.check_budget(REVERSE_GEOCODE)
+        try:
+            api_response = self.gmaps_client.reverse_geocode(
+                coordinates,
+                language="ru",
+                result_type='street_address|bus_station|transit_station'
+            )
+        finally:
+            self.record(REVERSE_GEOCODE)
         if not api_response:
             logger.warning(
                 'Геокодирование координат GoogleMaps вернуло пустой ответ',
@@ -123,10 +203,14 @@ class GoogleMapsApi:
             'Отправлен запрос GoogleMaps.geocode',
             extra=dict(gmaps_place=place)
         )
-        api_response = self.gmaps_client.geocode(
-            place,
-            language="ru",
-        )
+        self.check_budget(GEOCODE)
+        try:
+            api_response = self.gmaps_client.geocode(
+                place,
+                language="ru",
+            )
+        finally:
+            self.record(GEOCODE)
         if not api_response:
             logger.warning(
                 'Геокодирование адреса GoogleMaps вернуло пустой ответ',
@@ -1,6 +1,21 @@
-from typing import Optional
-from ..cache import CacheStorageAbstract, CacheNullStorageAbstract
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from ..cache import MISSING, CacheStorageAbstract, CacheNullStorageAbstract, CacheValueNotFound
 from ..dataclasses import Coordinates, CoordinatesAddress
+from ..geometry import quantize
+from ..normalize import normalize_address
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+RAW_KEYS = 'raw'  # address as is in key
+HASHED_KEYS = 'hashed'  # fixed width digest of normalized address in key
+DUAL_KEYS = 'dual'  # hashed keys, reads fall back to raw keys of existing cache
+KEY_SCHEMES = (RAW_KEYS, HASHED_KEYS, DUAL_KEYS)
+
+
+def normalize_key_address(address: str) -> str:
+    return ' '.join(address.split()).casefold()
 
 
 class CacheStorageDistance(CacheStorageAbstract):
@@ -15,10 +30,91 @@ class CacheStorageDistance(CacheStorageAbstract):
         return str(value)
 
 
-class CacheStorageCoordinates(CacheNullStorageAbstract):
-    """Stores calculated coordinates for address."""
+class AddressKeyMixin:
+    """
+        Key schemes for address keyed null storages. With hashed keys value is prefixed
+        with normalized address, so digest collision is detected and treated as a miss.
+        With normalize addresses are canonicalized by normalize_address before key generation,
+        so spelling variants of the same address share cache entry.
+    """
+    prefix: str
+    cache_storage: Any
+
+    def __init__(self, cache_storage, key_scheme: str = RAW_KEYS, normalize: bool = False):
+        if key_scheme not in KEY_SCHEMES:
+            raise ValueError('Unknown key scheme: {}'.format(key_scheme))
+        super().__init__(cache_storage)  # type: ignore
+        self.key_scheme = key_scheme
+        self.normalize = normalize
+
+    def stored_address(self, instance: str) -> str:
+        """Address as it is identified by hashed key."""
+        return normalize_address(instance) if self.normalize else normalize_key_address(instance)
+
+    def raw_key(self, instance: str) -> str:
+        """Key of address as is, dual scheme reads it as fallback."""
+        return f'{self.prefix}:{instance}'
+
+    def hashed_key(self, instance: str) -> str:
+        digest = hashlib.blake2b(self.stored_address(instance).encode(), digest_size=16).hexdigest()
+        return f'{self.prefix}:#{digest}'
+
     def get_key(self, instance: str) -> str:
-        return f'coordinates:{instance}'
+        if self.key_scheme != RAW_KEYS:
+            return self.hashed_key(instance)
+        return self.raw_key(normalize_address(instance) if self.normalize else instance)
+
+    def encode_value(self, instance: str, value: Any) -> str:
+        if self.key_scheme == RAW_KEYS:
+            return super().encode_value(instance, value)  # type: ignore
+        serialized = self.serialize_value(value)  # type: ignore
+        return '{}\n{}'.format(self.stored_address(instance), serialized)
+
+    def decode_value(self, instance: str, value: bytes) -> Any:
+        """Deserializes hashed key value, raises CacheValueNotFound on digest collision."""
+        address, _, serialized = value.partition(b'\n')
+        if address.decode() != self.stored_address(instance):
+            logger.warning(
+                'Коллизия хеша ключа кеша',
+                extra=dict(cache_key=instance, cache_stored_address=address.decode())
+            )
+            raise CacheValueNotFound()
+        return self.deserialize_value(serialized)  # type: ignore
+
+    def get(self, instance: str) -> Optional[Any]:
+        if self.key_scheme == RAW_KEYS:
+            return super().get(instance)  # type: ignore
+        value = self.cache_storage.get(self.hashed_key(instance))
+        if value is not None:
+            return self.decode_value(instance, value)
+        if self.key_scheme == DUAL_KEYS:
+            value = self.cache_storage.get(self.raw_key(instance))
+            if value is not None:
+                return self.load_value(value)  # type: ignore
+        raise CacheValueNotFound()
+
+    def get_many(self, instances: Sequence[str]) -> List[Any]:
+        if self.key_scheme == RAW_KEYS:
+            return super().get_many(instances)  # type: ignore
+        results: List[Any] = []
+        values = self.mget([self.hashed_key(instance) for instance in instances])  # type: ignore
+        for instance, value in zip(instances, values):
+            try:
+                results.append(MISSING if value is None else self.decode_value(instance, value))
+            except CacheValueNotFound:
+                results.append(MISSING)
+        if self.key_scheme == DUAL_KEYS:
+            misses = [index for index, value in enumerate(results) if value is MISSING]
+            raw_values = self.mget([self.raw_key(instances[index]) for index in misses])  # type: ignore
+            for index, value in zip(misses, raw_values):
+                if value is not None:
+                    results[index] = self.load_value(value)  # type: ignore
+        return results
+
+
+class CacheStorageCoordinates(AddressKeyMixin, CacheNullStorageAbstract):
+    """Stores calculated coordinates for address."""
+    prefix = 'coordinates'
 
     def deserialize_value(self, value: bytes) -> Optional[Coordinates]:
         if not value:
@@ -31,10 +127,20 @@ class CacheStorageCoordinates(CacheNullStorageAbstract):
 
 
 class CacheStorageAddress(CacheNullStorageAbstract):
-    """Stores calculated address, city, federal_code for coordinates."""
+    """
+        Stores calculated address, city, federal_code for coordinates.
+        Coordinates are rounded to 4 decimals, or to center of cell_size meters equal-area cell if it's set.
+    """
     prefix = 'geo'
 
+    def __init__(self, cache_storage, cell_size: Optional[float] = None):
+        super().__init__(cache_storage)
+        self.cell_size = cell_size
+
     def get_key(self, instance: Coordinates) -> str:
+        if self.cell_size:
+            center = quantize(instance.latitude, instance.longitude, self.cell_size)
+            return f'{self.prefix}:{center.latitude},{center.longitude}'
         return f'{self.prefix}:{round(instance.latitude, 4)},{round(instance.longitude, 4)}'
 
     def deserialize_value(self, value: bytes) -> Optional[CoordinatesAddress]:
@@ -54,10 +160,66 @@ class CacheStorageAddress(CacheNullStorageAbstract):
         return value.as_str() if value else ''
 
 
-class CacheStorageAllByAddress(CacheStorageAddress):
+class CacheStorageAllByAddress(AddressKeyMixin, CacheStorageAddress):
     """
         CaStores calculated coordinates and geo_address for address.
         It's hard to find city from human typed address string.
     """
-    def get_key(self, instance: str) -> str:
-        return f'geo_by_address:{instance}'
+    prefix = 'geo_by_address'
+
+
+class CachePopulator:
+    """
+        Writes every cache entry derivable from one geocoding result in one pipeline:
+        coordinates and geo_by_address of queried address, geo of geocoded point.
+        ttls override expire_time per key prefix, f.e. {'geo': 60 * 60 * 24 * 90}.
+    """
+
+    def __init__(
+            self,
+            cache_storage,
+            *,
+            ttls: Optional[Dict[str, int]] = None,
+            address_storage_options: Optional[Dict[str, Any]] = None,
+            reverse_storage_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.cache_storage = cache_storage
+        self.coordinates_storage = CacheStorageCoordinates(cache_storage, **(address_storage_options or {}))
+        self.by_address_storage = CacheStorageAllByAddress(cache_storage, **(address_storage_options or {}))
+        self.geo_storage = CacheStorageAddress(cache_storage, **(reverse_storage_options or {}))
+        for storage in (self.coordinates_storage, self.by_address_storage, self.geo_storage):
+            if ttls and storage.prefix in ttls:
+                storage.expire_time = ttls[storage.prefix]
+
+    def entries(
+            self,
+            address: Optional[str],
+            value: Optional[Coordinates],
+    ) -> List[Tuple[CacheStorageAbstract, Any, Any]]:
+        """Returns (storage, instance, value) entries for address (if known) geocoded to value."""
+        entries: List[Tuple[CacheStorageAbstract, Any, Any]] = []
+        point = Coordinates(value.latitude, value.longitude) if value else None
+        if address is not None:
+            entries.append((self.coordinates_storage, address, point))
+            if value is None or isinstance(value, CoordinatesAddress):
+                entries.append((self.by_address_storage, address, value))
+        if isinstance(value, CoordinatesAddress):
+            entries.append((self.geo_storage, point, value))
+        return entries
+
+    def populate(self, items: Sequence[Tuple[Optional[str], Optional[Coordinates]]]) -> int:
+        """Writes entries of (address, value) results, returns written entries count."""
+        pipeline_factory = getattr(self.cache_storage, 'pipeline', None)
+        storage = pipeline_factory(transaction=False) if pipeline_factory else self.cache_storage
+        count = 0
+        for address, value in items:
+            for entry_storage, instance, entry_value in self.entries(address, value):
+                storage.set(
+                    entry_storage.get_key(instance),
+                    entry_storage.encode_value(instance, entry_value),
+                    ex=entry_storage.expire_time,
+                )
+                count += 1
+        if pipeline_factory:
+            storage.execute()
+        return count
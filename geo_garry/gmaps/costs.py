@@ -0,0 +1,226 @@
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+DISTANCE_MATRIX = 'distance_matrix'
+DIRECTIONS = 'directions'
+GEOCODE = 'geocode'
+REVERSE_GEOCODE = 'reverse_geocode'
+
+# USD per distance_matrix element, per request of other endpoints
+DEFAULT_PRICES = {
+    DISTANCE_MATRIX: 0.005,
+    DIRECTIONS: 0.005,
+    GEOCODE: 0.005,
+    REVERSE_GEOCODE: 0.005,
+}
+
+# Degradation levels, services switch to cheaper strategies as level grows
+NORMAL = 0
+REDUCED = 1  # fewer billed elements per request, f.e. fewer nearest exits
+CACHE_ONLY = 2  # no provider requests: cached values, local estimates, OSM
+LEVEL_NAMES = {NORMAL: 'normal', REDUCED: 'reduced', CACHE_ONLY: 'cache_only'}
+
+DEFAULT_THRESHOLDS: Sequence[Tuple[float, int]] = ((0.8, REDUCED), (1.0, CACHE_ONLY))  # budget share, level
+
+DAY_HOURS = 24
+MONTH_HOURS = 24 * 30
+COSTS_PREFIX = 'costs:'  # shared hourly spend keys, 'costs:<hour>'
+
+
+class BudgetExhausted(Exception):
+    """Provider request is refused at CACHE_ONLY level."""
+
+
+CALLER_TAG: contextvars.ContextVar = contextvars.ContextVar('gmaps_caller_tag', default='untagged')
+
+
+@contextlib.contextmanager
+def caller_tag(tag: str) -> Iterator[None]:
+    """Attributes provider requests made inside block (and its background refreshes) to tag."""
+    token = CALLER_TAG.set(tag)
+    try:
+        yield
+    finally:
+        CALLER_TAG.reset(token)
+
+
+@dataclass
+class Spend:
+    requests: int = 0
+    units: int = 0  # billed elements
+    cost: float = 0.0
+
+
+# budgets, shared storage and per process totals are read together under one lock
+class CostAccountant:  # pylint: disable=too-many-instance-attributes
+    """
+        Counts Google Maps spend per endpoint and per caller tag. Rolling spend of the last 24 hours
+        and the last 30 days is kept in hourly buckets. Degradation level is the highest level
+        of thresholds crossed by spend share of daily or monthly budget, budgets are optional.
+        With storage (redis) hourly buckets are shared by processes ('costs:<hour>' keys increased
+        by INCRBYFLOAT), so budgets limit spend of all workers and survive restarts, otherwise
+        every process counts and limits its own spend. Spend of budget windows is read from storage
+        at most every level_ttl seconds, own requests are added to it in between.
+        Totals per endpoint and caller tag are always per process.
+    """
+
+    def __init__(
+            self,
+            *,
+            prices: Optional[Dict[str, float]] = None,
+            daily_budget: Optional[float] = None,
+            monthly_budget: Optional[float] = None,
+            thresholds: Sequence[Tuple[float, int]] = DEFAULT_THRESHOLDS,
+            storage: Any = None,
+            level_ttl: float = 5.0,
+            clock: Callable[[], float] = time.time,
+    ):
+        self.prices = dict(DEFAULT_PRICES, **(prices or {}))
+        self.daily_budget = daily_budget
+        self.monthly_budget = monthly_budget
+        self.thresholds = sorted(thresholds)
+        self.storage = storage
+        self.level_ttl = level_ttl
+        self.clock = clock
+        self.buckets: Deque[List[float]] = deque()  # [hour, cost] of this process, the oldest first
+        self.cached_spend: Optional[List[float]] = None  # [read at, daily spend, monthly spend]
+        self.endpoints: Dict[str, Spend] = {}
+        self.tags: Dict[str, Dict[str, Spend]] = {}
+        self.lock = threading.Lock()
+        self.last_level = NORMAL
+
+    def record(self, endpoint: str, units: int = 1) -> float:
+        """Counts provider request of units billed elements, returns its cost."""
+        cost = self.prices.get(endpoint, 0.0) * units
+        hour = int(self.clock() // 3600)
+        tag = CALLER_TAG.get()
+        with self.lock:
+            if self.buckets and self.buckets[-1][0] == hour:
+                self.buckets[-1][1] += cost
+            else:
+                self.buckets.append([hour, cost])
+            while self.buckets[0][0] <= hour - MONTH_HOURS:
+                self.buckets.popleft()
+            for spend in (
+                    self.endpoints.setdefault(endpoint, Spend()),
+                    self.tags.setdefault(tag, {}).setdefault(endpoint, Spend()),
+            ):
+                spend.requests += 1
+                spend.units += units
+                spend.cost += cost
+            if self.cached_spend is not None:
+                self.cached_spend[1] += cost
+                self.cached_spend[2] += cost
+        if self.storage is not None and cost:
+            self._share(hour, cost)
+        self._check_level()
+        return cost
+
+    def _share(self, hour: int, cost: float) -> None:
+        key = '{}{}'.format(COSTS_PREFIX, hour)
+        try:
+            pipeline = self.storage.pipeline(transaction=False)
+            pipeline.incrbyfloat(key, cost)
+            pipeline.expire(key, (MONTH_HOURS + 1) * 3600)
+            pipeline.execute()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                'Не удалось записать расход GoogleMaps в общее хранилище',
+                extra=dict(gmaps_costs_key=key, error=repr(exc))
+            )
+
+    def hourly_spend(self) -> Dict[int, float]:
+        """Spend per hour of the last 30 days, of all processes if storage is set."""
+        since = int(self.clock() // 3600) - MONTH_HOURS
+        if self.storage is not None:
+            hours = range(since + 1, since + MONTH_HOURS + 1)
+            try:
+                values = self.storage.mget(['{}{}'.format(COSTS_PREFIX, hour) for hour in hours])
+            except Exception as exc:  # pylint: disable=broad-except
+                # spend of this process only, until storage is back
+                logger.warning(
+                    'Не удалось прочитать расход GoogleMaps из общего хранилища', extra=dict(error=repr(exc)),
+                )
+            else:
+                return {hour: float(value) for hour, value in zip(hours, values) if value is not None}
+        with self.lock:
+            return {int(hour): cost for hour, cost in self.buckets if hour > since}
+
+    def spent(self, hours: int) -> float:
+        """Spend of the last hours, the current hour included."""
+        return self._spent(self.hourly_spend(), hours)
+
+    def _spent(self, hourly: Dict[int, float], hours: int) -> float:
+        since = int(self.clock() // 3600) - hours
+        return sum(cost for hour, cost in hourly.items() if hour > since)
+
+    def windows_spend(self) -> Tuple[float, float]:
+        """
+            Daily and monthly spend, read from storage at most every level_ttl seconds,
+            costs recorded by this process in between are added to the read values.
+        """
+        now = self.clock()
+        with self.lock:
+            cached = self.cached_spend
+            if cached is not None and cached[0] <= now < cached[0] + self.level_ttl:
+                return cached[1], cached[2]
+        hourly = self.hourly_spend()
+        cached = [now, self._spent(hourly, DAY_HOURS), self._spent(hourly, MONTH_HOURS)]
+        with self.lock:
+            self.cached_spend = cached
+        return cached[1], cached[2]
+
+    @property
+    def usage(self) -> float:
+        """The largest spent share of daily and monthly budgets."""
+        daily_spend, monthly_spend = self.windows_spend()
+        shares = [0.0]
+        if self.daily_budget:
+            shares.append(daily_spend / self.daily_budget)
+        if self.monthly_budget:
+            shares.append(monthly_spend / self.monthly_budget)
+        return max(shares)
+
+    @property
+    def level(self) -> int:
+        if not self.daily_budget and not self.monthly_budget:
+            return NORMAL
+        usage = self.usage
+        return max([level for threshold, level in self.thresholds if usage >= threshold], default=NORMAL)
+
+    def _check_level(self) -> None:
+        level = self.level
+        if level != self.last_level:
+            self.last_level = level
+            logger.warning(
+                'Изменен режим расходования бюджета GoogleMaps',
+                extra=dict(gmaps_budget_level=LEVEL_NAMES.get(level, level), gmaps_budget_usage=self.usage)
+            )
+
+    def report(self) -> Dict[str, Any]:
+        """Rolling spend, budgets, level and totals per endpoint and per caller tag."""
+        with self.lock:
+            endpoints = {endpoint: asdict(spend) for endpoint, spend in self.endpoints.items()}
+            tags = {
+                tag: {endpoint: asdict(spend) for endpoint, spend in spends.items()}
+                for tag, spends in self.tags.items()
+            }
+        hourly = self.hourly_spend()
+        return dict(
+            daily_spend=self._spent(hourly, DAY_HOURS),
+            monthly_spend=self._spent(hourly, MONTH_HOURS),
+            daily_budget=self.daily_budget,
+            monthly_budget=self.monthly_budget,
+            level=LEVEL_NAMES.get(self.level, self.level),
+            endpoints=endpoints,
+            tags=tags,
+        )
@@ -0,0 +1,160 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+from dataclasses import dataclass, field
+
+from .api import GoogleMapsApi
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+PointTuple = Tuple[float, float]
+
+# Google Maps distance_matrix limits of one request
+MAX_ORIGINS = 25
+MAX_DESTINATIONS = 25
+MAX_ELEMENTS = 100
+
+
+@dataclass
+class DispatcherStats:
+    requests: int = 0  # get_distance_from_points calls
+    calls: int = 0  # distance_matrix requests sent
+    elements: int = 0  # billed elements of sent requests
+    requested_elements: int = 0  # elements callers asked for, before merging
+
+
+@dataclass
+class Batch:
+    origins: Dict[PointTuple, int] = field(default_factory=dict)  # point, row index
+    destinations: Dict[PointTuple, int] = field(default_factory=dict)  # point, column index
+    requests: List[Tuple[List[PointTuple], PointTuple, Future]] = field(default_factory=list)
+    requested_elements: int = 0
+    full: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def elements(self) -> int:
+        return len(self.origins) * len(self.destinations)
+
+
+class DistanceMatrixDispatcher:  # pylint: disable=too-many-instance-attributes
+    """
+        Merges concurrent get_distance_from_points requests into one distance_matrix request.
+        The first caller of a batch waits up to max_wait seconds for others, then sends union of their
+        origins (shared nearest exits are asked once) to all their destinations and splits rows back.
+        Request doesn't join batch when merged request would exceed API limits, or would be billed
+        for more than max_overhead times elements callers asked for (origins of distant destinations
+        hardly overlap), such request starts the next batch. Request with more origins than one API
+        request allows is split into chunks. As GoogleMapsApi.get_distance_from_points, distance is 0
+        when route from any origin is not found. Sender's caller tag is billed for batch.
+        Other methods are forwarded to wrapped api, so dispatcher replaces api of distance calculator.
+    """
+
+    def __init__(
+            self,
+            api: GoogleMapsApi,
+            *,
+            max_wait: float = 0.005,
+            max_origins: int = MAX_ORIGINS,
+            max_destinations: int = MAX_DESTINATIONS,
+            max_elements: int = MAX_ELEMENTS,
+            max_overhead: float = 1.5,
+    ):
+        self.api = api
+        self.max_wait = max_wait
+        self.max_origins = max_origins
+        self.max_destinations = max_destinations
+        self.max_elements = max_elements
+        self.max_overhead = max_overhead
+        self.batch: Optional[Batch] = None
+        self.lock = threading.Lock()
+        self.stats = DispatcherStats()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.api, name)
+
+    def attach(self, calculator: Any) -> None:
+        """Sends distance_matrix requests of calculator (NearestExitsGoogleDistanceCalculator) in batches."""
+        calculator.api = self
+
+    def get_distance_from_points(self, origins: List[PointTuple], destination: PointTuple) -> int:
+        origins = [(origin[0], origin[1]) for origin in origins]  # exits may be lists, points are dict keys
+        destination = (destination[0], destination[1])
+        chunk_size = min(self.max_origins, self.max_elements)
+        if len(set(origins)) > chunk_size:
+            origins = list(dict.fromkeys(origins))
+            return min(
+                self.get_distance_from_points(origins[start:start + chunk_size], destination)
+                for start in range(0, len(origins), chunk_size)
+            )
+        future: Future = Future()
+        with self.lock:
+            self.stats.requests += 1
+            batch = self.batch
+            sender = batch is None or not self._fits(batch, origins, destination)
+            if sender:
+                if batch is not None:
+                    batch.full.set()
+                batch = self.batch = Batch()
+            self._add(batch, origins, destination, future)
+            if self._is_full(batch):
+                batch.full.set()
+        if sender:
+            batch.full.wait(self.max_wait)
+            with self.lock:
+                if self.batch is batch:
+                    self.batch = None
+            self._send(batch)
+        return future.result()
+
+    def _fits(self, batch: Batch, origins: List[PointTuple], destination: PointTuple) -> bool:
+        origins_count = len(batch.origins.keys() | set(origins))
+        destinations_count = len(batch.destinations) + (destination not in batch.destinations)
+        elements = origins_count * destinations_count
+        return (
+            origins_count <= self.max_origins
+            and destinations_count <= self.max_destinations
+            and elements <= self.max_elements
+            and elements <= self.max_overhead * (batch.requested_elements + len(origins))
+        )
+
+    def _is_full(self, batch: Batch) -> bool:
+        return len(batch.origins) >= self.max_origins or len(batch.destinations) >= self.max_destinations \
+            or batch.elements >= self.max_elements
+
+    @staticmethod
+    def _add(batch: Batch, origins: List[PointTuple], destination: PointTuple, future: Future) -> None:
+        for origin in origins:
+            batch.origins.setdefault(origin, len(batch.origins))
+        batch.destinations.setdefault(destination, len(batch.destinations))
+        batch.requests.append((origins, destination, future))
+        batch.requested_elements += len(origins)
+
+    def _send(self, batch: Batch) -> None:
+        with self.lock:
+            self.stats.calls += 1
+            self.stats.elements += batch.elements
+            self.stats.requested_elements += batch.requested_elements
+        if len(batch.requests) > 1:
+            logger.debug(
+                'Запросы расстояний GoogleMaps объединены',
+                extra=dict(gmaps_requests=len(batch.requests), gmaps_elements=batch.elements)
+            )
+        try:
+            rows = self.api.get_distance_matrix(list(batch.origins), list(batch.destinations))
+        except BaseException as exc:
+            for _, _, future in batch.requests:
+                future.set_exception(exc)
+            raise
+        for origins, destination, future in batch.requests:
+            column = batch.destinations[destination]
+            distances = [rows[batch.origins[origin]][column] for origin in origins]
+            if None in distances:
+                logger.warning(
+                    'Не удалось получить расстояние GoogleMaps из переданных координат',
+                    extra=dict(gmaps_coordinates=destination, gmaps_origins=origins),
+                )
+                future.set_result(0)
+            else:
+                future.set_result(min(distances))
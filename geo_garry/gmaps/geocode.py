@@ -1,23 +1,76 @@
 import logging
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from ..cache import CacheableServiceAbstract
 from ..dataclasses import Coordinates, CoordinatesAddress
+from ..deadline import Deadline, get_by_deadline
+from ..geometry import get_federal_code, get_neighbours
+from ..osm import OpenStreetMapsApi
 from ..federal_subjects import FEDERAL_SUBJECT_CODES
 from .api import GoogleMapsApi
-from .address import GoogleMapsAddress, ADDRESS_SCHEMAS
+from .costs import BudgetExhausted
+from .address import extract_address_parts
 from . import cache
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 
-class GmapsCacheableGeocodeService(CacheableServiceAbstract):
+def make_coordinates_address(
+        coordinates: Coordinates,
+        raw_addresses: List[List[Dict[str, Any]]],
+) -> Optional[CoordinatesAddress]:
+    """
+        Formats the first of geocoded addresses,
+        federal subject is taken from the first address having it.
+    """
+    if not raw_addresses or not isinstance(raw_addresses, list):
+        return None
+    parts = extract_address_parts(raw_addresses)
+    if parts is None:
+        return None
+    return CoordinatesAddress(
+        latitude=coordinates.latitude,
+        longitude=coordinates.longitude,
+        address=parts.address,
+        city=parts.city,
+        federal_code=FEDERAL_SUBJECT_CODES.get(parts.federal_subject),
+    )
+
+
+class PopulatingServiceMixin:
+    """
+        With populator refresh_value writes all cache entries derivable from provider response itself,
+        so refreshed value is not saved once again.
+    """
+    populator: Optional[cache.CachePopulator] = None
+
+    def save_value(self, storage, key: Any, value: Any) -> None:
+        if self.populator is None:
+            super().save_value(storage, key, value)  # type: ignore
+
+    def save_values(self, storage, items: Sequence[Tuple[Any, Any]]) -> None:
+        if self.populator is None:
+            super().save_values(storage, items)  # type: ignore
+
+
+class GmapsCacheableGeocodeService(PopulatingServiceMixin, CacheableServiceAbstract):
     storage_class = cache.CacheStorageCoordinates
-
-    def __init__(self, *, storage, api: GoogleMapsApi):
-        super().__init__(storage=storage)
+    fallback_errors = (BudgetExhausted,)  # misses are not geocoded when budget is spent
+
+    def __init__(
+            self,
+            *,
+            storage,
+            api: GoogleMapsApi,
+            storage_options: Optional[Dict[str, Any]] = None,
+            populator: Optional[cache.CachePopulator] = None,
+    ):
+        super().__init__(storage=storage, storage_options=storage_options)
         self.api = api
+        self.populator = populator
 
     def refresh_value(self, key: str) -> Optional[Coordinates]:
+        if self.populator is not None:
+            return self._refresh_and_populate(key)
         coordinates_tuple = self.api.get_coordinates(key)
         if not coordinates_tuple:
             return None
@@ -31,16 +84,75 @@ class GmapsCacheableGeocodeService(CacheableServiceAbstract):
         )
         return coordinates
 
-    def get_coordinates(self, address: str) -> Optional[Coordinates]:
-        return self.get(address)
+    def _refresh_and_populate(self, key: str) -> Optional[Coordinates]:
+        """Geocodes address with address components, to cache reverse geocoding results too."""
+        data = self.api.get_coordinates_and_addresses(key)
+        value: Optional[Coordinates] = None
+        if data:
+            coordinates = Coordinates(*data['coordinates'])
+            value = make_coordinates_address(coordinates, data['addresses']) or coordinates
+            logger.info(
+                'Сервис GoogleMaps геокодировал адрес',
+                extra=dict(geo_address=key, geo_coordinates=coordinates.as_str())
+            )
+        self.populator.populate([(key, value)])  # type: ignore
+        return Coordinates(value.latitude, value.longitude) if value else None
 
+    def fallback_value(self, key: str) -> Optional[Coordinates]:
+        return None
 
-class GmapsCacheableReverseGeocodeService(CacheableServiceAbstract):
-    storage_class = cache.CacheStorageAddress
+    def get_coordinates(self, address: str, deadline: Optional[Deadline] = None) -> Optional[Coordinates]:
+        return get_by_deadline(self, address, deadline)
 
-    def __init__(self, *, storage, api: GoogleMapsApi):
-        super().__init__(storage=storage)
+    def get_coordinates_many(self, addresses: Sequence[str], **kwargs) -> List[Optional[Coordinates]]:
+        """Batch get_coordinates, kwargs are passed to get_many. Empty addresses are not geocoded."""
+        present = [bool(address and address.strip()) for address in addresses]
+        geocoded = iter(self.get_many(
+            [address for address, is_present in zip(addresses, present) if is_present], **kwargs,
+        ))
+        return [next(geocoded) if is_present else None for is_present in present]
+
+
+class GmapsCacheableReverseGeocodeService(PopulatingServiceMixin, CacheableServiceAbstract):
+    storage_class = cache.CacheStorageAddress
+    fallback_errors = (BudgetExhausted,)
+
+    def __init__(
+            self,
+            *,
+            storage,
+            api: GoogleMapsApi,
+            storage_options: Optional[Dict[str, Any]] = None,
+            populator: Optional[cache.CachePopulator] = None,
+            osm_fallback: bool = False,
+    ):
+        """osm_fallback - address of point is requested from OSM when Google budget is spent."""
+        super().__init__(storage=storage, storage_options=storage_options)
         self.api = api
+        self.populator = populator
+        self.osm_fallback = osm_fallback
+
+    def fallback_value(self, key: Coordinates) -> Optional[CoordinatesAddress]:
+        """Federal code by local polygons, address by OSM if osm_fallback (empty otherwise)."""
+        address = ''
+        if self.osm_fallback:
+            try:
+                address = OpenStreetMapsApi().reverse(coordinates=key.as_tuple()) or ''
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning(
+                    'Сервис OSM не перевел координаты в адрес',
+                    extra=dict(geo_coordinates=key.as_str(), error=repr(exc))
+                )
+        logger.warning(
+            'Бюджет GoogleMaps израсходован, адрес получен без GoogleMaps',
+            extra=dict(geo_coordinates=key.as_str(), geo_address=address)
+        )
+        return CoordinatesAddress(
+            latitude=key.latitude,
+            longitude=key.longitude,
+            address=address,
+            federal_code=get_federal_code(key),
+        )
 
     def _get_data(self, key: Coordinates):
         return {
@@ -48,58 +160,55 @@ class GmapsCacheableReverseGeocodeService(CacheableServiceAbstract):
             'coordinates': key,
         }
 
-    def refresh_value(self, key: Coordinates) -> Optional[CoordinatesAddress]:
+    def refresh_value(self, key: Any) -> Optional[CoordinatesAddress]:
         data = self._get_data(key)
-        if not data:
-            return None
-        raw_addresses = data['addresses']
-        coordinates = data['coordinates']
-        if not raw_addresses or not isinstance(raw_addresses, list):
-            return None
-
-        google_address = GoogleMapsAddress(raw_addresses.pop(0))
-        address = google_address.format(ADDRESS_SCHEMAS['as_desc_string'])
-        city = google_address.format(ADDRESS_SCHEMAS['city'])
-        federal_subject = google_address.format(ADDRESS_SCHEMAS['federal_subject'])
-        federal_code = FEDERAL_SUBJECT_CODES.get(federal_subject)
-
-        if not federal_code:
-            while raw_addresses:
-                google_address = GoogleMapsAddress(raw_addresses.pop(0))
-                federal_subject = google_address.format(ADDRESS_SCHEMAS['federal_subject'])
-                federal_code = FEDERAL_SUBJECT_CODES.get(federal_subject)
-                if federal_code:
-                    break
-
-        logger.info(
-            'Сервис GoogleMaps перевел координаты в адрес',
-            extra=dict(
-                geo_coordinates=coordinates.as_str(),
-                geo_address=address,
-                geo_city=city,
-                geo_federal_code=federal_code,
+        value = make_coordinates_address(data['coordinates'], data['addresses']) if data else None
+        if value is not None:
+            logger.info(
+                'Сервис GoogleMaps перевел координаты в адрес',
+                extra=dict(
+                    geo_coordinates=data['coordinates'].as_str(),
+                    geo_address=value.address,
+                    geo_city=value.city,
+                    geo_federal_code=value.federal_code,
+                )
             )
-        )
-        return CoordinatesAddress(
-            latitude=coordinates.latitude,
-            longitude=coordinates.longitude,
-            address=address,
-            city=city,
-            federal_code=federal_code
-        )
+        if self.populator is not None:
+            self.populator.populate([(key if isinstance(key, str) else None, value)])
+        return value
+
+    def nearby_keys(self, key: Coordinates) -> List[Coordinates]:
+        """Points of adjacent cache cells, their addresses are served when deadline is exceeded."""
+        return get_neighbours(key, self.storage_options.get('cell_size'))
 
-    def get_address(self, coordinates: Coordinates) -> Optional[str]:
-        address_coordinates = self.get(coordinates)
+    def get_address(self, coordinates: Coordinates, deadline: Optional[Deadline] = None) -> Optional[str]:
+        address_coordinates = get_by_deadline(self, coordinates, deadline)
         return address_coordinates.address if address_coordinates else None
 
-    def get_federal_code(self, coordinates: Coordinates) -> Optional[int]:
-        address_coordinates = self.get(coordinates)
+    def get_federal_code(
+            self, coordinates: Coordinates, deadline: Optional[Deadline] = None,
+    ) -> Optional[int]:
+        address_coordinates = get_by_deadline(self, coordinates, deadline)
         return address_coordinates.federal_code if address_coordinates else None
 
-    def get_city(self, coordinates: Coordinates) -> Optional[str]:
-        address_coordinates = self.get(coordinates)
+    def get_city(self, coordinates: Coordinates, deadline: Optional[Deadline] = None) -> Optional[str]:
+        address_coordinates = get_by_deadline(self, coordinates, deadline)
         return address_coordinates.city if address_coordinates else None
 
+    def _get_many_attribute(self, coordinates: Iterable[Coordinates], attribute: str, **kwargs) -> List[Any]:
+        return [
+            getattr(value, attribute) if value and not isinstance(value, Exception) else value
+            for value in self.get_many(coordinates, **kwargs)
+        ]
+
+    def get_address_many(self, coordinates: Iterable[Coordinates], **kwargs) -> List[Optional[str]]:
+        """Batch get_address, kwargs are passed to get_many."""
+        return self._get_many_attribute(coordinates, 'address', **kwargs)
+
+    def get_federal_code_many(self, coordinates: Iterable[Coordinates], **kwargs) -> List[Optional[int]]:
+        """Batch get_federal_code, kwargs are passed to get_many."""
+        return self._get_many_attribute(coordinates, 'federal_code', **kwargs)
+
 
 class GmapsCacheableReverseByAddressService(GmapsCacheableReverseGeocodeService):
     storage_class = cache.CacheStorageAllByAddress
@@ -113,5 +222,11 @@ class GmapsCacheableReverseByAddressService(GmapsCacheableReverseGeocodeService)
             'coordinates': Coordinates(*data['coordinates']),
         }
 
-    def get_geo(self, address: str) -> Optional[CoordinatesAddress]:
-        return self.get(address)
+    def nearby_keys(self, key: str) -> List[str]:
+        return []
+
+    def fallback_value(self, key: str) -> Optional[CoordinatesAddress]:
+        return None
+
+    def get_geo(self, address: str, deadline: Optional[Deadline] = None) -> Optional[CoordinatesAddress]:
+        return get_by_deadline(self, address, deadline)
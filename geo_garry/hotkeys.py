@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+import threading
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from .cache import CacheableServiceAbstract, CacheStorageAbstract
+from .sketch import CountMinSketch, TopK
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+class HotKeyTracker:
+    """
+        Finds the most requested cache keys of attached services, f.e. to choose what to pin, prefetch
+        or precompute. Keys are counted by cache key (rounded coordinates, normalized address),
+        one TopK view per storage_class. Memory is bounded by views count * (sketch + k keys).
+    """
+
+    def __init__(self, *, k: int = 100, width: int = 4096, depth: int = 4):
+        self.k = k
+        self.width = width
+        self.depth = depth
+        self.views: Dict[str, TopK] = {}
+        self.lock = threading.Lock()
+
+    def attach(self, service: CacheableServiceAbstract) -> None:
+        storage = service.storage
+        with self.lock:
+            self.views.setdefault(
+                service.storage_class.__name__, TopK(self.k, CountMinSketch(self.width, self.depth)),
+            )
+        service.access_trackers.append(partial(self.track, service.storage_class.__name__, storage))
+
+    def track(self, view: str, storage: CacheStorageAbstract, key: Any) -> None:
+        self.views[view].add(storage.get_key(key))
+
+    def top(self, view: str, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Hot keys of storage_class name with estimated requests count, the most requested first."""
+        top_k = self.views.get(view)
+        if top_k is None:
+            return []
+        return [dict(key=key, count=count) for key, count in top_k.top(n)]
+
+    def snapshot(self, n: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Hot keys and total requests count of every view."""
+        return {
+            view: dict(total=top_k.sketch.total, keys=self.top(view, n))
+            for view, top_k in list(self.views.items())
+        }
+
+    def dump(self, path: str, n: Optional[int] = None) -> None:
+        """Writes snapshot to JSON file, file is replaced atomically."""
+        temporary_path = '{}.tmp'.format(path)
+        with open(temporary_path, 'w', encoding='utf-8') as stream:
+            json.dump(self.snapshot(n), stream, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, path)
+        logger.info('Горячие ключи кеша сохранены', extra=dict(hot_keys_path=path))
+
+    def decay(self) -> None:
+        """Halves counts of every view, so old popularity fades."""
+        for top_k in list(self.views.values()):
+            top_k.decay()
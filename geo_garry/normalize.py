@@ -0,0 +1,95 @@
+import re
+from typing import Dict, List, Tuple
+
+ACCENT = chr(769)
+
+# abbreviation or full form -> canonical form
+ABBREVIATIONS: Dict[str, str] = {}
+for _canonical, _forms in (
+        ('улица', ('ул', 'улица')),
+        ('проспект', ('пр-т', 'пр-кт', 'просп', 'проспект')),
+        ('проезд', ('пр-д', 'проезд')),
+        ('переулок', ('пер', 'переулок')),
+        ('шоссе', ('ш', 'шоссе')),
+        ('бульвар', ('б-р', 'бул', 'бульвар')),
+        ('площадь', ('пл', 'площадь')),
+        ('набережная', ('наб', 'набережная')),
+        ('тупик', ('туп', 'тупик')),
+        ('область', ('обл', 'область')),
+        ('район', ('р-н', 'р-он', 'район')),
+        ('микрорайон', ('мкр', 'мкрн', 'мкр-н', 'микрорайон')),
+        ('поселок', ('пос', 'пгт', 'поселок')),
+        ('корпус', ('к', 'корп', 'корпус')),
+        ('строение', ('стр', 'строение')),
+        ('владение', ('вл', 'влд', 'владение')),
+        ('квартира', ('кв', 'квартира')),
+):
+    for _form in _forms:
+        ABBREVIATIONS[_form] = _canonical
+
+# words which don't tell one address from another: city markers, country
+NOISE_WORDS = frozenset(('г', 'гор', 'город', 'россия', 'рф', 'российская', 'федерация'))
+# dropped before house number only: 'д' is also деревня
+HOUSE_MARKERS = frozenset(('д', 'дом'))
+# kept paired with the following number, 'д. 5, корп. 2' and 'д. 2, корп. 5' are different houses
+NUMBER_MARKERS = frozenset(('корпус', 'строение', 'владение', 'квартира'))
+
+# house numbers with letter or fraction (5а, 5-а, 12/1) are kept whole, other words may be hyphenated
+TOKEN_RE = re.compile(r'\d+(?:/\d+)?(?:-?[^\W\d_](?![^\W\d_]))?|[^\W\d_]+(?:-[^\W\d_]+)*')
+POSTAL_CODE_RE = re.compile(r'\d{6}')
+
+
+def normalize_address(address: str) -> str:
+    """
+        Canonical form of russian address for cache keys: case, ё, stress marks, punctuation,
+        whitespace, abbreviations, city and house markers, postal code and country are ignored.
+        Comma separated parts keep their order, only words inside part are sorted, so names of
+        street and locality don't swap. Numbers keep their order and markers (корпус, строение,
+        владение, квартира), part without words belongs to the previous one.
+        'г. Москва, ул. Ленина 5' and 'Москва, Ленина улица, д.5' are both 'москва, 5 ленина улица'.
+    """
+    text = address.casefold().replace('ё', 'е').replace(ACCENT, '')
+    parts: List[Tuple[List[str], List[str], List[str]]] = []  # numbers, words, marked numbers
+    for segment in text.split(','):
+        numbers, words, marked = normalize_part(segment)
+        if parts and not words:
+            parts[-1][0].extend(numbers)
+            parts[-1][2].extend(marked)
+        elif numbers or words or marked:
+            parts.append((numbers, words, marked))
+    return ', '.join(
+        ' '.join(numbers + sorted(words) + sorted(marked)) for numbers, words, marked in parts
+    )
+
+
+def normalize_part(text: str) -> Tuple[List[str], List[str], List[str]]:
+    """Numbers in order, words and marked numbers of comma separated part of address."""
+    numbers = []
+    words = []
+    marked = []
+    marker = None  # house or number marker waiting for its number
+    for token in TOKEN_RE.findall(text):
+        if token[0].isdigit():
+            number = token.replace('-', '')
+            if marker in NUMBER_MARKERS:
+                marked.append('{} {}'.format(marker, number))
+            elif marker is not None or not POSTAL_CODE_RE.fullmatch(token):
+                numbers.append(number)
+            marker = None
+            continue
+        if marker is not None:
+            words.append(marker)
+            marker = None
+        canonical = ABBREVIATIONS.get(token, token)
+        if canonical in HOUSE_MARKERS or canonical in NUMBER_MARKERS:
+            marker = canonical
+        elif token in ABBREVIATIONS:
+            words.append(canonical)
+        elif '-' in token:
+            parts = token.split('-')
+            words.extend(ABBREVIATIONS.get(part, part) for part in parts if part not in NOISE_WORDS)
+        elif token not in NOISE_WORDS:
+            words.append(token)
+    if marker is not None:
+        words.append(marker)
+    return numbers, words, marked
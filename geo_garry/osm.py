@@ -1,11 +1,12 @@
 import logging
-from typing import Tuple, List, Union, Dict
+from typing import Callable, Dict, List, Tuple, Union
 import requests
 
 
 logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
 
 Schema = List[Union[List, Tuple, str]]
+Formatter = Callable[[Dict], str]
 
 
 class OpenStreetMapsApi:
@@ -34,6 +35,50 @@ OSM_ADDRESS_SCHEMAS: Dict[str, Schema] = {
     ]
 }
 
+STATE_ALIASES = {
+    # "Кызылординская область": "Байконур",
+    "Автономная Республика Крым": "Республика Крым",
+}
+
+
+def match_state(state: str, address_components: Dict) -> str:
+    if address_components.get('county') == 'Байконыр Г.А.':
+        return 'Байконур'
+    return STATE_ALIASES.get(state, state)
+
+
+def compile_osm_schema(terms_schema: Schema) -> Formatter:
+    """Compiles flat schema of address terms once instead of checking terms on every format call."""
+    terms = tuple(terms_schema)
+
+    def formatter(address_components: Dict) -> str:
+        result: List[str] = []
+        for term in terms:
+            val = address_components.get(term)
+            if val:
+                result.append(match_state(val, address_components) if term == 'state' else val)
+        return ', '.join(result)
+    return formatter
+
+
+OSM_COMPILED_BY_ID: Dict[int, Formatter] = {
+    id(schema): compile_osm_schema(schema) for schema in OSM_ADDRESS_SCHEMAS.values()
+}
+OSM_COMPILED_BY_REPR: Dict[str, Formatter] = {}
+
+
+def get_osm_formatter(terms_schema: Schema) -> Formatter:
+    """Compiled schema, other than OSM_ADDRESS_SCHEMAS are compiled once per distinct schema."""
+    formatter = OSM_COMPILED_BY_ID.get(id(terms_schema))
+    if formatter is not None:
+        return formatter
+    key = repr(terms_schema)
+    formatter = OSM_COMPILED_BY_REPR.get(key)
+    if formatter is None:
+        formatter = OSM_COMPILED_BY_REPR.setdefault(key, compile_osm_schema(terms_schema))
+    return formatter
+
+
 class OpenStreetMapsAddress:
     default_schema = OSM_ADDRESS_SCHEMAS['as_desc_string']
 
@@ -41,12 +86,7 @@ class OpenStreetMapsAddress:
         self.address_components: Dict = raw_results.get('address', {})
 
     def match_state(self, state):
-        state_aliases = {
-            # "Кызылординская область": "Байконур",
-            "Автономная Республика Крым": "Республика Крым",
-        }
-
-        return state_aliases.get(state, state)
+        return match_state(state, self.address_components)
 
     def format(self, terms_schema: Schema = None) -> str:
         """
@@ -55,14 +95,4 @@ class OpenStreetMapsAddress:
         """
         if not terms_schema or not isinstance(terms_schema, list):
             terms_schema = self.default_schema
-
-        result: List[str] = []
-        for term in terms_schema:
-            val = self.address_components.get(term)
-            if val:
-                if term == 'state':
-                    val = self.match_state(val)
-                    if self.address_components.get('county') == 'Байконыр Г.А.':
-                        val = 'Байконур'
-                result.append(val)
-        return ', '.join(result)
+        return get_osm_formatter(terms_schema)(self.address_components)
@@ -0,0 +1,213 @@
+import datetime
+import logging
+import threading
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dataclasses import dataclass
+
+from .batch import RateLimiter, chunked, run_concurrently
+from .cache import CacheableServiceAbstract, CacheStorageAbstract
+from .sketch import CountMinSketch, TopK
+from .warmup import Budget
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+Window = Tuple[datetime.time, datetime.time]
+
+
+@dataclass
+class Candidate:
+    service: CacheableServiceAbstract
+    key: Any
+    hits: int
+
+
+@dataclass
+class RefreshStats:
+    checked: int = 0
+    refreshed: int = 0
+    failed: int = 0
+    skipped: int = 0  # due to refresh, but budget is exhausted
+
+
+def in_windows(moment: datetime.time, windows: Sequence[Window]) -> bool:
+    """Checks time is inside any [start, end) window, windows may cross midnight."""
+    for start, end in windows:
+        if start <= moment < end:
+            return True
+        if start > end and (moment >= start or moment < end):
+            return True
+    return False
+
+
+class RefreshAheadScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+        Keeps hot keys of attached services from expiring on request path.
+        Access frequencies are counted by CountMinSketch, max_candidates most requested keys
+        are kept as candidates by TopK.
+        During off-peak windows candidates whose TTL is below refresh_before seconds are refreshed
+        with refresh_value, not faster than qps and not more than daily_budget provider calls per day.
+    """
+
+    def __init__(
+            self,
+            *,
+            refresh_before: int = 60 * 60 * 24 * 3,  # 3 days
+            windows: Sequence[Window] = (),  # empty - any time
+            daily_budget: Optional[int] = None,
+            qps: Optional[float] = None,
+            workers: int = 4,
+            max_candidates: int = 10000,
+            min_hits: int = 2,
+            decay_interval: datetime.timedelta = datetime.timedelta(days=1),
+            sketch: Optional[CountMinSketch] = None,
+    ):
+        self.refresh_before = refresh_before
+        self.windows = list(windows)
+        self.daily_budget = daily_budget
+        self.budget = Budget(daily_budget)
+        self.budget_day: Optional[datetime.date] = None
+        self.rate_limiter = RateLimiter(qps)
+        self.workers = workers
+        self.max_candidates = max_candidates
+        self.min_hits = min_hits
+        self.sketch = sketch or CountMinSketch()
+        self.hot = TopK(max_candidates, self.sketch, min_count=min_hits)
+        self.decay_interval = decay_interval
+        self.decayed_at: Optional[datetime.datetime] = None
+        # service and key of hot cache keys, keys evicted from hot are dropped lazily
+        self.keys: Dict[str, Tuple[CacheableServiceAbstract, Any]] = {}
+        self.storages: Dict[int, CacheStorageAbstract] = {}
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stopped = threading.Event()
+
+    def attach(self, service: CacheableServiceAbstract) -> None:
+        self.storages[id(service)] = service.make_storage()
+        service.access_trackers.append(partial(self.track, service))
+
+    @property
+    def candidates(self) -> Dict[str, Candidate]:
+        """Hot keys with at least min_hits accesses, the most requested first."""
+        with self.lock:
+            keys = dict(self.keys)
+        return {
+            cache_key: Candidate(*keys[cache_key], hits)
+            for cache_key, hits in self.hot.top() if cache_key in keys
+        }
+
+    def track(self, service: CacheableServiceAbstract, key: Any) -> None:
+        """Counts key access, keeps key as candidate if it is among max_candidates most requested."""
+        cache_key = self.storages[id(service)].get_key(key)
+        self.hot.add(cache_key)
+        if cache_key not in self.hot:
+            return
+        with self.lock:
+            self.keys[cache_key] = (service, key)
+            if len(self.keys) > 2 * self.max_candidates:
+                self._drop_cold_keys()
+
+    def _drop_cold_keys(self) -> None:
+        self.keys = {cache_key: value for cache_key, value in self.keys.items() if cache_key in self.hot}
+
+    def _take_budget(self, count: int, today: datetime.date) -> int:
+        if self.budget_day != today:
+            self.budget, self.budget_day = Budget(self.daily_budget), today
+        return self.budget.take(count)
+
+    @staticmethod
+    def _remaining_ttls(service: CacheableServiceAbstract, cache_keys: List[str]) -> List[Optional[int]]:
+        """Remaining TTLs in milliseconds, None if storage can't tell."""
+        pipeline_factory = getattr(service.cache_storage, 'pipeline', None)
+        if not pipeline_factory or not hasattr(service.cache_storage, 'pttl'):
+            return [None] * len(cache_keys)
+        pipeline = pipeline_factory(transaction=False)
+        for cache_key in cache_keys:
+            pipeline.pttl(cache_key)
+        return pipeline.execute()
+
+    def due(
+            self,
+            batch_size: int = 500,
+            candidates: Optional[Dict[str, Candidate]] = None,
+    ) -> List[Candidate]:
+        """Candidates expiring within refresh_before or already expired, the most requested first."""
+        if candidates is None:
+            candidates = self.candidates
+        due = []
+        for chunk in chunked(list(candidates.items()), batch_size):
+            by_service: Dict[int, List[Tuple[str, Candidate]]] = {}
+            for cache_key, candidate in chunk:
+                by_service.setdefault(id(candidate.service), []).append((cache_key, candidate))
+            expiring = set()
+            for items in by_service.values():
+                service = items[0][1].service
+                ttls = self._remaining_ttls(service, [cache_key for cache_key, _ in items])
+                for (cache_key, _), ttl in zip(items, ttls):
+                    # -2 - expired, -1 - never expires
+                    if ttl is not None and ttl != -1 and ttl < self.refresh_before * 1000:
+                        expiring.add(cache_key)
+            due.extend(candidate for cache_key, candidate in chunk if cache_key in expiring)
+        return due
+
+    def run_once(self, now: Optional[datetime.datetime] = None) -> RefreshStats:
+        """Refreshes due candidates inside off-peak windows, decays frequencies every decay_interval."""
+        now = now or datetime.datetime.now()
+        stats = RefreshStats()
+        if self.decayed_at is None:
+            self.decayed_at = now
+        elif now - self.decayed_at >= self.decay_interval:
+            self.decay()
+            self.decayed_at = now
+        if self.windows and not in_windows(now.time(), self.windows):
+            return stats
+
+        candidates = self.candidates
+        due = self.due(candidates=candidates)
+        stats.checked = len(candidates)
+        allowed = self._take_budget(len(due), now.date())
+        stats.skipped = len(due) - allowed
+        due = due[:allowed]
+
+        refreshed = run_concurrently(
+            lambda candidate: candidate.service.refresh_value(candidate.key),
+            due, workers=self.workers, rate_limiter=self.rate_limiter,
+        )
+        for candidate, value in zip(due, refreshed):
+            if isinstance(value, Exception):
+                stats.failed += 1
+                logger.warning(
+                    'Не удалось заранее обновить значение кеша',
+                    extra=dict(cache_key=candidate.key, error=repr(value))
+                )
+                continue
+            candidate.service.save_value(self.storages[id(candidate.service)], candidate.key, value)
+            stats.refreshed += 1
+        logger.info('Горячие ключи кеша обновлены заранее', extra=dict(refresh_stats=stats))
+        return stats
+
+    def decay(self) -> None:
+        """Halves frequencies and forgets candidates which are not hot anymore."""
+        self.hot.decay()
+        with self.lock:
+            self._drop_cold_keys()
+
+    def start(self, interval: float = 600) -> None:
+        """Starts daemon thread calling run_once every interval seconds."""
+        def run_periodically():
+            while not self.stopped.wait(interval):
+                try:
+                    self.run_once()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception('Ошибка обновления кеша заранее')
+
+        self.stopped.clear()
+        self.thread = threading.Thread(target=run_periodically, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,284 @@
+import bisect
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dataclasses import dataclass
+
+from .cache import StorageInterface, delete_if_equal, set_if_equal
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+UNHEALTHY_AFTER = 3  # consecutive errors
+
+
+def hash_tag(key: Any) -> Any:
+    """
+        Part of key hashed for shard choice: content of the first non empty {braces} if any,
+        as redis cluster does, so 'lock:{geo:1,2}' shares shard with 'geo:1,2'.
+    """
+    text = key.decode() if isinstance(key, bytes) else key
+    start = text.find('{')
+    if start != -1:
+        end = text.find('}', start + 1)
+        if end > start + 1:
+            return text[start + 1:end]
+    return key
+
+
+def hash_key(key: Any) -> int:
+    if isinstance(key, str):
+        key = key.encode()
+    return int.from_bytes(hashlib.md5(key).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """
+        Maps keys to nodes, every node owns vnodes points on the ring.
+        Adding or removing node remaps only ~1/N of keys.
+    """
+
+    def __init__(self, nodes: Sequence[str] = (), vnodes: int = 160):
+        self.vnodes = vnodes
+        self.hashes: List[int] = []
+        self.owners: List[str] = []
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self.owners))
+
+    def add_node(self, node: str) -> None:
+        if node in self.owners:
+            raise ValueError('Node {} is already in ring'.format(node))
+        for replica in range(self.vnodes):
+            point = hash_key('{}#{}'.format(node, replica))
+            index = bisect.bisect(self.hashes, point)
+            self.hashes.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove_node(self, node: str) -> None:
+        points = [(point, owner) for point, owner in zip(self.hashes, self.owners) if owner != node]
+        if len(points) == len(self.hashes):
+            raise KeyError(node)
+        self.hashes = [point for point, _ in points]
+        self.owners = [owner for _, owner in points]
+
+    def get_node(self, key: Any) -> str:
+        if not self.hashes:
+            raise LookupError('Hash ring is empty')
+        index = bisect.bisect(self.hashes, hash_key(key)) % len(self.hashes)
+        return self.owners[index]
+
+
+@dataclass
+class ShardStats:  # counters are approximate under concurrent updates
+    calls: int = 0
+    errors: int = 0
+    consecutive_errors: int = 0
+    latency: float = 0.0  # total seconds
+    last_error: Optional[str] = None
+
+    @property
+    def average_latency(self) -> float:
+        return self.latency / self.calls if self.calls else 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return self.consecutive_errors < UNHEALTHY_AFTER
+
+
+class ShardedStorage(StorageInterface):
+    """
+        Composite StorageInterface spreading keys over named backends by consistent hashing.
+        Bulk reads and pipelines are split per shard and sent in parallel.
+        Shard errors are not hidden, they are counted in per-shard stats along with latency.
+    """
+
+    def __init__(self, shards: Dict[str, Any], *, vnodes: int = 160, workers: int = 16):
+        self.shards: Dict[str, Any] = {}
+        self.stats: Dict[str, ShardStats] = {}
+        self.ring = ConsistentHashRing(vnodes=vnodes)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        for name, storage in shards.items():
+            self.add_shard(name, storage)
+
+    def add_shard(self, name: str, storage: Any) -> None:
+        """Adds backend, keys moved to it become misses and are refreshed by services."""
+        with self.lock:
+            self.ring.add_node(name)
+            self.shards[name] = storage
+            self.stats[name] = ShardStats()
+
+    def remove_shard(self, name: str) -> Any:
+        with self.lock:
+            self.ring.remove_node(name)
+            self.stats.pop(name)
+            return self.shards.pop(name)
+
+    def shard_name(self, key: Any) -> str:
+        return self.ring.get_node(hash_tag(key))
+
+    def _call(self, name: str, func: Callable, *args, **kwargs) -> Any:
+        stats = self.stats[name]
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            stats.errors += 1
+            stats.consecutive_errors += 1
+            stats.last_error = repr(exc)
+            logger.warning('Ошибка шарда кеша', extra=dict(cache_shard=name), exc_info=True)
+            raise
+        else:
+            stats.consecutive_errors = 0
+            return result
+        finally:
+            stats.calls += 1
+            stats.latency += time.perf_counter() - started
+
+    def _call_key(self, method: str, key: Any, *args, **kwargs) -> Any:
+        name = self.shard_name(key)
+        return self._call(name, getattr(self.shards[name], method), key, *args, **kwargs)
+
+    def _group(self, keys: Sequence[Any]) -> Dict[str, List[int]]:
+        """Returns shard name -> indexes of its keys."""
+        groups: Dict[str, List[int]] = {}
+        for index, key in enumerate(keys):
+            groups.setdefault(self.shard_name(key), []).append(index)
+        return groups
+
+    def _run_per_shard(self, tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+        """Runs shard tasks in parallel, raises the first error after all tasks are finished."""
+        if len(tasks) == 1:
+            (name, task), = tasks.items()
+            return {name: self._call(name, task)}
+        futures = {name: self.executor.submit(self._call, name, task) for name, task in tasks.items()}
+        errors = [future.exception() for future in futures.values()]
+        for error in errors:
+            if error is not None:
+                raise error
+        return {name: future.result() for name, future in futures.items()}
+
+    def get(self, key):
+        return self._call_key('get', key)
+
+    def set(self, key, value, **kwargs):
+        return self._call_key('set', key, value, **kwargs)
+
+    def exists(self, *keys) -> int:
+        return sum(self._call_key('exists', key) for key in keys)
+
+    def delete(self, *keys) -> int:
+        return sum(self._call_key('delete', key) for key in keys)
+
+    def pttl(self, key):
+        return self._call_key('pttl', key)
+
+    def delete_if_equal(self, key, value) -> int:
+        name = self.shard_name(key)
+        return self._call(name, delete_if_equal, self.shards[name], key, value)
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """Atomic on shard of key when lock_key shares it, f.e. 'lock:{<key>}', see hash_tag."""
+        name = self.shard_name(key)
+        if self.shard_name(lock_key) != name:
+            # lease on another shard is checked by separate command
+            if self.get(lock_key) != (token if isinstance(token, bytes) else str(token).encode()):
+                return False
+            return bool(self.set(key, value, **{
+                option: ttl for option, ttl in (('ex', ex), ('px', px)) if ttl is not None
+            }))
+        return self._call(name, set_if_equal, self.shards[name], key, value, lock_key, token, ex=ex, px=px)
+
+    def eval(self, script, numkeys, key, *args):
+        """Runs script on shard of its first key, keys of one script should share shard."""
+        name = self.shard_name(key)
+        return self._call(name, self.shards[name].eval, script, numkeys, key, *args)
+
+    def ttl(self, key):
+        return self._call_key('ttl', key)
+
+    def mget(self, keys):
+        keys = list(keys)
+        groups = self._group(keys)
+        responses = self._run_per_shard({
+            name: partial(self.shards[name].mget, [keys[index] for index in indexes])
+            for name, indexes in groups.items()
+        })
+        values: List[Any] = [None] * len(keys)
+        for name, indexes in groups.items():
+            for index, value in zip(indexes, responses[name]):
+                values[index] = value
+        return values
+
+    def pipeline(self, transaction=True) -> 'ShardedPipeline':
+        return ShardedPipeline(self)
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[Any]:
+        for name, storage in list(self.shards.items()):
+            keys = self._call(name, lambda storage=storage: list(storage.scan_iter(match=match, count=count)))
+            yield from keys
+
+    def flushall(self):
+        self._run_per_shard({name: storage.flushall for name, storage in self.shards.items()})
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """Per-shard stats snapshot, f.e. for monitoring endpoint."""
+        return {
+            name: dict(
+                healthy=stats.healthy,
+                calls=stats.calls,
+                errors=stats.errors,
+                average_latency=stats.average_latency,
+                last_error=stats.last_error,
+            )
+            for name, stats in self.stats.items()
+        }
+
+
+class ShardedPipeline:
+    """Buffers keyed commands (first argument is key), on execute runs one pipeline per shard in parallel."""
+
+    def __init__(self, storage: ShardedStorage):
+        self.storage = storage
+        self.commands: List[Tuple[str, str, tuple, dict]] = []
+
+    def __getattr__(self, method: str) -> Callable:
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def command(key, *args, **kwargs):
+            self.commands.append((self.storage.shard_name(key), method, (key, *args), kwargs))
+            return self
+        return command
+
+    def execute(self) -> list:
+        groups: Dict[str, List[int]] = {}
+        for index, (name, _, _, _) in enumerate(self.commands):
+            groups.setdefault(name, []).append(index)
+
+        def run_shard(name: str, indexes: List[int]) -> Callable[[], list]:
+            def run() -> list:
+                pipeline = self.storage.shards[name].pipeline(transaction=False)
+                for index in indexes:
+                    _, method, args, kwargs = self.commands[index]
+                    getattr(pipeline, method)(*args, **kwargs)
+                return pipeline.execute()
+            return run
+
+        responses = self.storage._run_per_shard({  # pylint: disable=protected-access
+            name: run_shard(name, indexes) for name, indexes in groups.items()
+        })
+        results: List[Any] = [None] * len(self.commands)
+        for name, indexes in groups.items():
+            for index, result in zip(indexes, responses[name]):
+                results[index] = result
+        self.commands = []
+        return results
@@ -0,0 +1,215 @@
+import copy
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+
+from dataclasses import dataclass
+
+from .cache import (
+    DELETE_IF_EQUAL_SCRIPT, MISSING, CacheableServiceAbstract, CacheStorageAbstract, StorageInterface,
+    delete_if_equal, set_if_equal,
+)
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+LOCAL = object()  # lease backend is skipped, refresh without distributed lease
+RELEASE_SCRIPT = DELETE_IF_EQUAL_SCRIPT  # deletes lease only if it still holds token of its owner
+
+
+@dataclass
+class SingleFlightStats:
+    leads: int = 0  # refreshes under distributed lease
+    shared: int = 0  # calls joined refresh of another thread of this process
+    waited: int = 0  # values refreshed by another process and read from cache
+    wait_timeouts: int = 0  # lease holder didn't write value in wait_timeout, refreshed locally
+    local: int = 0  # refreshes without lease because lease backend is slow or failing
+    fenced: int = 0  # refreshed values not cached because lease was lost
+
+
+# lease options, calls of this process and lease backend cooldown are state of one refresh protocol
+class SingleFlight:  # pylint: disable=too-many-instance-attributes
+    """
+        Makes one refresh per cache key on miss across threads and processes sharing cache storage.
+        Threads of a process share refresh of the first one. Processes compete for lease key
+        'lock:{<cache key>}' set by SET NX PX with random token: lease holder refreshes value,
+        others poll cache every poll_interval for up to wait_timeout and take over when lease is gone
+        without value (holder crashed). Lease expires after lease_timeout, holder caches value only if
+        lease token is still its own: lease check and value write are one atomic command where storage
+        supports it (see cache.set_if_equal), lease key hash tag keeps it on shard of cache key.
+        With separate lock_storage lease is checked before write by separate command.
+        Lease is released by atomic compare-and-delete where storage supports it
+        (delete_if_equal of InMemoryStorage and SqliteStorage, EVAL of redis).
+        When lease backend raises or answers slower than slow_lock seconds, leases are skipped
+        for cooldown seconds and only threads of the process share refreshes.
+    """
+
+    def __init__(
+            self,
+            lock_storage: Any = None,
+            *,
+            lease_timeout: float = 30.0,
+            wait_timeout: float = 5.0,
+            poll_interval: float = 0.05,
+            slow_lock: float = 0.2,
+            cooldown: float = 30.0,
+    ):
+        self.lock_storage = lock_storage  # None - cache storage of service
+        self.lease_timeout = lease_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.slow_lock = slow_lock
+        self.cooldown = cooldown
+        self.calls: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.local_until = 0.0
+        self.stats = SingleFlightStats()
+
+    def attach(self, service: CacheableServiceAbstract) -> None:
+        service.single_flight = self
+
+    def refresh(self, service: CacheableServiceAbstract, storage: CacheStorageAbstract, key: Any) -> Any:
+        """Refreshes and caches missed value of key, or waits for value refreshed by another caller."""
+        cache_key = storage.get_key(key)
+        with self.lock:
+            call = self.calls.get(cache_key)
+            leader = call is None
+            if leader:
+                call = self.calls[cache_key] = Future()
+            else:
+                self.stats.shared += 1
+        if not leader:
+            return call.result()
+        try:
+            value = self._refresh(service, storage, key, cache_key)
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        else:
+            call.set_result(value)
+            return value
+        finally:
+            with self.lock:
+                del self.calls[cache_key]
+
+    def _refresh(
+            self, service: CacheableServiceAbstract, storage: CacheStorageAbstract, key: Any, cache_key: str,
+    ) -> Any:
+        lock_storage = self.lock_storage or service.cache_storage
+        lock_key = 'lock:{%s}' % cache_key
+        token = self._acquire(lock_storage, lock_key)
+        if token is None:
+            deadline = time.monotonic() + self.wait_timeout
+            while token is None and time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                value = service.get_cached(storage, key)
+                if value is not MISSING:
+                    self.stats.waited += 1
+                    return value
+                token = self._acquire(lock_storage, lock_key)
+            if token is None:
+                self.stats.wait_timeouts += 1
+                logger.warning('Не дождались обновления значения кеша', extra=dict(cache_key=cache_key))
+                return self._refresh_locally(service, storage, key)
+        if token is LOCAL:
+            self.stats.local += 1
+            return self._refresh_locally(service, storage, key)
+
+        try:
+            # value could be written by previous lease holder after miss of this caller
+            value = service.get_cached(storage, key)
+            if value is not MISSING:
+                self.stats.waited += 1
+                return value
+            self.stats.leads += 1
+            value = service.refresh_value(key)
+            if not self._save_held(service, storage, key, value, lock_key, token):
+                self.stats.fenced += 1
+                logger.warning(
+                    'Аренда ключа кеша потеряна, значение не сохранено', extra=dict(cache_key=cache_key),
+                )
+            return value
+        finally:
+            self._release(lock_storage, lock_key, token)
+
+    def _refresh_locally(
+            self, service: CacheableServiceAbstract, storage: CacheStorageAbstract, key: Any,
+    ) -> Any:
+        value = service.refresh_value(key)
+        service.save_value(storage, key, value)
+        return value
+
+    def _acquire(self, lock_storage: Any, lock_key: str) -> Any:
+        """Lease token, None if lease is held by another process, LOCAL if lease backend is skipped."""
+        if time.monotonic() < self.local_until:
+            return LOCAL
+        token = uuid.uuid4().hex
+        started = time.monotonic()
+        try:
+            acquired = lock_storage.set(lock_key, token, px=int(self.lease_timeout * 1000), nx=True)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._skip_leases(lock_key, exc)
+            return LOCAL
+        elapsed = time.monotonic() - started
+        if elapsed > self.slow_lock:
+            self._skip_leases(lock_key, None, elapsed)
+        return token if acquired else None
+
+    def _save_held(
+            self, service: CacheableServiceAbstract, storage: CacheStorageAbstract, key: Any, value: Any,
+            lock_key: str, token: str,
+    ) -> bool:
+        """Saves value if lease is still held, returns False if it was lost."""
+        if self.lock_storage is not None:
+            if not self._holds(self.lock_storage, lock_key, token):
+                return False
+            service.save_value(storage, key, value)
+            return True
+        guarded_storage = copy.copy(storage)
+        guarded_storage.cache_storage = LeaseGuardedStorage(storage.cache_storage, lock_key, token)
+        service.save_value(guarded_storage, key, value)
+        return not guarded_storage.cache_storage.lost
+
+    def _holds(self, lock_storage: Any, lock_key: str, token: str) -> bool:
+        try:
+            return lock_storage.get(lock_key) == token.encode()
+        except Exception as exc:  # pylint: disable=broad-except
+            # lease can't be checked, value is cached as without lease
+            self._skip_leases(lock_key, exc)
+            return True
+
+    def _release(self, lock_storage: Any, lock_key: str, token: str) -> None:
+        try:
+            delete_if_equal(lock_storage, lock_key, token)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._skip_leases(lock_key, exc)
+
+    def _skip_leases(
+            self, lock_key: str, error: Optional[Exception], elapsed: Optional[float] = None,
+    ) -> None:
+        self.local_until = time.monotonic() + self.cooldown
+        logger.warning(
+            'Хранилище аренды ключей недоступно, обновления не согласуются между процессами',
+            extra=dict(lock_key=lock_key, error=repr(error) if error else None, elapsed=elapsed)
+        )
+
+
+class LeaseGuardedStorage(StorageInterface):
+    """Cache storage view writing values only while lease key holds token, see cache.set_if_equal."""
+
+    def __init__(self, storage: Any, lock_key: str, token: str):
+        self.storage = storage
+        self.lock_key = lock_key
+        self.token = token
+        self.lost = False
+
+    def set(self, key, value, ex=None, px=None):
+        if not set_if_equal(self.storage, key, value, self.lock_key, self.token, ex=ex, px=px):
+            self.lost = True
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
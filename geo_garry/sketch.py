@@ -0,0 +1,122 @@
+import hashlib
+import heapq
+import itertools
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def key_bytes(key: Any) -> bytes:
+    if isinstance(key, bytes):
+        return key
+    return key.encode() if isinstance(key, str) else repr(key).encode()
+
+
+class CountMinSketch:
+    """
+        Approximate frequencies of unbounded key set in fixed depth x width counters.
+        Estimates never undercount, overcount is within 2/width of total count with high probability.
+        decay halves all counters, so old popularity fades.
+    """
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint32)
+        self.total = 0
+        self.digest_format = '<{}I'.format(depth)
+        self.lock = threading.Lock()
+
+    def _columns(self, key: Any) -> List[Tuple[int, int]]:
+        """
+            (row, column) counter of every row. Counters are accessed one by one,
+            as numpy fancy indexing costs more than a few scalar accesses.
+        """
+        digest = hashlib.blake2b(key_bytes(key), digest_size=4 * self.depth).digest()
+        values = struct.unpack(self.digest_format, digest)
+        return [(row, value % self.width) for row, value in enumerate(values)]
+
+    def add(self, key: Any, count: int = 1) -> int:
+        """Counts key, returns its new estimate."""
+        cells = self._columns(key)
+        table = self.table
+        with self.lock:
+            self.total += count
+            estimates = []
+            for cell in cells:
+                table[cell] += count
+                estimates.append(table[cell])
+            return int(min(estimates))
+
+    def estimate(self, key: Any) -> int:
+        return int(min(self.table[cell] for cell in self._columns(key)))
+
+    def decay(self) -> None:
+        with self.lock:
+            self.table >>= 1
+            self.total //= 2
+
+
+class TopK:
+    """
+        Heavy hitters: k most frequent keys by CountMinSketch estimates, in bounded memory
+        whatever the number of distinct keys. Min-heap of tracked keys has stale entries,
+        they are skipped on eviction and dropped when heap grows over 4 * k.
+        Keys counted less than min_count times are not tracked.
+    """
+
+    def __init__(self, k: int = 100, sketch: Optional[CountMinSketch] = None, min_count: int = 1):
+        self.k = k
+        self.sketch = sketch or CountMinSketch()
+        self.min_count = min_count
+        self.counts: Dict[Any, int] = {}
+        self.heap: List[Tuple[int, int, Any]] = []  # count, sequence (keys may be not comparable), key
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def add(self, key: Any, count: int = 1) -> int:
+        """Counts key, returns its estimate."""
+        estimate = self.sketch.add(key, count)
+        if estimate < self.min_count:
+            return estimate
+        with self.lock:
+            if key not in self.counts and len(self.counts) >= self.k:
+                coldest, coldest_count = self._coldest()
+                if coldest_count >= estimate:
+                    return estimate
+                del self.counts[coldest]
+            self.counts[key] = estimate
+            heapq.heappush(self.heap, (estimate, next(self.sequence), key))
+            if len(self.heap) > 4 * self.k:
+                self._rebuild()
+        return estimate
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.counts
+
+    def _coldest(self) -> Tuple[Any, int]:
+        while True:
+            count, _, key = self.heap[0]
+            if self.counts.get(key) == count:
+                return key, count
+            heapq.heappop(self.heap)
+
+    def _rebuild(self) -> None:
+        self.heap = [(count, next(self.sequence), key) for key, count in self.counts.items()]
+        heapq.heapify(self.heap)
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[Any, int]]:
+        """(key, estimate) pairs, the most frequent first."""
+        with self.lock:
+            items = sorted(self.counts.items(), key=lambda item: -item[1])
+        return items[:n] if n is not None else items
+
+    def decay(self) -> None:
+        """Halves frequencies, see CountMinSketch.decay, forgets keys counted less than min_count times."""
+        self.sketch.decay()
+        with self.lock:
+            counts = {key: self.sketch.estimate(key) for key in self.counts}
+            self.counts = {key: count for key, count in counts.items() if count >= self.min_count}
+            self._rebuild()
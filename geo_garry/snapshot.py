@@ -0,0 +1,200 @@
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .batch import chunked
+from .cache import StorageInterface
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+KEY_PREFIXES = ('distance:', 'coordinates:', 'geo:', 'geo_by_address:')
+
+# File layout: header, records sorted by key, index of records offsets, footer.
+# Record: key length, value length, expire unix timestamp (0 - never), key, value.
+HEADER = b'GGSNAP1\n'
+FOOTER_MAGIC = b'GGSNAPX\n'
+RECORD = struct.Struct('<III')
+FOOTER = struct.Struct('<QQ8s')  # index offset, records count, magic
+OFFSET = struct.Struct('<Q')
+
+Key = Union[str, bytes]
+SnapshotRecord = Tuple[bytes, bytes, int]
+
+
+def as_bytes(value: Key) -> bytes:
+    return value if isinstance(value, bytes) else value.encode()
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def write_snapshot(stream: BinaryIO, records: Iterable[SnapshotRecord]) -> int:
+    """Writes (key, value, expire_at) records sorted by key, returns records count."""
+    offsets: List[int] = []
+    stream.write(HEADER)
+    position = len(HEADER)
+    previous_key = None
+    for key, value, expire_at in records:
+        if previous_key is not None and key <= previous_key:
+            raise ValueError('Snapshot records should be sorted by unique keys')
+        previous_key = key
+        offsets.append(position)
+        stream.write(RECORD.pack(len(key), len(value), expire_at))
+        stream.write(key)
+        stream.write(value)
+        position += RECORD.size + len(key) + len(value)
+    for offset in offsets:
+        stream.write(OFFSET.pack(offset))
+    stream.write(FOOTER.pack(position, len(offsets), FOOTER_MAGIC))
+    return len(offsets)
+
+
+def export_snapshot(
+        cache_storage: Any,
+        stream: BinaryIO,
+        *,
+        prefixes: Sequence[str] = KEY_PREFIXES,
+        batch_size: int = 1000,
+) -> int:
+    """
+        Exports keys with prefixes from redis-like storage (scan_iter, pipeline with get and pttl),
+        keeping their remaining TTL. Only keys are held in memory for sorting, values are streamed.
+    """
+    keys = sorted({
+        as_bytes(key)
+        for prefix in prefixes
+        for key in cache_storage.scan_iter(match=prefix + '*', count=batch_size)
+    })
+
+    def iter_records() -> Iterator[SnapshotRecord]:
+        for chunk in chunked(keys, batch_size):
+            pipeline = cache_storage.pipeline(transaction=False)
+            for key in chunk:
+                pipeline.get(key)
+                pipeline.pttl(key)
+            response = pipeline.execute()
+            now = time.time()
+            for key, value, pttl in zip(chunk, response[::2], response[1::2]):
+                if value is None or pttl in (0, -2):  # expiring now or expired since scan
+                    continue
+                expire_at = int(now + pttl / 1000) + 1 if pttl and pttl > 0 else 0  # 0 - no expiry
+                yield key, as_bytes(value), expire_at
+
+    count = write_snapshot(stream, iter_records())
+    logger.info('Снимок кеша выгружен', extra=dict(snapshot_records=count))
+    return count
+
+
+def read_snapshot(path: str) -> Iterator[SnapshotRecord]:
+    storage = SnapshotStorage(path)
+    try:
+        yield from storage.iter_records()
+    finally:
+        storage.close()
+
+
+def import_snapshot(cache_storage: Any, path: str, *, batch_size: int = 1000) -> int:
+    """Loads snapshot records into storage with pipelines, skipping expired ones. Returns loaded count."""
+    count = 0
+    now = time.time()
+    for chunk in chunked(read_snapshot(path), batch_size):
+        pipeline = cache_storage.pipeline(transaction=False)
+        for key, value, expire_at in chunk:
+            if not expire_at:
+                pipeline.set(key, value)
+            elif expire_at > now:
+                pipeline.set(key, value, ex=int(expire_at - now) or 1)
+            else:
+                continue
+            count += 1
+        pipeline.execute()
+    logger.info('Снимок кеша загружен', extra=dict(snapshot_records=count))
+    return count
+
+
+class ReadOnlyPipeline:
+    def set(self, key, value, ex=None, px=None):
+        pass
+
+    def execute(self) -> list:
+        return []
+
+
+class SnapshotStorage(StorageInterface):
+    """
+        Read-only StorageInterface over memory-mapped snapshot file, lookups are binary searches.
+        Writes are ignored, so services keep working with values refreshed on misses.
+        Empty file is empty snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.mmap: Union[mmap.mmap, bytes] = b''
+        self.index_offset, self.count = 0, 0
+        with open(path, 'rb') as snapshot_file:
+            if os.fstat(snapshot_file.fileno()).st_size == 0:  # empty file can't be memory-mapped
+                return
+            self.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(HEADER)] != HEADER or len(self.mmap) < len(HEADER) + FOOTER.size:
+            raise SnapshotFormatError(path)
+        self.index_offset, self.count, magic = FOOTER.unpack_from(self.mmap, len(self.mmap) - FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            raise SnapshotFormatError(path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        if isinstance(self.mmap, mmap.mmap):
+            self.mmap.close()
+
+    def _record_offset(self, index: int) -> int:
+        return OFFSET.unpack_from(self.mmap, self.index_offset + index * OFFSET.size)[0]
+
+    def _read_record(self, offset: int) -> SnapshotRecord:
+        key_length, value_length, expire_at = RECORD.unpack_from(self.mmap, offset)
+        key_start = offset + RECORD.size
+        value_start = key_start + key_length
+        return self.mmap[key_start:value_start], self.mmap[value_start:value_start + value_length], expire_at
+
+    def _read_key(self, offset: int) -> bytes:
+        key_length = RECORD.unpack_from(self.mmap, offset)[0]
+        return self.mmap[offset + RECORD.size:offset + RECORD.size + key_length]
+
+    def _find(self, key: Key) -> Optional[bytes]:
+        key = as_bytes(key)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._read_key(self._record_offset(middle)) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count:
+            return None
+        found_key, value, expire_at = self._read_record(self._record_offset(low))
+        if found_key != key or (expire_at and expire_at <= time.time()):
+            return None
+        return value
+
+    def iter_records(self) -> Iterator[SnapshotRecord]:
+        for index in range(self.count):
+            yield self._read_record(self._record_offset(index))
+
+    def get(self, key):
+        return self._find(key)
+
+    def mget(self, keys):
+        return [self._find(key) for key in keys]
+
+    def exists(self, *keys) -> int:
+        return sum(self._find(key) is not None for key in keys)
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        pass
+
+    def pipeline(self, transaction=True):
+        return ReadOnlyPipeline()
@@ -0,0 +1,61 @@
+from math import sqrt
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from .dataclasses import CoordinatesBatch
+
+PointTuple = Tuple[float, float]
+
+
+class NearestPointsIndex:
+    """
+        Nearest neighbour index for small static point sets, f.e. polygon exits.
+        Brute force scan is faster than tree structures for less than a few hundred points,
+        and doesn't require scipy. Query interface is compatible with scipy.spatial.KDTree.query.
+    """
+    chunk_size = 4096  # points per vectorized step in query_many, bounds temporary matrix size
+
+    def __init__(self, points: Sequence[PointTuple]):
+        self.points: List[PointTuple] = [(float(point[0]), float(point[1])) for point in points]
+        self.indexes = range(len(self.points))
+        self.latitudes = np.array([point[0] for point in self.points], dtype=np.float64)
+        self.longitudes = np.array([point[1] for point in self.points], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def query(self, point: PointTuple, k: int = 1) -> Tuple[List[float], List[int]]:
+        """Returns distances and indexes of k nearest points ordered by distance."""
+        latitude, longitude = point[0], point[1]
+        squared_distances = [
+            (lat - latitude) * (lat - latitude) + (lng - longitude) * (lng - longitude)
+            for lat, lng in self.points
+        ]
+        indexes = sorted(self.indexes, key=squared_distances.__getitem__)[:k]
+        return [sqrt(squared_distances[index]) for index in indexes], indexes
+
+    def query_many(self, points: Iterable[PointTuple], k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+            Batch version of query, vectorized with numpy.
+            Accepts CoordinatesBatch, (N, 2) array or iterable of points,
+            returns (N, k) arrays of distances and indexes.
+        """
+        if isinstance(points, CoordinatesBatch):
+            points = points.as_array()
+        points = np.asarray(points if isinstance(points, np.ndarray) else list(points), dtype=np.float64)
+        points = points.reshape(-1, 2)
+        k = min(k, len(self.points))
+        distances = np.empty((len(points), k), dtype=np.float64)
+        indexes = np.empty((len(points), k), dtype=np.intp)
+
+        for start in range(0, len(points), self.chunk_size):
+            chunk = points[start:start + self.chunk_size]
+            squared_distances = (chunk[:, 0, None] - self.latitudes) ** 2 + \
+                (chunk[:, 1, None] - self.longitudes) ** 2
+            nearest = np.argsort(squared_distances, axis=1, kind='stable')[:, :k]
+            indexes[start:start + len(chunk)] = nearest
+            distances[start:start + len(chunk)] = np.sqrt(
+                np.take_along_axis(squared_distances, nearest, axis=1)
+            )
+        return distances, indexes
@@ -0,0 +1,250 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .batch import chunked
+from .cache import CommandPipeline, StorageInterface
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+Value = Union[str, bytes, int, float]
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expire_at REAL) '
+    'WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expire_at ON cache (expire_at) WHERE expire_at IS NOT NULL',
+)
+MAX_VARIABLES = 500  # sqlite default limit is 999 variables per statement
+SCAN_COUNT = 1000  # keys per scan_iter query without count hint
+
+
+def as_key(key: Union[str, bytes]) -> str:
+    return key.decode() if isinstance(key, bytes) else key
+
+
+def as_value(value: Value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class SqliteStorage(StorageInterface):
+    """
+        Embedded persistent StorageInterface in single SQLite file, replacement of redis
+        for batch workers and edge deployments. WAL mode allows many concurrent reader
+        and writer processes, every thread uses own connection.
+        Expired rows are invisible for reads and are deleted by compact, optionally in background thread.
+    """
+
+    def __init__(self, path: str, *, timeout: float = 30.0, compaction_interval: Optional[float] = None):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+        self.compaction_thread: Optional[threading.Thread] = None
+        self.compaction_stop = threading.Event()
+        with self.transaction() as connection:
+            for statement in SCHEMA:
+                connection.execute(statement)
+        if compaction_interval:
+            self.start_compaction(compaction_interval)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():  # connections can't be shared after fork
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection, self.local.pid = connection, os.getpid()
+        return connection
+
+    def transaction(self) -> 'Transaction':
+        return Transaction(self.connection)
+
+    def atomic(self) -> 'Transaction':
+        """Commands inside the context run in one transaction."""
+        return self.transaction()
+
+    def get(self, key):
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND (expire_at IS NULL OR expire_at > ?)',
+            (as_key(key), time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def mget(self, keys: Sequence[Union[str, bytes]]) -> List[Optional[bytes]]:
+        keys = [as_key(key) for key in keys]
+        values = {}
+        now = time.time()
+        for chunk in chunked(keys, MAX_VARIABLES):
+            placeholders = ','.join('?' * len(chunk))
+            values.update(self.connection.execute(
+                'SELECT key, value FROM cache '
+                'WHERE key IN ({}) AND (expire_at IS NULL OR expire_at > ?)'.format(placeholders),
+                (*chunk, now),
+            ).fetchall())
+        return [values.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        """With nx sets only absent key, returns None if key exists, as redis does."""
+        if not nx:
+            self.set_many([(key, value, ex, px)])
+            return True
+        now = time.time()
+        expire_at = now + ex if ex else (now + px / 1000 if px else None)
+        with self.transaction() as connection:
+            exists = connection.execute(
+                'SELECT 1 FROM cache WHERE key = ? AND (expire_at IS NULL OR expire_at > ?)',
+                (as_key(key), now),
+            ).fetchone()
+            if exists:
+                return None
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                (as_key(key), as_value(value), expire_at),
+            )
+        return True
+
+    def set_many(self, items: Sequence[Tuple[Any, Value, Optional[float], Optional[float]]]) -> None:
+        """Sets (key, value, ex, px) items in one transaction."""
+        now = time.time()
+        rows = []
+        for key, value, ex, px in items:
+            expire_at = now + ex if ex else (now + px / 1000 if px else None)
+            rows.append((as_key(key), as_value(value), expire_at))
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)', rows,
+            )
+
+    def exists(self, *keys) -> int:
+        return sum(value is not None for value in self.mget(keys))
+
+    def delete(self, *keys) -> int:
+        with self.transaction() as connection:
+            return sum(
+                connection.execute('DELETE FROM cache WHERE key = ?', (as_key(key),)).rowcount for key in keys
+            )
+
+    def delete_if_equal(self, key, value) -> int:
+        """Atomically deletes key if it holds value, f.e. lease of its owner."""
+        with self.transaction() as connection:
+            return connection.execute(
+                'DELETE FROM cache WHERE key = ? AND value = ? AND (expire_at IS NULL OR expire_at > ?)',
+                (as_key(key), as_value(value), time.time()),
+            ).rowcount
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """Atomically sets key if lock_key holds token, see cache.set_if_equal."""
+        now = time.time()
+        expire_at = now + ex if ex else (now + px / 1000 if px else None)
+        with self.transaction() as connection:
+            held = connection.execute(
+                'SELECT 1 FROM cache WHERE key = ? AND value = ? AND (expire_at IS NULL OR expire_at > ?)',
+                (as_key(lock_key), as_value(token), now),
+            ).fetchone()
+            if not held:
+                return False
+            connection.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expire_at) VALUES (?, ?, ?)',
+                (as_key(key), as_value(value), expire_at),
+            )
+        return True
+
+    def pttl(self, key) -> int:
+        """Remaining time to live in milliseconds, -1 for key without expiry, -2 for absent key."""
+        row = self.connection.execute(
+            'SELECT expire_at FROM cache WHERE key = ? AND (expire_at IS NULL OR expire_at > ?)',
+            (as_key(key), time.time()),
+        ).fetchone()
+        if not row:
+            return -2
+        return -1 if row[0] is None else int((row[0] - time.time()) * 1000)
+
+    def ttl(self, key) -> int:
+        pttl = self.pttl(key)
+        return pttl if pttl < 0 else pttl // 1000
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None) -> Iterator[str]:
+        """
+            Supports 'prefix*' patterns only. Keys are read by count keys per query, as SCAN does,
+            so caller may run other commands between batches.
+        """
+        prefix = (match or '').rstrip('*')
+        count = count or SCAN_COUNT
+        query = (
+            'SELECT key FROM cache WHERE key {} ? AND (expire_at IS NULL OR expire_at > ?) '
+            'ORDER BY key LIMIT ?'
+        )
+        operator, start = '>=', prefix
+        while True:
+            rows = self.connection.execute(query.format(operator), (start, time.time(), count))
+            keys = [key for (key,) in rows]
+            for key in keys:
+                if not key.startswith(prefix):
+                    return
+                yield key
+            if len(keys) < count:
+                return
+            operator, start = '>', keys[-1]
+
+    def pipeline(self, transaction=True) -> CommandPipeline:
+        return CommandPipeline(self, transaction)
+
+    def flushall(self):
+        with self.transaction() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def compact(self) -> int:
+        """Deletes expired rows, returns deleted count."""
+        with self.transaction() as connection:
+            deleted = connection.execute('DELETE FROM cache WHERE expire_at <= ?', (time.time(),)).rowcount
+        logger.debug('Удалены просроченные записи кеша', extra=dict(cache_deleted=deleted))
+        return deleted
+
+    def start_compaction(self, interval: float) -> None:
+        """Starts daemon thread deleting expired rows every interval seconds."""
+        def compact_periodically():
+            while not self.compaction_stop.wait(interval):
+                try:
+                    self.compact()
+                except sqlite3.Error:
+                    logger.warning('Не удалось удалить просроченные записи кеша', exc_info=True)
+
+        self.compaction_stop.clear()
+        self.compaction_thread = threading.Thread(target=compact_periodically, daemon=True)
+        self.compaction_thread.start()
+
+    def close(self) -> None:
+        self.compaction_stop.set()
+        if self.compaction_thread:
+            self.compaction_thread.join()
+            self.compaction_thread = None
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+class Transaction:
+    """
+        Immediate write transaction, waits for other writers up to connection timeout.
+        Transaction inside already started one joins it, outer transaction commits or rolls back.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.nested = False
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.nested = self.connection.in_transaction
+        if not self.nested:
+            self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.nested:
+            self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,102 @@
+from typing import Any, List
+
+from .cache import StorageInterface, set_if_equal
+
+STALE_PREFIX = 'stale:'
+
+
+class StaleCopyStorage(StorageInterface):
+    """
+        Storage wrapper keeping copy of every written value under 'stale:<key>' for stale_ttl seconds,
+        which should be longer than cache TTLs. Deadline-aware calls (see deadline.get_within)
+        serve expired values from copies while they are refreshed in background.
+        Written keys and memory are doubled. Sets with nx (f.e. single-flight leases) are not copied.
+    """
+
+    def __init__(self, storage: Any, *, stale_ttl: int = 60 * 60 * 24 * 90):
+        self.storage = storage
+        self.stale_ttl = stale_ttl
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        if nx:
+            return self.storage.set(key, value, ex=ex, px=px, nx=True)
+        pipeline = self.pipeline(transaction=False)
+        pipeline.set(key, value, ex=ex, px=px)
+        return pipeline.execute()[0]
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """Copy is written after value, only if value was set."""
+        written = set_if_equal(self.storage, key, value, lock_key, token, ex=ex, px=px)
+        if written:
+            self.storage.set(stale_key(key), value, ex=self.stale_ttl)
+        return written
+
+    def get(self, key):
+        return self.storage.get(key)
+
+    def mget(self, keys):
+        return self.storage.mget(keys)
+
+    def pipeline(self, transaction=True) -> 'StaleCopyPipeline':
+        return StaleCopyPipeline(self, self.storage.pipeline(transaction=transaction))
+
+    def flushall(self):
+        return self.storage.flushall()
+
+    def stale_view(self) -> 'StaleView':
+        """Storage reading stale copies, for cache storage classes."""
+        return StaleView(self.storage)
+
+    def __getattr__(self, name: str) -> Any:
+        # exists, pttl, delete, scan_iter and other commands go to storage as is
+        if name.startswith('_') or name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+
+class StaleCopyPipeline:
+    """Adds stale copy set to every set, results of copies are dropped on execute."""
+
+    def __init__(self, storage: StaleCopyStorage, pipeline: Any):
+        self.storage = storage
+        self.pipeline = pipeline
+        self.copies: List[int] = []  # indexes of copy results
+        self.commands_count = 0
+
+    def set(self, key, value, ex=None, px=None):
+        self.pipeline.set(key, value, ex=ex, px=px)
+        self.pipeline.set(stale_key(key), value, ex=self.storage.stale_ttl)
+        self.copies.append(self.commands_count + 1)
+        self.commands_count += 2
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name in ('storage', 'pipeline'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            getattr(self.pipeline, name)(*args, **kwargs)
+            self.commands_count += 1
+            return self
+        return command
+
+    def execute(self) -> list:
+        copies, self.copies, self.commands_count = set(self.copies), [], 0
+        return [result for index, result in enumerate(self.pipeline.execute()) if index not in copies]
+
+
+class StaleView:
+    """Reads stale copies by keys of values."""
+
+    def __init__(self, storage: Any):
+        self.storage = storage
+
+    def get(self, key):
+        return self.storage.get(stale_key(key))
+
+    def mget(self, keys):
+        return self.storage.mget([stale_key(key) for key in keys])
+
+
+def stale_key(key: Any) -> str:
+    return STALE_PREFIX + (key.decode() if isinstance(key, bytes) else key)
@@ -0,0 +1,193 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from . import geometry
+from .batch import RateLimiter, chunked, run_concurrently
+from .cache import MISSING, CacheableServiceAbstract
+from .dataclasses import Coordinates
+from .geometry import METERS_PER_DEGREE
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+COORDINATES_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*[,; ]\s*(-?\d+(?:\.\d+)?)\s*$')
+
+Query = Union[str, Coordinates]
+
+
+def parse_query(line: str) -> Optional[Query]:
+    """Parses log line as 'latitude,longitude' coordinates or address string."""
+    line = line.strip()
+    if not line:
+        return None
+    match = COORDINATES_RE.match(line)
+    if match:
+        return Coordinates(float(match.group(1)), float(match.group(2)))
+    return line
+
+
+def count_queries(lines: Iterable[str]) -> Counter:
+    """Counts queries frequency in log lines."""
+    counter: Counter = Counter()
+    for line in lines:
+        query = parse_query(line)
+        if query is not None:
+            counter[query] += 1
+    return counter
+
+
+def iter_grid(south: float, west: float, north: float, east: float, step: float) -> Iterator[Coordinates]:
+    """Yields bounding box grid nodes, step meters apart in both directions."""
+    latitude = south
+    while latitude <= north:
+        longitude_step = step / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        longitude = west
+        while longitude <= east:
+            yield Coordinates(round(latitude, 7), round(longitude, 7))
+            longitude += longitude_step
+        latitude += step / METERS_PER_DEGREE
+
+
+class Budget:
+    """Thread safe counter of allowed provider calls, None is unlimited."""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self.limit is not None and self.spent >= self.limit
+
+    def take(self, count: int) -> int:
+        """Reserves up to count calls, returns reserved number."""
+        with self.lock:
+            if self.limit is not None:
+                count = max(min(count, self.limit - self.spent), 0)
+            self.spent += count
+            return count
+
+
+@dataclass
+class WarmupStats:
+    cached: int = 0
+    refreshed: int = 0
+    failed: int = 0
+    skipped: int = 0  # not refreshed because budget is exhausted
+
+    def add(self, other: 'WarmupStats') -> None:
+        self.cached += other.cached
+        self.refreshed += other.refreshed
+        self.failed += other.failed
+        self.skipped += other.skipped
+
+
+class CacheWarmer:
+    """
+        Fills cold cache before traffic arrives: replays past queries through cached services,
+        most frequent first, not faster than qps and not more provider calls than budget.
+    """
+
+    def __init__(
+            self,
+            *,
+            geocode_service: Optional[CacheableServiceAbstract] = None,
+            reverse_geocode_service: Optional[CacheableServiceAbstract] = None,
+            distance_calculators: Sequence[Any] = (),
+            qps: Optional[float] = None,
+            budget: Optional[int] = None,
+            workers: int = 4,
+            batch_size: int = 500,
+    ):
+        self.geocode_service = geocode_service
+        self.reverse_geocode_service = reverse_geocode_service
+        self.distance_calculators = list(distance_calculators)
+        self.rate_limiter = RateLimiter(qps)
+        self.budget = Budget(budget)
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def warm_service(self, service: CacheableServiceAbstract, keys: Iterable[Any]) -> WarmupStats:
+        """Refreshes not cached keys in given order until budget is exhausted."""
+        stats = WarmupStats()
+        storage = service.make_storage()
+        for chunk in chunked(keys, self.batch_size):
+            misses = [key for key, value in zip(chunk, storage.get_many(chunk)) if value is MISSING]
+            stats.cached += len(chunk) - len(misses)
+            allowed = self.budget.take(len(misses))
+            stats.skipped += len(misses) - allowed
+            misses = misses[:allowed]
+
+            refreshed = run_concurrently(
+                service.refresh_value, misses, workers=self.workers, rate_limiter=self.rate_limiter,
+            )
+            to_cache = [
+                (key, value) for key, value in zip(misses, refreshed) if not isinstance(value, Exception)
+            ]
+            stats.refreshed += len(to_cache)
+            stats.failed += len(misses) - len(to_cache)
+            if to_cache:
+                service.save_values(storage, to_cache)
+        return stats
+
+    def warm_distances(self, points: Sequence[Coordinates]) -> WarmupStats:
+        """Prefetches distances for points outside of calculators polygons."""
+        stats = WarmupStats()
+        for calculator in self.distance_calculators:
+            inside = geometry.contains_many(
+                calculator.polygon,
+                np.array([point.latitude for point in points], dtype=np.float64),
+                np.array([point.longitude for point in points], dtype=np.float64),
+            )
+            stats.add(self.warm_service(
+                calculator, [point for point, is_inside in zip(points, inside) if not is_inside],
+            ))
+        return stats
+
+    def warm_queries(
+            self,
+            queries: Counter,
+            *,
+            min_count: int = 1,
+            limit: Optional[int] = None,
+    ) -> WarmupStats:
+        """Warms cache for queries counter, most frequent queries first."""
+        ordered: List[Tuple[Query, int]] = [
+            (query, count) for query, count in queries.most_common(limit) if count >= min_count
+        ]
+        addresses = [query for query, _ in ordered if isinstance(query, str)]
+        points = [query for query, _ in ordered if isinstance(query, Coordinates)]
+
+        stats = WarmupStats()
+        if self.geocode_service and addresses:
+            stats.add(self.warm_service(self.geocode_service, addresses))
+        if self.reverse_geocode_service and points:
+            stats.add(self.warm_service(self.reverse_geocode_service, points))
+        if points:
+            stats.add(self.warm_distances(points))
+        logger.info(
+            'Кеш прогрет по истории запросов',
+            extra=dict(warmup_queries=len(ordered), warmup_stats=stats, warmup_spent=self.budget.spent)
+        )
+        return stats
+
+    def warm_grid(self, grid: Iterable[Coordinates]) -> WarmupStats:
+        """Prefetches distances for grid of popular area."""
+        stats = WarmupStats()
+        for chunk in chunked(grid, self.batch_size):
+            if self.budget.exhausted:
+                break
+            stats.add(self.warm_distances(chunk))
+        logger.info(
+            'Кеш расстояний прогрет по сетке',
+            extra=dict(warmup_stats=stats, warmup_spent=self.budget.spent)
+        )
+        return stats
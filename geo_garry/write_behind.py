@@ -0,0 +1,291 @@
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from dataclasses import dataclass
+
+from .cache import StorageInterface, set_if_equal
+
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+
+@dataclass
+class PendingWrite:
+    value: Any
+    options: Dict[str, Any]  # ex, px
+    expire_at: Optional[float]  # monotonic time, None - never expires
+
+
+@dataclass
+class WriteBehindStats:
+    queued: int = 0
+    coalesced: int = 0  # pending write replaced by newer one of the same key
+    written: int = 0
+    sync_writes: int = 0  # queue was full for block_timeout or storage is closed, written by caller
+    failed: int = 0
+
+
+def as_bytes(value: Any) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+class WriteBehindStorage(StorageInterface):  # pylint: disable=too-many-instance-attributes
+    """
+        Storage wrapper taking cache writes off request path: sets are queued in process
+        and written by background thread in pipelines of batch_size, at most flush_interval seconds later.
+        Reads of this process see its pending writes. Queue keeps max_pending keys, set waits for free place
+        up to block_timeout seconds and then writes synchronously. Pending writes are flushed
+        by close, which is also called at interpreter exit. Failed batches are logged and dropped.
+        Conditional sets (nx, xx) and deletes go to storage synchronously, after queued write of their keys.
+    """
+
+    def __init__(
+            self,
+            storage: Any,
+            *,
+            batch_size: int = 500,
+            flush_interval: float = 0.05,
+            max_pending: int = 10000,
+            block_timeout: float = 1.0,
+    ):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.pending: 'OrderedDict[Any, PendingWrite]' = OrderedDict()
+        self.in_flight: Dict[Any, PendingWrite] = {}
+        self.condition = threading.Condition()
+        self.flush_requests = 0
+        self.closed = False
+        self.stats = WriteBehindStats()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def pending_write(self, key: Any) -> Optional[PendingWrite]:
+        """Queued or being written value of key."""
+        with self.condition:
+            write = self.pending.get(key)
+            if write is None:
+                write = self.in_flight.get(key)
+        if write is not None and write.expire_at is not None and write.expire_at <= time.monotonic():
+            return None
+        return write
+
+    def set_if_equal(self, key, value, lock_key, token, ex=None, px=None) -> bool:
+        """Written at once, after queued writes of key, as conditional sets."""
+        self.settle([key])
+        return set_if_equal(self.storage, key, value, lock_key, token, ex=ex, px=px)
+
+    def set(self, key, value, ex=None, px=None, **kwargs):
+        options = {name: option for name, option in (('ex', ex), ('px', px)) if option}
+        if kwargs:
+            # result of conditional set tells if value was set, so it can't be queued
+            self.settle([key])
+            return self.storage.set(key, value, **options, **kwargs)
+        ttl = px / 1000 if px else ex
+        write = PendingWrite(value, options, time.monotonic() + ttl if ttl else None)
+        with self.condition:
+            has_place = key in self.pending or self.condition.wait_for(
+                lambda: len(self.pending) < self.max_pending or self.closed, self.block_timeout,
+            )
+            sync = self.closed or not has_place
+            if sync:
+                self.stats.sync_writes += 1
+            else:
+                if key in self.pending:
+                    self.stats.coalesced += 1
+                    del self.pending[key]  # newer write goes to the end of queue
+                self.pending[key] = write
+                self.stats.queued += 1
+                self.condition.notify_all()
+        if sync:
+            return self.storage.set(key, value, **options)
+        return True
+
+    def get(self, key):
+        write = self.pending_write(key)
+        if write is not None:
+            return as_bytes(write.value)
+        return self.storage.get(key)
+
+    def mget(self, keys):
+        keys = list(keys)
+        writes = [self.pending_write(key) for key in keys]
+        missing = [key for key, write in zip(keys, writes) if write is None]
+        stored = iter(self.storage.mget(missing) if missing else [])
+        return [next(stored) if write is None else as_bytes(write.value) for write in writes]
+
+    def exists(self, *keys) -> int:
+        missing = [key for key in keys if self.pending_write(key) is None]
+        found = len(keys) - len(missing)
+        return found + (self.storage.exists(*missing) if missing else 0)
+
+    def pttl(self, key) -> int:
+        write = self.pending_write(key)
+        if write is None:
+            return self.storage.pttl(key)
+        if write.expire_at is None:
+            return -1
+        return int((write.expire_at - time.monotonic()) * 1000)
+
+    def settle(self, keys: Iterable[Any]) -> None:
+        """Writes queued values of keys now and waits for their writes in flight, before commands on keys."""
+        keys = set(keys)
+        with self.condition:
+            writes = [(key, self.pending.pop(key)) for key in keys if key in self.pending]
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: keys.isdisjoint(self.in_flight))
+        for key, write in writes:
+            self.storage.set(key, write.value, **write.options)
+
+    def discard(self, keys: Iterable[Any]) -> None:
+        """Drops queued writes of keys and waits for their writes in flight, so deleted keys stay deleted."""
+        keys = set(keys)
+        with self.condition:
+            for key in keys:
+                self.pending.pop(key, None)
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: keys.isdisjoint(self.in_flight))
+
+    def delete(self, *keys):
+        self.discard(keys)
+        return self.storage.delete(*keys)
+
+    def pipeline(self, transaction=True) -> 'WriteBehindPipeline':
+        return WriteBehindPipeline(self)
+
+    def flushall(self):
+        with self.condition:
+            self.pending.clear()
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: not self.in_flight)
+        return self.storage.flushall()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until pending writes are written, returns False on timeout."""
+        with self.condition:
+            if self.closed:
+                return not self.pending
+            self.flush_requests += 1
+            self.condition.notify_all()
+            try:
+                return self.condition.wait_for(lambda: not self.pending and not self.in_flight, timeout)
+            finally:
+                self.flush_requests -= 1
+
+    def close(self) -> None:
+        """Writes pending values and stops background thread."""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def _take_batch(self) -> Optional[List[Tuple[Any, PendingWrite]]]:
+        """Waits for batch_size writes or flush_interval, None when closed and drained."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending or self.closed)
+            if not self.pending:
+                return None
+            deadline = time.monotonic() + self.flush_interval
+            while len(self.pending) < self.batch_size and not self.closed and not self.flush_requests:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = []
+            while self.pending and len(batch) < self.batch_size:
+                key, write = self.pending.popitem(last=False)
+                self.in_flight[key] = write
+                batch.append((key, write))
+            self.condition.notify_all()  # free place for waiting sets
+            return batch
+
+    def _write(self, batch: List[Tuple[Any, PendingWrite]]) -> None:
+        try:
+            pipeline_factory = getattr(self.storage, 'pipeline', None)
+            storage = pipeline_factory(transaction=False) if pipeline_factory else self.storage
+            for key, write in batch:
+                storage.set(key, write.value, **write.options)
+            if pipeline_factory:
+                storage.execute()
+        except Exception as exc:  # pylint: disable=broad-except
+            self.stats.failed += len(batch)
+            logger.warning(
+                'Не удалось записать значения кеша в фоне',
+                extra=dict(cache_keys_count=len(batch), error=repr(exc))
+            )
+        else:
+            self.stats.written += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._write(batch)
+            with self.condition:
+                for key, write in batch:
+                    if self.in_flight.get(key) is write:
+                        del self.in_flight[key]
+                self.condition.notify_all()
+
+    def __getattr__(self, name: str) -> Any:
+        # scan_iter, hgetall and other commands go to storage as is
+        if name.startswith('_') or name == 'storage':
+            raise AttributeError(name)
+        return getattr(self.storage, name)
+
+
+class WriteBehindPipeline:
+    """
+        Queues sets, reads of pending keys are answered from queue, other commands go to storage pipeline.
+        Queued writes of deleted keys are dropped.
+    """
+
+    def __init__(self, storage: WriteBehindStorage):
+        self.storage = storage
+        self.commands: List[Tuple[str, tuple, dict]] = []
+
+    def set(self, key, value, ex=None, px=None, **kwargs):
+        self.commands.append(('set', (key, value), dict(ex=ex, px=px, **kwargs)))
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        results: List[Any] = [None] * len(commands)
+        forwarded = []
+        for index, (name, args, kwargs) in enumerate(commands):
+            if name == 'set':
+                results[index] = self.storage.set(*args, **kwargs)
+                continue
+            if name == 'delete':
+                self.storage.discard(args)
+            elif name in ('get', 'exists', 'pttl') and len(args) == 1:
+                if self.storage.pending_write(args[0]) is not None:
+                    results[index] = getattr(self.storage, name)(args[0])
+                    continue
+            forwarded.append((index, name, args, kwargs))
+        if forwarded:
+            pipeline = self.storage.storage.pipeline(transaction=False)
+            for _, name, args, kwargs in forwarded:
+                getattr(pipeline, name)(*args, **kwargs)
+            for (index, _, _, _), result in zip(forwarded, pipeline.execute()):
+                results[index] = result
+        return results
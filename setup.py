@@ -12,7 +12,10 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://git.redmadrobot.com/Backend/geo_garry.git",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['tests', 'benchmarks']),
+    entry_points={
+        'console_scripts': ['geo-garry=geo_garry.cli:main'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3.6",
         "License :: OSI Approved :: MIT License",
@@ -22,7 +25,7 @@ setuptools.setup(
     ],
     install_requires=[
         'Shapely~=1.5',
-        'scipy~=1.1.0',
+        'numpy>=1.15',
         'dataclasses==0.6',
     ],
 )
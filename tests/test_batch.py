@@ -0,0 +1,35 @@
+import time
+
+from geo_garry.batch import RateLimiter, chunked, run_concurrently
+
+
+def test_chunked():
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_run_concurrently():
+    def func(item):
+        if item == 3:
+            raise ValueError(item)
+        return item * 10
+
+    result = run_concurrently(func, [1, 2, 3, 4], workers=3)
+    assert result[:2] == [10, 20]
+    assert isinstance(result[2], ValueError)
+    assert result[3] == 40
+    assert run_concurrently(func, [1], workers=1) == [10]
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=100)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+    assert time.monotonic() - start >= 0.045
+
+    unlimited = RateLimiter()
+    start = time.monotonic()
+    for _ in range(1000):
+        unlimited.wait()
+    assert time.monotonic() - start < 0.1
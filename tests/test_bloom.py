@@ -0,0 +1,90 @@
+from unittest import mock
+
+from geo_garry.bloom import BloomFilter, BloomGuardedStorage
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.distance import MkadDistanceCalculator
+
+
+def test_bloom_filter():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for index in range(1000):
+        bloom_filter.add('distance:{}'.format(index))
+    assert all('distance:{}'.format(index) in bloom_filter for index in range(1000))
+    false_positives = sum('geo:{}'.format(index) in bloom_filter for index in range(10000))
+    assert false_positives < 250
+
+
+def test_bloom_guarded_storage():
+    remote = mock.Mock(wraps=InMemoryStorage())
+    storage = BloomGuardedStorage(remote, capacity=1000, prefixes=['distance:'])
+
+    assert storage.get('distance:1,2') is None
+    assert storage.exists('distance:1,2') == 0
+    remote.get.assert_not_called()
+    remote.exists.assert_not_called()
+
+    storage.set('distance:1,2', 100, ex=10)
+    pipeline = storage.pipeline(transaction=False)
+    pipeline.set('distance:3,4', 200)
+    pipeline.execute()
+    assert storage.mget(['distance:1,2', 'distance:5,6', 'distance:3,4']) == [b'100', None, b'200']
+    remote.mget.assert_called_once_with(['distance:1,2', 'distance:3,4'])
+
+    assert storage.get('geo:1,2') is None  # not guarded
+    remote.get.assert_called_once_with('geo:1,2')
+    assert storage.pttl('distance:1,2') > 0
+    assert (storage.stats.lookups, storage.stats.skipped, storage.stats.false_positives) == (5, 3, 0)
+
+
+def test_bloom_guarded_storage_rebuild():
+    remote = InMemoryStorage()
+    remote.set('distance:1,2', 100)
+    remote.set('geo:1,2', '')
+    storage = BloomGuardedStorage(remote, capacity=1000, prefixes=['distance:'])
+    assert storage.get('distance:1,2') is None  # written by another process
+    assert storage.rebuild() == 1
+    assert storage.get('distance:1,2') == b'100'
+
+    storage.filter = mock.Mock(__contains__=mock.Mock(return_value=True))
+    assert storage.get('distance:7,8') is None
+    assert storage.stats.false_positives == 1
+    assert storage.stats.false_positive_rate == 0.5
+
+
+def test_bloom_guarded_storage_rebuild_keeps_concurrent_sets():
+    remote = InMemoryStorage()
+    remote.set('distance:1,2', 100)
+    storage = BloomGuardedStorage(remote, capacity=1000, prefixes=['distance:'])
+
+    def scan():
+        yield from remote.scan_iter(match='distance:*')
+        storage.set('distance:3,4', 200)  # set by another thread after its key was scanned
+        storage.pipeline().set('distance:5,6', 300).execute()
+
+    assert storage.rebuild(scan) == 3
+    assert storage.mget(['distance:1,2', 'distance:3,4', 'distance:5,6']) == [b'100', b'200', b'300']
+    assert storage.building is None
+
+
+def test_bloom_guarded_distance_calculator():
+    remote = mock.Mock(wraps=InMemoryStorage())
+    calculator = MkadDistanceCalculator(BloomGuardedStorage(remote), gmaps_client=None)
+    calculator.refresh_value = mock.Mock(return_value=1500)
+    point = Coordinates(55.5, 37.0)
+
+    assert calculator.calc_distance(point) == 1500
+    assert calculator.calc_distance(point) == 1500
+    calculator.refresh_value.assert_called_once_with(point)
+    assert remote.get.call_count == 1
+
+
+def test_bloom_guarded_storage_passes_other_keys_by_default():
+    remote = InMemoryStorage()
+    storage = BloomGuardedStorage(remote, capacity=1000)
+    remote.incrbyfloat('costs:daily', 0.5)  # written by another process or command
+    remote.set('lock:{distance:1,2}', 'token')
+    assert storage.get('costs:daily') == b'0.5'
+    assert storage.exists('lock:{distance:1,2}') == 1
+    assert storage.get('distance:1,2') is None
+    assert storage.stats.skipped == 1
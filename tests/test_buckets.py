@@ -0,0 +1,84 @@
+import io
+import time
+from unittest import mock
+
+from geo_garry import snapshot
+from geo_garry.buckets import BucketedStorage
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates, CoordinatesAddress
+from geo_garry.distance import MkadDistanceCalculator
+from geo_garry.gmaps.geocode import GmapsCacheableReverseGeocodeService
+
+
+def test_bucketed_storage():
+    remote = InMemoryStorage()
+    storage = BucketedStorage(remote, cell_size=0.01)
+
+    storage.set('distance:55.75123,37.61845', 1200, ex=100)
+    storage.set('distance:55.75923,37.61001', 1300, ex=100)
+    storage.set('distance:55.76123,37.61845', 1400)
+    storage.set('coordinates:Moscow', '55.7,37.6', ex=100)
+    assert sorted(remote.data) == [
+        'coordinates:Moscow', 'distance:cell:5575:3761', 'distance:cell:5576:3761',
+    ]
+    assert 99000 < remote.pttl('distance:cell:5575:3761') <= 100000
+
+    assert storage.get('distance:55.75123,37.61845') == b'1200'
+    assert storage.get('distance:55.75123,37.61846') is None
+    assert storage.get('coordinates:Moscow') == b'55.7,37.6'
+    assert storage.mget(['distance:55.75923,37.61001', 'coordinates:Moscow', 'geo:1,2']) == [
+        b'1300', b'55.7,37.6', None,
+    ]
+    assert storage.exists('distance:55.75123,37.61845', 'distance:1,2', 'coordinates:Moscow') == 2
+    assert 99000 < storage.pttl('distance:55.75123,37.61845') <= 100000
+    assert storage.pttl('distance:55.76123,37.61845') == -1
+    assert storage.pttl('distance:1,2') == -2
+
+    assert storage.get_cell('distance', 55.755, 37.615) == {
+        'distance:55.75123,37.61845': b'1200', 'distance:55.75923,37.61001': b'1300',
+    }
+    assert sorted(storage.scan_iter(match='distance:*')) == [
+        'distance:55.75123,37.61845', 'distance:55.75923,37.61001', 'distance:55.76123,37.61845',
+    ]
+    assert list(storage.scan_iter(match='coordinates:*')) == ['coordinates:Moscow']
+
+    assert storage.delete('distance:55.75123,37.61845', 'coordinates:Moscow', 'distance:1,2') == 2
+    assert storage.mget(['distance:55.75123,37.61845', 'coordinates:Moscow']) == [None, None]
+    assert storage.get('distance:55.75923,37.61001') == b'1300'
+
+
+def test_bucketed_storage_logical_ttl():
+    remote = InMemoryStorage()
+    storage = BucketedStorage(remote)
+    storage.set('geo:55.7512,37.6184', 'old', ex=100)
+    storage.set('geo:55.7513,37.6184', 'expiring', ex=100)
+    remote.hset('geo:cell:5575:3761', '55.7513,37.6184', b'%d|expiring' % (time.time() - 1))
+
+    assert storage.get('geo:55.7513,37.6184') is None
+    assert list(remote.hgetall('geo:cell:5575:3761')) == [b'55.7512,37.6184']  # deleted by read
+
+    remote.hset('geo:cell:5575:3761', '55.7514,37.6184', b'%d|expiring' % (time.time() - 1))
+    assert storage.mget(['geo:55.7512,37.6184', 'geo:55.7514,37.6184']) == [b'old', None]
+    assert storage.exists('geo:55.7514,37.6184') == 0
+    remote.hset('geo:cell:5575:3761', '55.7515,37.6184', b'%d|expiring' % (time.time() - 1))
+    assert storage.get_cell('geo', 55.7512, 37.6184) == {'geo:55.7512,37.6184': b'old'}
+    assert list(remote.hgetall('geo:cell:5575:3761')) == [b'55.7512,37.6184']
+
+
+def test_bucketed_storage_with_services():
+    storage = BucketedStorage(InMemoryStorage())
+    calculator = MkadDistanceCalculator(storage, gmaps_client=None)
+    calculator.refresh_value = mock.Mock(return_value=1500)
+    assert calculator.calc_distance(Coordinates(55.5, 37.0)) == 1500
+    assert calculator.calc_distance(Coordinates(55.5, 37.0)) == 1500
+    calculator.refresh_value.assert_called_once()
+
+    service = GmapsCacheableReverseGeocodeService(storage=storage, api=mock.Mock())
+    service.refresh_value = mock.Mock(return_value=CoordinatesAddress(55.5, 37.0, 'address'))
+    points = [Coordinates(55.5, 37.0), Coordinates(55.50001, 37.0), Coordinates(55.6, 37.1)]
+    assert service.get_address_many(points) == ['address'] * 3
+    assert service.get_address_many(points) == ['address'] * 3
+    assert service.refresh_value.call_count == 2
+
+    stream = io.BytesIO()
+    assert snapshot.export_snapshot(storage, stream) == 3
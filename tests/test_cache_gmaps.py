@@ -1,6 +1,10 @@
 from unittest import mock
 
-from geo_garry.cache import CacheableServiceAbstract
+import pytest
+
+from geo_garry.cache import (
+    MISSING, CacheableServiceAbstract, CacheValueNotFound, InMemoryStorage, StorageInterface,
+)
 from geo_garry.dataclasses import Coordinates, CoordinatesAddress
 from geo_garry.gmaps.cache import CacheStorageCoordinates, CacheStorageAddress
 
@@ -40,11 +44,18 @@ def test_cache_storage_coordinates():
     set_mock.assert_called_once_with('coordinates:address1', '1,2', ex=2592000)
 
     reset_mocks()
-    get_mock.return_value = None
-    exists_mock.return_value = True
-    assert service.get('address1') is None
+    refresh_mock.return_value = None
+    assert service.get('nowhere') is None
+    set_mock.assert_called_once_with('coordinates:nowhere', '', ex=2592000)  # readable by older versions
+
+    reset_mocks()
+    for empty_value in (b'', b'\x00'):
+        get_mock.return_value = empty_value
+        assert service.get('nowhere') is None
     refresh_mock.assert_not_called()
     set_mock.assert_not_called()
+    exists_mock.assert_not_called()
+    assert service.storage is service.storage
 
     get_mock.return_value = b'1,2'
     assert service.get('address1') == Coordinates(1, 2)
@@ -91,3 +102,135 @@ def test_cache_storage_address():
     assert service.get(Coordinates(1, 2)) == CoordinatesAddress(5, 7, 'address2', None, 1)
     refresh_mock.assert_not_called()
     set_mock.assert_not_called()
+
+    storage = CacheStorageAddress(mock.Mock(), cell_size=10)
+    assert storage.get_key(Coordinates(59.95007, 30.30501)) == 'geo:59.9500539,30.3049557'
+    assert storage.get_key(Coordinates(59.95003, 30.30493)) == 'geo:59.9500539,30.3049557'
+    assert storage.get_key(Coordinates(59.94998, 30.30501)) == 'geo:59.9499641,30.3050529'
+
+
+def test_cache_storage_coordinates_many():
+    refresh_mock = mock.Mock(name='refresh')
+    pipeline_mock = mock.Mock(name='pipeline')
+    storage_mock = mock.Mock(
+        mget=mock.Mock(return_value=[b'1,2', None, b'', None]),
+        pipeline=mock.Mock(return_value=pipeline_mock),
+    )
+
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            return refresh_mock(key)
+
+    def refresh(key):
+        if key == 'broken':
+            raise ValueError(key)
+        return Coordinates(3, 4)
+
+    refresh_mock.side_effect = refresh
+    service = TestService(storage=storage_mock)
+    addresses = ['address1', 'address2', 'address1', 'empty', 'broken', 'address2']
+
+    assert service.get_many(addresses, workers=2) == [
+        Coordinates(1, 2), Coordinates(3, 4), Coordinates(1, 2), None, None, Coordinates(3, 4),
+    ]
+    storage_mock.mget.assert_called_once_with([
+        'coordinates:address1', 'coordinates:address2', 'coordinates:empty', 'coordinates:broken',
+    ])
+    storage_mock.get.assert_not_called()
+    assert sorted(call[0][0] for call in refresh_mock.call_args_list) == ['address2', 'broken']
+    storage_mock.pipeline.assert_called_once_with(transaction=False)
+    pipeline_mock.set.assert_called_once_with('coordinates:address2', '3,4', ex=2592000)
+    pipeline_mock.execute.assert_called_once_with()
+    storage_mock.set.assert_not_called()
+
+    storage_mock.mget.return_value = [None]
+    result = service.get_many(['broken'], return_exceptions=True)
+    assert isinstance(result[0], ValueError)
+
+
+def test_cache_storage_coordinates_many_without_bulk_commands():
+    class DictStorage(StorageInterface):
+        def __init__(self):
+            self.values = {}
+
+        def get(self, key):
+            return self.values.get(key)
+
+        def set(self, key, value, ex=None):
+            self.values[key] = value.encode()
+
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            return Coordinates(3, 4)
+
+    storage = DictStorage()
+    storage.values['coordinates:cached'] = b'1,2'
+    service = TestService(storage=storage)
+    assert service.get_many(['cached', 'new']) == [Coordinates(1, 2), Coordinates(3, 4)]
+    assert storage.values['coordinates:new'] == b'3,4'
+
+
+def test_cache_storage_coordinates_hashed_keys():
+    storage = InMemoryStorage()
+    storage.set('coordinates:Москва,  Тверская 1', '1,2')
+    storage.set('coordinates:empty', '')
+
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            return Coordinates(3, 4)
+
+    hashed = TestService(storage=storage, storage_options=dict(key_scheme='hashed'))
+    cache_storage = hashed.make_storage()
+    key = cache_storage.get_key('москва, тверская 1')
+    assert key == cache_storage.get_key('Москва,  Тверская 1')
+    assert len(key) == len('coordinates:#') + 32
+
+    assert hashed.get('Москва,  Тверская 1') == Coordinates(3, 4)  # raw keys are not read
+    assert storage.get(key) == 'москва, тверская 1\n3,4'.encode()
+    storage.set(key, 'другой адрес\n5,6')  # digest collision
+    with pytest.raises(CacheValueNotFound):
+        cache_storage.get('Москва, Тверская 1')
+    assert cache_storage.get_many(['Москва, Тверская 1']) == [MISSING]
+
+    dual = TestService(storage=storage, storage_options=dict(key_scheme='dual'))
+    storage.delete(key)
+    assert dual.get_many(['Москва,  Тверская 1', 'empty', 'new']) == [
+        Coordinates(1, 2), None, Coordinates(3, 4),
+    ]
+    assert dual.get('empty') is None
+    assert storage.get(dual.make_storage().get_key('new')) == b'new\n3,4'
+
+    with pytest.raises(ValueError):
+        TestService(storage=storage, storage_options=dict(key_scheme='md5')).make_storage()
+
+
+def test_cache_storage_coordinates_normalized_keys():
+    storage = InMemoryStorage()
+    refreshed = []
+
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            refreshed.append(key)
+            return Coordinates(1, 2)
+
+    service = TestService(storage=storage, storage_options=dict(normalize=True))
+    assert service.make_storage().get_key('г. Москва, ул. Ленина 5') == 'coordinates:москва, 5 ленина улица'
+    assert service.get_many(['г. Москва, ул. Ленина 5', 'Москва, ул Ленина, д.5']) == [Coordinates(1, 2)] * 2
+    assert service.get('МОСКВА, Ленина улица, дом 5') == Coordinates(1, 2)
+    assert refreshed == ['г. Москва, ул. Ленина 5']  # provider gets address as is
+
+    dual = TestService(storage=storage, storage_options=dict(key_scheme='dual', normalize=True))
+    storage.set('coordinates:Мира 1', '3,4')
+    assert dual.get('Мира 1') == Coordinates(3, 4)  # raw key of existing cache
+    cache_storage = dual.make_storage()
+    assert cache_storage.get_key('ул. Мира, 1') == cache_storage.get_key('Мира улица 1')
+    assert dual.get('ул. Мира, 1') == Coordinates(1, 2)
+    assert storage.get(cache_storage.get_key('Мира ул. 1')) == '1 мира улица\n1,2'.encode()
@@ -0,0 +1,135 @@
+import json
+from unittest import mock
+
+import pytest
+
+from geo_garry import cli
+from geo_garry.dataclasses import Coordinates, CoordinatesAddress
+
+
+def make_pipeline(operations):
+    geocoder = mock.Mock()
+    geocoder.get_coordinates_many.side_effect = lambda addresses, **kwargs: [
+        Coordinates(55.0, 37.0) if address else ValueError('empty') for address in addresses
+    ]
+    geocoder.reverse_geocode_service.get_many.side_effect = lambda points, **kwargs: [
+        CoordinatesAddress(point.latitude, point.longitude, 'address', 'city', 77) for point in points
+    ]
+    mkad = mock.Mock(get_distance=mock.Mock(return_value=12))
+    return cli.Pipeline(operations, geocoder=geocoder, mkad_calculator=mkad, workers=2)
+
+
+def test_pipeline():
+    pipeline = make_pipeline(['geocode', 'federal_code', 'mkad'])
+    records = pipeline.process([{'address': 'Moscow', 'id': 1}, {'address': '', 'id': 2}])
+    assert records[0] == {
+        'address': 'Moscow', 'id': 1,
+        'geo_latitude': 55.0, 'geo_longitude': 37.0,
+        'geo_federal_code': 77, 'mkad_distance': 12, 'geo_error': None,
+    }
+    assert records[1]['geo_latitude'] is None
+    assert records[1]['geo_error'] == 'geocode: empty address; no coordinates'
+    pipeline.geocoder.get_coordinates_many.assert_called_once_with(
+        ['Moscow'], workers=2, qps=None, return_exceptions=True,
+    )
+    assert pipeline.fields == [
+        'geo_latitude', 'geo_longitude', 'geo_federal_code', 'mkad_distance', 'geo_error',
+    ]
+
+
+def test_run_csv_with_resume(tmpdir):
+    input_path = str(tmpdir.join('input.csv'))
+    output_path = str(tmpdir.join('output.csv'))
+    with open(input_path, 'w') as input_file:
+        input_file.write('id,latitude,longitude\n')
+        for index in range(5):
+            input_file.write('{},55.{},37.{}\n'.format(index, index, index))
+
+    pipeline = make_pipeline(['reverse'])
+    assert cli.run(pipeline, input_path, output_path, chunk_size=2, progress=None) == 5
+    with open(output_path) as output_file:
+        expected = output_file.read()
+    assert expected.splitlines()[:2] == [
+        'id,latitude,longitude,geo_address,geo_error', '0,55.0,37.0,address,',
+    ]
+
+    # crash after the first chunk: checkpoint saved, garbage written after it
+    checkpoint = cli.Checkpoint(output_path + '.checkpoint')
+    checkpoint.records = 2
+    checkpoint.output_offset = len('\n'.join(expected.splitlines()[:3]) + '\n')
+    checkpoint.save()
+    with open(output_path, 'r+') as output_file:
+        output_file.truncate(checkpoint.output_offset)
+        output_file.seek(checkpoint.output_offset)
+        output_file.write('2,55.2,37')
+
+    pipeline = make_pipeline(['reverse'])
+    assert cli.run(pipeline, input_path, output_path, chunk_size=2, resume=True, progress=None) == 3
+    with open(output_path) as output_file:
+        assert output_file.read() == expected
+    assert pipeline.geocoder.reverse_geocode_service.get_many.call_count == 2
+
+
+def test_run_csv_keeps_header_columns(tmpdir):
+    input_path = str(tmpdir.join('input.csv'))
+    output_path = str(tmpdir.join('output.csv'))
+    with open(input_path, 'w', encoding='utf-8') as input_file:
+        input_file.write('id,latitude,longitude\n0,,\n1,55.1,37.1\n2,55.2,37.2\n3,55.3,37.3\n')
+
+    # the first record without coordinates gets no geo_address, columns still follow header
+    assert cli.run(make_pipeline(['reverse']), input_path, output_path, chunk_size=2, progress=None) == 4
+    with open(output_path, encoding='utf-8') as output_file:
+        assert output_file.read().splitlines()[:3] == [
+            'id,latitude,longitude,geo_address,geo_error', '0,,,,no coordinates', '1,55.1,37.1,address,',
+        ]
+
+    # output written by version with another columns order is resumed with its header
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        output_file.write('geo_error,geo_address,id,latitude,longitude\n')
+        output_file.write('no coordinates,,0,,\n,address,1,55.1,37.1\n')
+        offset = output_file.tell()
+    checkpoint = cli.Checkpoint(output_path + '.checkpoint')
+    checkpoint.records, checkpoint.output_offset = 2, offset
+    checkpoint.save()
+    assert cli.run(
+        make_pipeline(['reverse']), input_path, output_path, chunk_size=2, resume=True, progress=None,
+    ) == 2
+    with open(output_path, encoding='utf-8') as output_file:
+        assert output_file.read().splitlines()[3:] == [',address,2,55.2,37.2', ',address,3,55.3,37.3']
+
+
+def test_run_jsonl(tmpdir):
+    input_path = str(tmpdir.join('input.jsonl'))
+    output_path = str(tmpdir.join('output.jsonl'))
+    with open(input_path, 'w') as input_file:
+        input_file.write('{"address": "Moscow"}\n\n{"address": "Тверь"}\n')
+
+    cli.run(make_pipeline(['geocode']), input_path, output_path, progress=None)
+    with open(output_path) as output_file:
+        records = [json.loads(line) for line in output_file]
+    assert records == [
+        {'address': 'Moscow', 'geo_latitude': 55.0, 'geo_longitude': 37.0, 'geo_error': None},
+        {'address': 'Тверь', 'geo_latitude': 55.0, 'geo_longitude': 37.0, 'geo_error': None},
+    ]
+
+
+def test_parser():
+    args = cli.make_parser().parse_args([
+        'process', 'in.csv', 'out.csv', '--operations', 'geocode,mkad', '--qps', '10', '--resume',
+    ])
+    assert args.handler == cli.command_process
+    assert args.operations == 'geocode,mkad'
+    assert args.qps == 10
+    assert args.resume
+
+
+def test_open_storage(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    with cli.open_storage('sqlite:///' + path) as storage:
+        assert storage.path == path
+        assert storage.compaction_thread.is_alive()
+        thread = storage.compaction_thread
+    assert not thread.is_alive()
+    for url in ['sqlite://cache.db', 'sqlite://', 'memcached://localhost']:
+        with pytest.raises(ValueError):
+            cli.make_storage(url)
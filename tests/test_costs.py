@@ -0,0 +1,133 @@
+from unittest import mock
+
+import pytest
+
+from geo_garry import distance, geocode
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.api import GoogleMapsApi
+from geo_garry.gmaps.costs import (
+    CACHE_ONLY, NORMAL, REDUCED, BudgetExhausted, CostAccountant, caller_tag,
+)
+
+
+def test_cost_accountant_rolling_budgets():
+    now = [0.0]
+    accountant = CostAccountant(
+        prices=dict(geocode=0.01), daily_budget=0.06, monthly_budget=1.0, clock=lambda: now[0],
+    )
+    assert accountant.level == NORMAL
+    with caller_tag('checkout'):
+        assert accountant.record('geocode') == 0.01
+        accountant.record('distance_matrix', 7)
+    accountant.record('geocode')
+    assert accountant.level == REDUCED  # 0.055 of 0.06 daily budget
+    now[0] += 3600 * 23
+    accountant.record('geocode')
+    assert accountant.level == CACHE_ONLY
+    now[0] += 3600 * 2  # spend of the first hour is out of daily window
+    assert accountant.spent(24) == pytest.approx(0.01)
+    assert accountant.spent(24 * 30) == pytest.approx(0.065)
+    assert accountant.level == NORMAL
+
+    report = accountant.report()
+    assert report['level'] == 'normal'
+    assert report['endpoints']['geocode'] == dict(requests=3, units=3, cost=pytest.approx(0.03))
+    assert report['endpoints']['distance_matrix'] == dict(requests=1, units=7, cost=pytest.approx(0.035))
+    assert report['tags']['checkout']['geocode']['requests'] == 1
+    assert report['tags']['untagged']['geocode']['requests'] == 2
+    now[0] += 3600 * 24 * 30
+    accountant.record('geocode')
+    assert len(accountant.buckets) == 1
+
+
+def test_cost_accountant_shared_budget():
+    now = [3600.0 * 1000]
+    storage = InMemoryStorage()
+
+    def make_accountant():
+        return CostAccountant(
+            prices=dict(geocode=0.01), daily_budget=0.045, storage=storage, clock=lambda: now[0],
+        )
+    worker, other = make_accountant(), make_accountant()
+    assert other.level == NORMAL
+    storage.mget = mock.Mock(wraps=storage.mget)
+    for _ in range(4):
+        worker.record('geocode')
+    assert worker.level == REDUCED
+    assert storage.mget.call_count == 1  # own costs are added to spend read for level_ttl seconds
+    assert storage.get('costs:1000') == b'0.04'
+    assert 0 < storage.pttl('costs:1000') <= 721 * 3600 * 1000
+    assert other.level == NORMAL  # cached for level_ttl seconds
+    now[0] += 5
+    assert other.level == REDUCED
+    other.record('geocode')
+    assert other.level == CACHE_ONLY
+    assert make_accountant().spent(24) == pytest.approx(0.05)  # spend survives restart
+    assert other.report()['endpoints']['geocode']['requests'] == 1  # totals are per process
+
+    storage.mget = mock.Mock(side_effect=ConnectionError('storage is down'))
+    now[0] += 5
+    assert worker.spent(24) == pytest.approx(0.04)  # spend of this process
+
+
+def test_failed_requests_are_counted():
+    gmaps_client = mock.Mock()
+    gmaps_client.geocode.side_effect = ValueError('unexpected response')
+    accountant = CostAccountant()
+    with pytest.raises(ValueError):
+        GoogleMapsApi(gmaps_client, accountant).get_coordinates('Москва')
+    assert accountant.report()['endpoints']['geocode']['requests'] == 1
+
+
+def test_distance_degrades_with_budget():
+    gmaps_client = mock.Mock()
+    gmaps_client.distance_matrix.return_value = {'rows': [{'elements': [{'distance': {'value': 21000}}]}]}
+    accountant = CostAccountant(daily_budget=0.08)
+    storage = InMemoryStorage()
+    calculator = distance.MkadDistanceCalculator(storage, gmaps_client, accountant)
+
+    assert calculator.get_distance(Coordinates(55.5, 37.9)) == 21
+    assert calculator.get_distance(Coordinates(55.5, 38.0)) == 21
+    assert accountant.level == REDUCED
+    assert calculator.get_distance(Coordinates(55.5, 38.1)) == 21
+    assert len(gmaps_client.distance_matrix.call_args[1]['origins']) == 3
+    assert accountant.level == CACHE_ONLY
+
+    estimate = calculator.get_distance(Coordinates(55.5, 38.2))
+    assert 30 < estimate < 50
+    assert gmaps_client.distance_matrix.call_count == 3
+    assert storage.get('distance:55.5,38.2') is None  # estimate is not cached
+    assert calculator.get_distance(Coordinates(55.5, 37.9)) == 21  # cached values are still served
+    with pytest.raises(BudgetExhausted):
+        GoogleMapsApi(gmaps_client, accountant).get_driving_path((1, 2), (3, 4))
+    assert accountant.report()['endpoints']['distance_matrix']['units'] == 17
+
+
+@mock.patch('geo_garry.gmaps.geocode.OpenStreetMapsApi')
+def test_geocoder_degrades_with_budget(osm_mock):
+    gmaps_client = mock.Mock()
+    gmaps_client.reverse_geocode.return_value = []
+    accountant = CostAccountant(prices=dict(reverse_geocode=1.0), daily_budget=2.0)
+    storage = InMemoryStorage()
+    geocoder = geocode.GoogleGeocoder(
+        storage=storage, gmaps_client=gmaps_client, accountant=accountant, osm_fallback=True,
+    )
+    with caller_tag('reports'):
+        assert geocoder.get_address_many([Coordinates(1.0, 2.0), Coordinates(3.0, 4.0)], workers=2) == [
+            None, None,
+        ]
+    assert accountant.report()['tags']['reports']['reverse_geocode']['requests'] == 2
+    assert accountant.level == CACHE_ONLY
+
+    osm_mock.return_value.reverse.return_value = 'Севастополь, улица Ленина, 1'
+    sevastopol = Coordinates(44.5724, 33.5461)
+    assert geocoder.get_address(sevastopol) == 'Севастополь, улица Ленина, 1'
+    assert geocoder.get_federal_code(sevastopol) == 92
+    assert geocoder.get_federal_code_many([sevastopol, Coordinates(1.0, 2.0)]) == [92, None]
+    assert geocoder.get_coordinates('Москва') is None
+    assert geocoder.get_geo('Москва') is None
+    assert gmaps_client.reverse_geocode.call_count == 2
+    gmaps_client.geocode.assert_not_called()
+    assert storage.get('geo:44.5724,33.5461') is None
+    assert storage.get('coordinates:Москва') is None
@@ -0,0 +1,48 @@
+import pickle
+from array import array
+
+import numpy as np
+import pytest
+
+from geo_garry import geometry, polygons, distance
+from geo_garry.dataclasses import Coordinates, CoordinatesAddress, CoordinatesBatch
+
+
+def test_slotted_coordinates():
+    coordinates = Coordinates(1.5, 2.5)
+    assert not hasattr(coordinates, '__dict__')
+    assert coordinates == Coordinates(1.5, 2.5)
+    assert {coordinates: 1}[Coordinates(1.5, 2.5)] == 1
+    assert pickle.loads(pickle.dumps(coordinates)) == coordinates
+
+    address = CoordinatesAddress(1, 2, 'address')
+    assert not hasattr(address, '__dict__')
+    assert address == CoordinatesAddress(1, 2, 'address', None, None)
+    assert pickle.loads(pickle.dumps(address)) == address
+    assert address.as_str() == '1,2;address;;'
+
+    with pytest.raises(AttributeError):
+        coordinates.latitude = 3
+
+
+def test_coordinates_batch():
+    buffer = array('d', [55.6892209716432, 37.752854389528585, 50.4254225, 36.9020654, 1, 2])
+    batch = CoordinatesBatch.from_buffer(buffer)
+    assert len(batch) == 3
+    buffer[5] = 3
+    assert batch[2] == Coordinates(1, 3)  # zero-copy view
+    assert list(batch[:2]) == [
+        Coordinates(55.6892209716432, 37.752854389528585),
+        Coordinates(50.4254225, 36.9020654),
+    ]
+    assert batch[1:] == CoordinatesBatch([50.4254225, 1], [36.9020654, 3])
+    assert batch.as_tuples()[2] == (1, 3)
+    assert batch.as_array().shape == (3, 2)
+    assert CoordinatesBatch.from_points([Coordinates(1, 3), (2, 4)]) == CoordinatesBatch([1, 2], [3, 4])
+
+    assert geometry.contains_many(polygons.MKAD_POLYGON, batch).tolist() == [True, False, False]
+    _, indexes = distance.MKAD_TREE.query_many(batch, k=2)
+    assert indexes.shape == (3, 2)
+
+    with pytest.raises(ValueError):
+        CoordinatesBatch(np.zeros(2), np.zeros(3))
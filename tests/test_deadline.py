@@ -0,0 +1,160 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from geo_garry import distance, geocode
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.deadline import (
+    BACKGROUND_CALLS, CACHED, ESTIMATE, FRESH, NEARBY, STALE, BackgroundCalls, Deadline, DeadlineExceeded,
+    call_within,
+)
+from geo_garry.gmaps.costs import NORMAL
+from geo_garry.stale import StaleCopyStorage
+
+ADDRESS_COMPONENTS = [
+    {'long_name': '9а', 'short_name': '9а', 'types': ['street_number']},
+    {'long_name': 'улица Профессора Качалова', 'short_name': 'ул. Профессора Качалова', 'types': ['route']},
+    {'long_name': 'Санкт-Петербург', 'short_name': 'СПБ', 'types': ['locality', 'political']},
+]
+ADDRESS = 'Санкт-Петербург, улица Профессора Качалова, 9а'
+
+
+def wait_background():
+    for future in list(BACKGROUND_CALLS.calls.values()):
+        future.result(5)
+
+
+def slow_client(released: threading.Event) -> mock.Mock:
+    def reverse_geocode(*args, **kwargs):
+        released.wait(5)
+        return [{'address_components': ADDRESS_COMPONENTS}]
+
+    def distance_matrix(**kwargs):
+        released.wait(5)
+        return {'rows': [{'elements': [{'distance': {'value': 21000}}]}]}
+    gmaps_client = mock.Mock()
+    gmaps_client.reverse_geocode.side_effect = reverse_geocode
+    gmaps_client.distance_matrix.side_effect = distance_matrix
+    gmaps_client.geocode.side_effect = lambda *args, **kwargs: released.wait(5) and []
+    return gmaps_client
+
+
+def test_deadline_qualities():
+    deadline = Deadline(10)
+    assert deadline.quality is None and not deadline.degraded and not deadline.expired
+    assert deadline.serve(1, CACHED).value == 1
+    assert not deadline.degraded
+    assert deadline.serve(2, NEARBY).degraded
+    deadline.serve(3, FRESH)
+    assert (deadline.quality, deadline.degraded) == (NEARBY, True)
+    assert Deadline(0).remaining() == 0
+
+
+def test_distance_estimate_on_deadline():
+    released = threading.Event()
+    storage = InMemoryStorage()
+    calculator = distance.MkadDistanceCalculator(storage, slow_client(released))
+    point = Coordinates(55.5, 37.9)
+
+    deadline = Deadline(0.05)
+    estimated = calculator.get_distance_within(point, deadline)
+    assert estimated.quality == ESTIMATE and estimated.degraded
+    assert 10 < estimated.value < 40
+    assert calculator.get_distance(point, Deadline(0.05)) == estimated.value  # refresh is still running
+
+    released.set()
+    wait_background()
+    deadline = Deadline(0.05)
+    assert calculator.get_distance(point, deadline) == 21
+    assert deadline.quality == CACHED
+    assert calculator.get_distance(point) == 21
+    assert storage.get('distance:55.5,37.9') == b'21000.0'
+
+
+def test_uncached_distance_within_deadline():
+    api = mock.Mock()
+    api.get_distance_from_points.return_value = 5900
+    api.level = NORMAL
+    calculator = distance.NearestExitsGoogleDistanceCalculator(
+        api=api, polygon=distance.MKAD_POLYGON, exits_coordinates=distance.MKAD_EXITS_COORDINATES,
+    )
+    assert calculator.get_distance_within(Coordinates(55.5, 37.9), Deadline(5)).quality == FRESH
+    inside = calculator.get_distance_within(Coordinates(55.75, 37.62), Deadline(5))
+    assert (inside.value, inside.quality) == (0, FRESH)
+
+
+def test_geocoder_stale_and_nearby_on_deadline():
+    released = threading.Event()
+    storage = StaleCopyStorage(InMemoryStorage())
+    geocoder = geocode.GoogleGeocoder(storage=storage, gmaps_client=slow_client(released))
+    point = Coordinates(1.22339, 4.56561)
+    storage.set('geo:1.2234,4.5656', '1,2;old address;city;78', ex=100)
+    storage.delete('geo:1.2234,4.5656')  # expired, stale copy is kept
+    storage.set('geo:5.0001,6.0', '5,6;nearby address;city;77', ex=100)
+
+    deadline = Deadline(0.05)
+    assert geocoder.get_address(point, deadline) == 'old address'
+    assert deadline.quality == STALE
+    deadline = Deadline(0.05)
+    assert geocoder.get_federal_code(Coordinates(5.0, 6.0), deadline) == 77
+    assert deadline.quality == NEARBY
+    with pytest.raises(DeadlineExceeded):
+        geocoder.get_coordinates('Москва', Deadline(0.05))
+
+    released.set()
+    wait_background()
+    assert storage.get('geo:1.2234,4.5656').decode().endswith(ADDRESS + ';Санкт-Петербург;78')
+    assert storage.get('stale:geo:1.2234,4.5656') == storage.get('geo:1.2234,4.5656')
+    deadline = Deadline(0.05)
+    assert geocoder.get_geo('Москва', deadline) is None  # empty result is refreshed within deadline
+    assert deadline.quality == FRESH
+    assert storage.mget(['coordinates:Москва', 'geo_by_address:Москва']) == [b'', b'']
+
+
+def test_stale_copy_storage_pipeline():
+    remote = InMemoryStorage()
+    storage = StaleCopyStorage(remote, stale_ttl=1000)
+    pipeline = storage.pipeline(transaction=False)
+    pipeline.set('key', 'value', ex=10).get('other').set('second', 'value').exists('key')
+    assert pipeline.execute() == [True, None, True, 1]
+    assert 999000 < remote.pttl('stale:key') <= 1000000
+    assert storage.set('lock:key', 'token', px=100, nx=True)
+    assert remote.get('stale:lock:key') is None
+    assert storage.set('key', 'newer') is True
+    assert remote.mget(['key', 'stale:key']) == [b'newer', b'newer']
+
+
+def test_background_calls_share_future():
+    released = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        released.wait(5)
+        return 1
+    first = BACKGROUND_CALLS.submit('shared', call)
+    second = BACKGROUND_CALLS.submit('shared', call)
+    released.set()
+    assert first is second and first.result(5) == 1
+    time.sleep(0.01)
+    assert calls == [1] and 'shared' not in BACKGROUND_CALLS.calls
+
+
+def test_background_calls_queue_is_bounded():
+    released = threading.Event()
+    background_calls = BackgroundCalls(workers=1, max_queued=1)
+    with mock.patch('geo_garry.deadline.BACKGROUND_CALLS', background_calls):
+        running = background_calls.submit('running', lambda: released.wait(5))
+        queued = background_calls.submit('queued', lambda: released.wait(5))
+        assert background_calls.submit('refused', lambda: 1) is None
+        assert background_calls.submit('queued', lambda: 1) is queued
+        refresh = mock.Mock()
+        result = call_within('refused', refresh, Deadline(10), [(ESTIMATE, lambda: 2)])
+        assert (result.value, result.quality) == (2, ESTIMATE)
+        refresh.assert_not_called()
+        assert background_calls.refused == 2
+    released.set()
+    assert running.result(5) and queued.result(5)
@@ -0,0 +1,116 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from geo_garry import distance
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.api import GoogleMapsApi
+from geo_garry.gmaps.costs import BudgetExhausted, CostAccountant
+from geo_garry.gmaps.dispatcher import DistanceMatrixDispatcher
+
+
+def matrix_client() -> mock.Mock:
+    """distance_matrix answers origin latitude * 1000 + destination latitude meters."""
+    def distance_matrix(origins, destinations, mode):
+        return {'rows': [
+            {'elements': [
+                {'distance': {'value': origin[0] * 1000 + destination[0]}} for destination in destinations
+            ]}
+            for origin in origins
+        ]}
+    gmaps_client = mock.Mock()
+    gmaps_client.distance_matrix.side_effect = distance_matrix
+    return gmaps_client
+
+
+def request_together(dispatcher, requests):
+    barrier = threading.Barrier(len(requests))
+
+    def request(arguments):
+        barrier.wait(5)
+        return dispatcher.get_distance_from_points(*arguments)
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(request, requests))
+
+
+def test_dispatcher_merges_concurrent_requests():
+    gmaps_client = matrix_client()
+    dispatcher = DistanceMatrixDispatcher(GoogleMapsApi(gmaps_client), max_wait=1)
+    results = request_together(dispatcher, [
+        ([(3, 0), (2, 0)], (5, 0)),
+        ([[2, 0], [4, 0]], (6, 0)),
+        ([(3, 0), (2, 0)], (5, 0)),
+    ])
+    assert results == [2005, 2006, 2005]
+    gmaps_client.distance_matrix.assert_called_once()
+    kwargs = gmaps_client.distance_matrix.call_args[1]
+    assert sorted(kwargs['origins']) == [(2, 0), (3, 0), (4, 0)]
+    assert sorted(kwargs['destinations']) == [(5, 0), (6, 0)]
+    assert (dispatcher.stats.calls, dispatcher.stats.requests) == (1, 3)
+    assert (dispatcher.stats.elements, dispatcher.stats.requested_elements) == (6, 6)
+
+
+def test_dispatcher_splits_batches_by_limits():
+    gmaps_client = matrix_client()
+    dispatcher = DistanceMatrixDispatcher(GoogleMapsApi(gmaps_client), max_wait=0.2, max_elements=4)
+    results = request_together(dispatcher, [([(1, 0), (2, 0)], (float(index), 0)) for index in range(4)])
+    assert results == [1000, 1001, 1002, 1003]
+    assert gmaps_client.distance_matrix.call_count == 2
+    assert all(len(call[1]['destinations']) == 2 for call in gmaps_client.distance_matrix.call_args_list)
+
+    # origins of distant destinations don't overlap, merged request would be billed for 4 elements of 2
+    assert request_together(dispatcher, [([(1, 0)], (1, 0)), ([(2, 0)], (2, 0))]) == [1001, 2002]
+    assert gmaps_client.distance_matrix.call_count == 4
+
+
+def test_dispatcher_shares_errors_and_missing_routes():
+    gmaps_client = matrix_client()
+    accountant = CostAccountant(daily_budget=0.01)
+    dispatcher = DistanceMatrixDispatcher(GoogleMapsApi(gmaps_client, accountant), max_wait=0)
+    gmaps_client.distance_matrix.side_effect = None
+    gmaps_client.distance_matrix.return_value = {'rows': [{'elements': [{'status': 'ZERO_RESULTS'}]}]}
+    assert dispatcher.get_distance_from_points([(1, 0)], (2, 0)) == 0
+    assert dispatcher.level == accountant.level
+
+    accountant.record('distance_matrix', 2)
+    dispatcher.max_wait = 1
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(dispatcher.get_distance_from_points, [(1, 0)], (2, 0)) for _ in range(2)]
+        for future in futures:
+            with pytest.raises(BudgetExhausted):
+                future.result(5)
+    assert gmaps_client.distance_matrix.call_count == 1
+
+
+def test_dispatcher_missing_route_of_any_origin_is_zero():
+    gmaps_client = matrix_client()
+    gmaps_client.distance_matrix.side_effect = None
+    gmaps_client.distance_matrix.return_value = {'rows': [
+        {'elements': [{'distance': {'value': 1000}}]},
+        {'elements': [{'status': 'ZERO_RESULTS'}]},
+    ]}
+    api = GoogleMapsApi(gmaps_client)
+    assert api.get_distance_from_points([(1, 0), (2, 0)], (3, 0)) == 0
+    assert DistanceMatrixDispatcher(api, max_wait=0).get_distance_from_points([(1, 0), (2, 0)], (3, 0)) == 0
+
+
+def test_dispatcher_splits_oversize_request():
+    gmaps_client = matrix_client()
+    dispatcher = DistanceMatrixDispatcher(GoogleMapsApi(gmaps_client), max_wait=0, max_origins=2)
+    assert dispatcher.get_distance_from_points([(3, 0), (2, 0), (4, 0), (2, 0), (5, 0)], (1, 0)) == 2001
+    assert [len(call[1]['origins']) for call in gmaps_client.distance_matrix.call_args_list] == [2, 2]
+
+
+def test_calculator_with_dispatcher():
+    gmaps_client = matrix_client()
+    calculator = distance.MkadDistanceCalculator(InMemoryStorage(), gmaps_client)
+    DistanceMatrixDispatcher(calculator.api, max_wait=1).attach(calculator)
+    points = [Coordinates(55.5, 37.9), Coordinates(55.5001, 37.9)]
+    with ThreadPoolExecutor(2) as pool:
+        distances = list(pool.map(calculator.get_distance, points))
+    assert distances[0] == distances[1] > 0
+    gmaps_client.distance_matrix.assert_called_once()
+    assert len(gmaps_client.distance_matrix.call_args[1]['origins']) == 7
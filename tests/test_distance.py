@@ -1,6 +1,7 @@
 from unittest import mock
 
 from geo_garry import distance, polygons, Coordinates
+from geo_garry.gmaps.costs import NORMAL
 
 
 def test_distance_calculator():
@@ -25,6 +26,7 @@ def test_distance_calculator():
 @mock.patch('geo_garry.gmaps.api.GoogleMapsApi')
 def test_nearest_exits_calculator(api_mock):
     api_mock.get_distance_from_points.return_value = 5900
+    api_mock.level = NORMAL
 
     service = distance.NearestExitsGoogleDistanceCalculator(
         api=api_mock,
@@ -60,6 +62,7 @@ def test_nearest_exits_calculator(api_mock):
 
 @mock.patch('geo_garry.gmaps.api.GoogleMapsApi')
 def test_polygon_center(api_mock):
+    api_mock.level = NORMAL
     api_mock.get_driving_path.return_value = [
         {'distance': {'text': '68 m', 'value': 68},
          'duration': {'text': '1 min', 'value': 12},
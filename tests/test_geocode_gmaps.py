@@ -1,8 +1,9 @@
 from unittest import mock
 
 from geo_garry import geocode
+from geo_garry.cache import InMemoryStorage
 from geo_garry.dataclasses import Coordinates, CoordinatesAddress
-from geo_garry.gmaps.address import GoogleMapsAddress, ADDRESS_SCHEMAS
+from geo_garry.gmaps.address import GoogleMapsAddress, ADDRESS_SCHEMAS, compile_schemas, extract_address_parts
 
 
 def test_google_maps_address():
@@ -108,6 +109,34 @@ def test_google_maps_address():
 
 
 
+def test_compiled_address_schemas():
+    components = {'locality': 'Мытищи', 'route': 'Волковское шоссе', 'transit_station': 'Мытищи'}
+    formatter = compile_schemas([
+        [('bus_station', ['route', 'street_number']), 'locality'],
+        [(['street_number'], 'transit_station', 'route')],
+        [('country',)],
+        [],
+    ])
+    assert formatter(components) == ('Волковское шоссе, Мытищи', 'ост. Мытищи', '', '')
+    assert GoogleMapsAddress([
+        {'long_name': 'Мыти́щи', 'types': ['locality', 'administrative_area_level_2']},
+        {'long_name': 'Россия', 'types': ['country']},
+    ]).format([('route', 'administrative_area_level_2'), 'country']) == 'Мытищи, Россия'
+
+    street = [
+        {'long_name': '39', 'types': ['street_number']},
+        {'long_name': 'Волковское шоссе', 'types': ['route']},
+        {'long_name': 'Мытищи', 'types': ['locality']},
+    ]
+    district = [{'long_name': 'Мытищинский район', 'types': ['administrative_area_level_2']}]
+    region = [{'long_name': 'Московская область', 'types': ['administrative_area_level_1']}]
+    city = [{'long_name': 'Москва', 'types': ['locality']}]
+    parts = extract_address_parts([street, district, region, city])
+    assert parts == ('Мытищи, Волковское шоссе, 39', 'Мытищи', 'Московская область')
+    assert extract_address_parts([street, district]).federal_subject == 'Мытищи'
+    assert extract_address_parts([]) is None
+
+
 @mock.patch('geo_garry.gmaps.api.GoogleMapsApi')
 def test_gmaps_forward_geocode(api_mock):
     storage_mock = mock.Mock(get=mock.Mock(return_value=b'1.22339,4.56561'))
@@ -116,11 +145,12 @@ def test_gmaps_forward_geocode(api_mock):
 
     api_mock.get_coordinates.assert_not_called()
     api_mock.get_coordinates.return_value = (1.22339, 4.56561)
-    storage_mock = mock.Mock(get=mock.Mock(return_value=None), exists=mock.Mock(return_value=True))
+    storage_mock = mock.Mock(get=mock.Mock(return_value=b'\x00'))
     service = geocode.GmapsCacheableGeocodeService(storage=storage_mock, api=api_mock)
     assert service.get_coordinates('Moscow City') is None
+    storage_mock.exists.assert_not_called()
 
-    storage_mock = mock.Mock(get=mock.Mock(return_value=None), exists=mock.Mock(return_value=False))
+    storage_mock = mock.Mock(get=mock.Mock(return_value=None))
     service = geocode.GmapsCacheableGeocodeService(storage=storage_mock, api=api_mock)
     assert service.get_coordinates('Moscow City') == Coordinates(1.22339, 4.56561)
     api_mock.get_coordinates.assert_called_once_with('Moscow City')
@@ -209,14 +239,14 @@ def test_gmaps_geocode_with_geo(api_mock):
              'types': ['country', 'political']},
         ]],
     }
-    storage_mock = mock.Mock(get=mock.Mock(return_value=None), exists=mock.Mock(return_value=True))
+    storage_mock = mock.Mock(get=mock.Mock(return_value=b''))
     service = geocode.GmapsCacheableReverseByAddressService(storage=storage_mock, api=api_mock)
     res = service.get_geo('Assa')
     assert res is None
     storage_mock.get.assert_called_once_with('geo_by_address:Assa')
     storage_mock.reset_mock()
 
-    storage_mock.exists = mock.Mock(return_value=False)
+    storage_mock.get.return_value = None
     addr = 'Санкт-Петербург, улица Профессора Качалова, 9а'
     assert service.get_geo('Assa') == CoordinatesAddress(100, 200, addr, 'Санкт-Петербург', 78)
     api_mock.get_coordinates_and_addresses.assert_called_once_with('Assa')
@@ -224,3 +254,103 @@ def test_gmaps_geocode_with_geo(api_mock):
         'geo_by_address:Assa', f'100,200;{addr};Санкт-Петербург;78', ex=60*60*24*30,
     )
     storage_mock.get.assert_called_once_with('geo_by_address:Assa')
+
+
+def test_google_geocoder_coordinates_many():
+    gmaps_client = mock.Mock()
+    gmaps_client.geocode.side_effect = lambda place, language: [
+        {'geometry': {'location': {'lat': 1.5, 'lng': 2.5}}}
+    ] if place == 'Moscow City' else []
+    storage_mock = mock.Mock(mget=mock.Mock(return_value=[b'1.22339,4.56561', None, None]))
+    geocoder = geocode.GoogleGeocoder(storage=storage_mock, gmaps_client=gmaps_client)
+
+    addresses = ['Tverskaya 1', 'Moscow City', '', 'Tverskaya 1', ' ', 'Nowhere']
+    result = geocoder.get_coordinates_many(addresses, qps=100)
+    assert result == [
+        Coordinates(1.22339, 4.56561), Coordinates(1.5, 2.5), None, Coordinates(1.22339, 4.56561), None, None,
+    ]
+    storage_mock.mget.assert_called_once_with(
+        ['coordinates:Tverskaya 1', 'coordinates:Moscow City', 'coordinates:Nowhere']
+    )
+    assert gmaps_client.geocode.call_count == 2
+    pipeline_mock = storage_mock.pipeline.return_value
+    pipeline_mock.set.assert_any_call('coordinates:Moscow City', '1.5,2.5', ex=60*60*24*30)
+    pipeline_mock.set.assert_any_call('coordinates:Nowhere', '', ex=60*60*24*30)
+    pipeline_mock.execute.assert_called_once_with()
+
+
+def test_google_geocoder_reverse_many():
+    gmaps_client = mock.Mock()
+    gmaps_client.reverse_geocode.return_value = [{'address_components': [
+        {'long_name': '9а', 'short_name': '9а', 'types': ['street_number']},
+        {'long_name': 'улица Профессора Качалова', 'short_name': 'ул. Профессора Качалова', 'types': ['route']},
+        {'long_name': 'Санкт-Петербург', 'short_name': 'СПБ', 'types': ['locality', 'political']},
+    ]}]
+    storage_mock = mock.Mock(mget=mock.Mock(return_value=[None, b'5,6;address;city;77']))
+    geocoder = geocode.GoogleGeocoder(storage=storage_mock, gmaps_client=gmaps_client)
+    coordinates = [
+        Coordinates(1.22339, 4.56561),
+        Coordinates(5.00001, 6.00002),
+        Coordinates(1.22341, 4.56559),  # same cell as the first one
+        Coordinates(5.0, 6.0),
+    ]
+
+    addr = 'Санкт-Петербург, улица Профессора Качалова, 9а'
+    assert geocoder.get_address_many(coordinates) == [addr, 'address', addr, 'address']
+    storage_mock.mget.assert_called_once_with(['geo:1.2234,4.5656', 'geo:5.0,6.0'])
+    gmaps_client.reverse_geocode.assert_called_once_with(
+        (1.22339, 4.56561), language='ru', result_type='street_address|bus_station|transit_station',
+    )
+    storage_mock.pipeline.return_value.set.assert_called_once_with(
+        'geo:1.2234,4.5656', f'1.22339,4.56561;{addr};Санкт-Петербург;78', ex=60*60*24*30,
+    )
+
+    storage_mock.mget.return_value = [b'1,2;address;city;78', b'5,6;address;city;77']
+    assert geocoder.get_federal_code_many(coordinates) == [78, 77, 78, 77]
+    assert gmaps_client.reverse_geocode.call_count == 1
+
+
+def test_google_geocoder_populates_caches():
+    gmaps_client = mock.Mock()
+    gmaps_client.geocode.side_effect = lambda place, language: [{
+        'geometry': {'location': {'lat': 59.93421, 'lng': 30.30577}},
+        'address_components': [
+            {'long_name': '9а', 'short_name': '9а', 'types': ['street_number']},
+            {'long_name': 'улица Профессора Качалова', 'short_name': 'ул. Профессора Качалова',
+             'types': ['route']},
+            {'long_name': 'Санкт-Петербург', 'short_name': 'СПБ', 'types': ['locality', 'political']},
+            {'long_name': 'Санкт-Петербург', 'short_name': 'Санкт-Петербург',
+             'types': ['administrative_area_level_2', 'political']},
+        ],
+    }] if place == 'Качалова 9а' else []
+    storage = InMemoryStorage()
+    geocoder = geocode.GoogleGeocoder(
+        storage=storage,
+        gmaps_client=gmaps_client,
+        populate_caches=True,
+        cache_ttls={'geo': 60 * 60 * 24 * 90},
+    )
+
+    addr = 'Санкт-Петербург, улица Профессора Качалова, 9а'
+    assert geocoder.get_coordinates('Качалова 9а') == Coordinates(59.93421, 30.30577)
+    assert geocoder.get_coordinates_many(['Качалова 9а', 'Nowhere']) == [
+        Coordinates(59.93421, 30.30577), None,
+    ]
+    assert gmaps_client.geocode.call_count == 2
+    assert storage.get('coordinates:Качалова 9а') == b'59.93421,30.30577'
+    geo_value = f'59.93421,30.30577;{addr};Санкт-Петербург;78'.encode()
+    assert storage.get('geo_by_address:Качалова 9а') == geo_value
+    assert storage.get('geo:59.9342,30.3058') == geo_value
+    assert storage.get('coordinates:Nowhere') == b''
+    assert storage.get('geo_by_address:Nowhere') == b''
+    assert 60 * 60 * 24 * 89 * 1000 < storage.pttl('geo:59.9342,30.3058') <= 60 * 60 * 24 * 90 * 1000
+    assert storage.pttl('coordinates:Качалова 9а') <= 60 * 60 * 24 * 30 * 1000
+
+    assert geocoder.get_address(Coordinates(59.93421, 30.30577)) == addr
+    assert geocoder.get_federal_code(Coordinates(59.93419, 30.30581)) == 78
+    assert geocoder.get_geo('Качалова 9а') == CoordinatesAddress(
+        59.93421, 30.30577, addr, 'Санкт-Петербург', 78,
+    )
+    assert geocoder.get_geo('Nowhere') is None
+    gmaps_client.reverse_geocode.assert_not_called()
+    assert gmaps_client.geocode.call_count == 2
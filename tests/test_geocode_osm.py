@@ -1,6 +1,6 @@
 from unittest import mock
 
-from geo_garry import geocode, Coordinates
+from geo_garry import geocode, osm, Coordinates
 from geo_garry.osm import OpenStreetMapsAddress, OSM_ADDRESS_SCHEMAS
 
 
@@ -97,6 +97,12 @@ def test_osm_address():
     address = OpenStreetMapsAddress(OSM_RESPONSES[2])
     assert address.format() == 'Байконур, улица Гагарина, Больница Акай'
     assert address.format(terms_schema=OSM_ADDRESS_SCHEMAS['federal_subject']) == 'Байконур'
+    assert address.match_state(OSM_RESPONSES[2]['address']['state']) == 'Байконур'
+
+    with mock.patch('geo_garry.osm.compile_osm_schema', wraps=osm.compile_osm_schema) as compile_mock:
+        assert address.format(terms_schema=['road', 'state']) == 'улица Гагарина, Байконур'
+        assert address.format(terms_schema=['road', 'state']) == 'улица Гагарина, Байконур'
+    compile_mock.assert_called_once()
 
 
 @mock.patch('geo_garry.osm.requests.get')
@@ -1,3 +1,5 @@
+import numpy as np
+
 from geo_garry import geometry, distance, polygons
 from geo_garry.dataclasses import Coordinates
 
@@ -35,3 +37,87 @@ def test_line_outside_part():
         ),
         polygons.KAD_POLYGON
     ), 1) == 0.5
+
+
+def test_contains_many():
+    latitudes = [55.6892209716432, 50.4254225, 55.77271261339107]
+    longitudes = [37.752854389528585, 36.9020654, 37.843152686304705]
+    result = geometry.contains_many(polygons.MKAD_POLYGON, latitudes, longitudes)
+    assert result.tolist() == [True, False, False]
+
+    points = np.array([latitudes, longitudes]).T
+    assert geometry.contains_many(polygons.MKAD_POLYGON, points).tolist() == [True, False, False]
+    assert geometry.contains_many(polygons.MKAD_POLYGON, points.tobytes()).tolist() == [True, False, False]
+    assert geometry.contains_many(polygons.MKAD_POLYGON, []).tolist() == []
+
+
+def test_contains_many_same_as_is_inside_polygon():
+    random = np.random.RandomState(42)
+    for polygon in [polygons.MKAD_POLYGON, polygons.KAD_POLYGON, polygons.SEVASTOPOL_POLYGON]:
+        min_x, min_y, max_x, max_y = polygon.bounds
+        vertexes = np.asarray(polygon.exterior.coords)
+        latitudes = np.concatenate([random.uniform(min_x - 0.1, max_x + 0.1, 2000), vertexes[:, 0]])
+        longitudes = np.concatenate([random.uniform(min_y - 0.1, max_y + 0.1, 2000), vertexes[:, 1]])
+
+        result = geometry.contains_many(polygon, latitudes, longitudes)
+        expected = [
+            geometry.is_inside_polygon(Coordinates(latitude, longitude), polygon)
+            for latitude, longitude in zip(latitudes, longitudes)
+        ]
+        assert result.tolist() == expected
+
+
+def test_contains_many_border_points_same_as_is_inside_polygon():
+    for polygon in [polygons.MKAD_POLYGON, polygons.KAD_POLYGON]:
+        coords = np.asarray(polygon.exterior.coords)[:, :2]
+        starts, ends = coords[:-1], coords[1:]
+        normals = np.stack([starts[:, 1] - ends[:, 1], ends[:, 0] - starts[:, 0]], axis=1)
+        normals /= np.maximum(np.hypot(normals[:, 0], normals[:, 1]), 1e-300)[:, None]
+        on_edges = [starts + (ends - starts) * part for part in (0.3, 0.5, 0.7)]
+        near_edges = [
+            starts + (ends - starts) * 0.5 + normals * shift for shift in (-1e-9, -1e-12, 1e-12, 1e-9)
+        ]
+        near_vertexes = [
+            coords + np.array(shift)
+            for shift in [(1e-12, 0), (-1e-12, 0), (0, 1e-12), (0, -1e-12), (1e-9, 1e-9)]
+        ]
+        points = np.vstack([coords, *on_edges, *near_edges, *near_vertexes])
+
+        expected = [
+            geometry.is_inside_polygon(Coordinates(latitude, longitude), polygon)
+            for latitude, longitude in points
+        ]
+        assert geometry.contains_many(polygon, points).tolist() == expected
+        assert any(expected) and not all(expected)
+
+
+def test_prepared_polygons_are_dropped():
+    polygon = polygons.MKAD_POLYGON.buffer(0.01)
+    geometry.contains_many(polygon, [55.75], [37.62])
+    key = id(polygon)
+    assert key in geometry._PREPARED_POLYGONS
+    del polygon
+    assert key not in geometry._PREPARED_POLYGONS
+
+
+def test_federal_code_many():
+    latitudes = [44.60916135, 45.0, 55.75]
+    longitudes = [33.5259145492637, 34.1, 37.62]
+    codes = geometry.get_federal_code_many(latitudes, longitudes)
+    assert codes.tolist() == [92, 91, geometry.NO_FEDERAL_CODE]
+    assert codes.tolist()[:2] == [
+        geometry.get_federal_code(Coordinates(latitude, longitude))
+        for latitude, longitude in zip(latitudes[:2], longitudes[:2])
+    ]
+
+
+def test_quantize_equal_area_cells():
+    for latitude in (45.0, 55.75, 59.95, 69.0):
+        center = geometry.quantize(latitude, 37.61, 10)
+        assert abs(center.latitude - latitude) <= 5 / geometry.METERS_PER_DEGREE
+        meters_per_longitude = geometry.METERS_PER_DEGREE * np.cos(np.radians(center.latitude))
+        assert abs(center.longitude - 37.61) * meters_per_longitude <= 5.01
+        east = geometry.quantize(center.latitude, center.longitude + 10.5 / meters_per_longitude, 10)
+        assert east.latitude == center.latitude
+        assert 9.9 < (east.longitude - center.longitude) * meters_per_longitude < 10.1
+    assert geometry.quantize(55.75001, 37.61, 10) == geometry.quantize(55.74999, 37.61, 10)
@@ -0,0 +1,54 @@
+import json
+import random
+from unittest import mock
+
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService, GmapsCacheableReverseGeocodeService
+from geo_garry.hotkeys import HotKeyTracker
+from geo_garry.sketch import TopK
+
+
+def test_top_k():
+    top_k = TopK(k=5)
+    rng = random.Random(1)
+    for _ in range(20000):
+        top_k.add('key:{}'.format(int(rng.paretovariate(1.2))))
+    assert [key for key, _ in top_k.top(3)] == ['key:1', 'key:2', 'key:3']
+    assert len(top_k.counts) == 5
+    assert len(top_k.heap) <= 4 * 5
+    count = top_k.top(1)[0][1]
+    top_k.decay()
+    assert top_k.top(1)[0][1] == count // 2
+
+
+def test_hot_key_tracker(tmpdir):
+    storage = InMemoryStorage()
+    api = mock.Mock(
+        get_coordinates=mock.Mock(return_value=(1, 2)), get_addresses=mock.Mock(return_value=None),
+    )
+    geocode_service = GmapsCacheableGeocodeService(storage=storage, api=api)
+    reverse_service = GmapsCacheableReverseGeocodeService(storage=storage, api=api)
+    tracker = HotKeyTracker(k=2, width=256)
+    tracker.attach(geocode_service)
+    tracker.attach(reverse_service)
+
+    for address in ['Тверская 1'] * 5 + ['Арбат 2'] * 3 + ['Мира 3']:
+        geocode_service.get_coordinates(address)
+    reverse_service.get_address_many([
+        Coordinates(1.00001, 2.0), Coordinates(1.0, 2.00001), Coordinates(3.0, 4.0),
+    ])
+
+    assert tracker.top('CacheStorageCoordinates') == [
+        dict(key='coordinates:Тверская 1', count=5), dict(key='coordinates:Арбат 2', count=3),
+    ]
+    assert tracker.top('CacheStorageAddress', 1) == [dict(key='geo:1.0,2.0', count=2)]
+    assert tracker.top('CacheStorageDistance') == []
+
+    path = str(tmpdir.join('hot_keys.json'))
+    tracker.dump(path, n=1)
+    with open(path, encoding='utf-8') as stream:
+        assert json.load(stream) == {
+            'CacheStorageCoordinates': dict(total=9, keys=[dict(key='coordinates:Тверская 1', count=5)]),
+            'CacheStorageAddress': dict(total=3, keys=[dict(key='geo:1.0,2.0', count=2)]),
+        }
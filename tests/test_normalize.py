@@ -0,0 +1,32 @@
+from geo_garry.normalize import normalize_address
+
+
+def test_normalize_address():
+    variants = [
+        'г. Москва, ул. Ленина 5',
+        'г.Москва,ул.Ленина,д.5',
+        'МОСКВА,  улица  Ленина, дом 5',
+        'Россия, 101000, Москва, Ленина ул., 5',
+    ]
+    assert {normalize_address(variant) for variant in variants} == {'москва, 5 ленина улица'}
+    assert normalize_address('Москва ул Ленина, д.5') == '5 ленина москва улица'
+
+    assert normalize_address('Мыти́щи, Ёлочная 12/1') == normalize_address('мытищи, елочная 12/1')
+    assert normalize_address('пр-т Невский 28') == normalize_address('Невский проспект, д. 28')
+    assert normalize_address('ул. Тверская-Ямская 1-я, д. 5-а, корп.2') == \
+        '1я 5а тверская улица ямская корпус 2'
+    assert normalize_address('Москва, ул. Ленина, д. 5, корп. 2') != \
+        normalize_address('Москва, ул. Ленина, д. 2, корп. 5')
+    assert normalize_address('Ленина 5, кв 12') != normalize_address('Ленина 12, кв 5')
+    assert normalize_address('Ленина 5, кв 12') == normalize_address('Ленина, дом 5, кв. 12')
+    assert normalize_address('д. Петровка, ул. Мира 3') == 'д петровка, 3 мира улица'
+    assert normalize_address('Ленина 5а') != normalize_address('Ленина 5')
+    assert normalize_address('Ленина пер. 5') != normalize_address('Ленина пр. 5')
+    assert normalize_address('пр-д Серебрякова 2') == '2 проезд серебрякова'
+    assert normalize_address('') == ''
+
+
+def test_normalize_address_keeps_order_of_parts():
+    assert normalize_address('г. Ленинск, ул. Москва') != normalize_address('г. Москва, ул. Ленинск')
+    assert normalize_address('Ленина 5, Мира') != normalize_address('Ленина, Мира 5')
+    assert normalize_address('Мира, Ленина 5') != normalize_address('Ленина, Мира 5')
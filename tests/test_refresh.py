@@ -0,0 +1,91 @@
+import datetime
+from unittest import mock
+
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService
+from geo_garry.refresh import RefreshAheadScheduler, in_windows
+from geo_garry.sketch import CountMinSketch
+
+NIGHT = datetime.datetime(2020, 1, 1, 3, 0)
+DAY = datetime.datetime(2020, 1, 1, 14, 0)
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(width=256, depth=4)
+    for index in range(1000):
+        sketch.add('rare:{}'.format(index))
+    for _ in range(100):
+        sketch.add('hot')
+    assert 100 <= sketch.estimate('hot') < 130
+    assert sketch.estimate('never') < 30
+    sketch.decay()
+    assert 50 <= sketch.estimate('hot') < 65
+
+
+def test_in_windows():
+    windows = [(datetime.time(23), datetime.time(6))]
+    assert in_windows(datetime.time(3), windows)
+    assert in_windows(datetime.time(23, 30), windows)
+    assert not in_windows(datetime.time(14), windows)
+    assert in_windows(datetime.time(1), [(datetime.time(1), datetime.time(5))])
+    assert not in_windows(datetime.time(5), [(datetime.time(1), datetime.time(5))])
+
+
+def make_service():
+    storage = InMemoryStorage()
+    api_mock = mock.Mock(get_coordinates=mock.Mock(return_value=(55.7, 37.6)))
+    return GmapsCacheableGeocodeService(storage=storage, api=api_mock), storage, api_mock
+
+
+def test_refresh_ahead_hot_keys():
+    service, storage, api_mock = make_service()
+    scheduler = RefreshAheadScheduler(
+        windows=[(datetime.time(1), datetime.time(5))], refresh_before=100, min_hits=3, daily_budget=1,
+        decay_interval=datetime.timedelta(days=7),
+    )
+    scheduler.attach(service)
+    for _ in range(5):
+        service.get_coordinates('hot')
+    service.get_coordinates('warm')
+    service.get_coordinates('warm')
+    service.get_coordinates('warm')
+    service.get_coordinates('cold')
+    assert set(scheduler.candidates) == {'coordinates:hot', 'coordinates:warm'}
+    assert api_mock.get_coordinates.call_count == 3
+
+    assert scheduler.run_once(NIGHT).refreshed == 0  # TTL is 30 days
+
+    storage.set('coordinates:hot', '1.0,2.0', ex=50)
+    storage.set('coordinates:warm', '1.0,2.0', ex=50)
+    assert scheduler.run_once(DAY).refreshed == 0  # not off-peak
+    with mock.patch.object(scheduler.hot, 'top', wraps=scheduler.hot.top) as top_mock:
+        stats = scheduler.run_once(NIGHT)
+    top_mock.assert_called_once()
+    assert (stats.checked, stats.refreshed, stats.skipped) == (2, 1, 1)  # budget is spent on the hottest key
+    assert storage.pttl('coordinates:hot') > 100 * 1000
+    assert storage.get('coordinates:hot') == b'55.7,37.6'
+    assert storage.get('coordinates:warm') == b'1.0,2.0'
+
+    assert scheduler.run_once(NIGHT + datetime.timedelta(days=1)).refreshed == 1  # next day budget
+    assert storage.get('coordinates:warm') == b'55.7,37.6'
+
+
+def test_refresh_ahead_bounded_candidates():
+    service, _, _ = make_service()
+    scheduler = RefreshAheadScheduler(max_candidates=2, min_hits=1)
+    scheduler.attach(service)
+    for address, count in [('a', 3), ('b', 1), ('c', 2)]:
+        for _ in range(count):
+            scheduler.track(service, address)
+    assert set(scheduler.candidates) == {'coordinates:a', 'coordinates:c'}
+
+    scheduler.decay()
+    scheduler.decay()
+    assert set(scheduler.candidates) == set()
+
+    for index in range(20):
+        for _ in range(5):
+            scheduler.track(service, 'new{}'.format(index))
+    assert len(scheduler.candidates) == 2
+    assert len(scheduler.keys) <= 4
@@ -0,0 +1,90 @@
+from unittest import mock
+
+import pytest
+
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService
+from geo_garry.sharding import ConsistentHashRing, ShardedStorage
+
+
+def test_hash_ring_minimal_remapping():
+    ring = ConsistentHashRing(['a', 'b', 'c'])
+    keys = ['geo:{}'.format(index) for index in range(3000)]
+    before = {key: ring.get_node(key) for key in keys}
+    assert set(before.values()) == {'a', 'b', 'c'}
+    assert min(list(before.values()).count(node) for node in 'abc') > 700
+
+    ring.add_node('d')
+    after = {key: ring.get_node(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert all(after[key] == 'd' for key in moved)
+    assert 500 < len(moved) < 1100
+
+    ring.remove_node('d')
+    assert {key: ring.get_node(key) for key in keys} == before
+    with pytest.raises(ValueError):
+        ring.add_node('a')
+
+
+def test_sharded_storage_bulk_operations():
+    shards = {'a': InMemoryStorage(), 'b': InMemoryStorage(), 'c': InMemoryStorage()}
+    storage = ShardedStorage(shards)
+    keys = ['coordinates:{}'.format(index) for index in range(100)]
+
+    pipeline = storage.pipeline(transaction=False)
+    for index, key in enumerate(keys):
+        pipeline.set(key, str(index), ex=100)
+    assert pipeline.execute() == [True] * 100
+    assert all(shard.data for shard in shards.values())
+    assert sum(len(shard.data) for shard in shards.values()) == 100
+
+    assert storage.mget(keys + ['absent']) == [str(index).encode() for index in range(100)] + [None]
+    assert storage.get('coordinates:7') == b'7'
+    assert storage.exists('coordinates:7', 'absent') == 1
+    assert sorted(storage.scan_iter(match='coordinates:*')) == sorted(keys)
+
+    pipeline = storage.pipeline()
+    pipeline.get('coordinates:1').pttl('coordinates:2')
+    assert pipeline.execute()[0] == b'1'
+
+
+def test_sharded_storage_hash_tags():
+    storage = ShardedStorage({'a': InMemoryStorage(), 'b': InMemoryStorage(), 'c': InMemoryStorage()})
+    keys = ['coordinates:{}'.format(index) for index in range(30)]
+    assert all(storage.shard_name('lock:{%s}' % key) == storage.shard_name(key) for key in keys)
+    assert len({storage.shard_name('lock:{}{}'.format(key, '{}')) for key in keys}) > 1  # empty tag
+
+    storage.set('lock:{coordinates:1}', 'token')
+    assert storage.set_if_equal('coordinates:1', 'value', 'lock:{coordinates:1}', 'token', ex=10)
+    assert not storage.set_if_equal('coordinates:1', 'other', 'lock:{coordinates:1}', 'other')
+    assert storage.get('coordinates:1') == b'value'
+    assert storage.delete_if_equal('lock:{coordinates:1}', 'token') == 1
+
+
+def test_sharded_storage_stats():
+    broken = mock.Mock(get=mock.Mock(side_effect=ConnectionError('down')))
+    storage = ShardedStorage({'ok': InMemoryStorage(), 'broken': broken})
+    broken_keys = [key for key in map(str, range(100)) if storage.shard_name(key) == 'broken']
+    ok_keys = [key for key in map(str, range(100)) if storage.shard_name(key) == 'ok']
+
+    for key in broken_keys[:3]:
+        with pytest.raises(ConnectionError):
+            storage.get(key)
+    storage.get(ok_keys[0])
+
+    health = storage.health()
+    assert health['broken']['healthy'] is False
+    assert health['broken']['errors'] == 3
+    assert health['ok'] == dict(healthy=True, calls=1, errors=0, average_latency=mock.ANY, last_error=None)
+
+
+def test_sharded_storage_with_service():
+    storage = ShardedStorage({'a': InMemoryStorage(), 'b': InMemoryStorage()})
+    api_mock = mock.Mock(get_coordinates=mock.Mock(return_value=(55.7, 37.6)))
+    service = GmapsCacheableGeocodeService(storage=storage, api=api_mock)
+    addresses = ['address {}'.format(index) for index in range(20)]
+
+    assert service.get_coordinates_many(addresses) == [Coordinates(55.7, 37.6)] * 20
+    assert service.get_coordinates('address 3') == Coordinates(55.7, 37.6)
+    assert api_mock.get_coordinates.call_count == 20
@@ -0,0 +1,198 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from geo_garry.bloom import BloomGuardedStorage
+from geo_garry.buckets import BucketedStorage
+from geo_garry.cache import SET_IF_EQUAL_SCRIPT, CacheableServiceAbstract, InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.cache import CacheStorageCoordinates
+from geo_garry.sharding import ShardedStorage
+from geo_garry.singleflight import RELEASE_SCRIPT, SingleFlight
+from geo_garry.sqlite_storage import SqliteStorage
+from geo_garry.stale import StaleCopyStorage
+from geo_garry.write_behind import WriteBehindStorage
+
+
+def make_service(storage, refresh, before_save=None, **options):
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            return refresh(key)
+
+        def save_value(self, storage, key, value):
+            if before_save:
+                before_save()
+            super().save_value(storage, key, value)
+
+    service = TestService(storage=storage)
+    single_flight = SingleFlight(**options)
+    single_flight.attach(service)
+    return service, single_flight
+
+
+def test_set_nx(tmp_path):
+    for storage in (InMemoryStorage(), SqliteStorage(str(tmp_path / 'cache.db'))):
+        assert storage.set('lock:key', 'first', px=10000, nx=True)
+        assert storage.set('lock:key', 'second', nx=True) is None
+        assert storage.get('lock:key') == b'first'
+        storage.set('lock:expired', 'first', px=1)
+        time.sleep(0.01)
+        assert storage.set('lock:expired', 'second', nx=True)
+        assert storage.get('lock:expired') == b'second'
+
+        assert not storage.set_if_equal('key', 'value', 'lock:key', 'second', ex=10)
+        assert storage.get('key') is None
+        assert storage.set_if_equal('key', 'value', 'lock:key', 'first', ex=10)
+        assert storage.get('key') == b'value'
+        assert 0 < storage.pttl('key') <= 10000
+
+        assert storage.delete_if_equal('lock:key', 'second') == 0
+        assert storage.delete_if_equal('lock:key', 'first') == 1
+        assert storage.get('lock:key') is None
+        assert not storage.set_if_equal('key', 'value', 'lock:key', 'first')
+
+
+def test_single_flight_threads_of_process():
+    started = threading.Event()
+    released = threading.Event()
+
+    def refresh(key):
+        started.set()
+        released.wait(5)
+        return Coordinates(1, 2)
+    refresh_mock = mock.Mock(side_effect=refresh)
+    service, single_flight = make_service(InMemoryStorage(), refresh_mock)
+
+    with ThreadPoolExecutor(5) as executor:
+        futures = [executor.submit(service.get, 'address') for _ in range(5)]
+        assert started.wait(5)
+        released.set()
+        assert [future.result() for future in futures] == [Coordinates(1, 2)] * 5
+    assert refresh_mock.call_count == 1
+    assert single_flight.stats.leads + single_flight.stats.waited == 1
+    assert service.cache_storage.get('lock:{coordinates:address}') is None  # lease is released
+
+
+def test_single_flight_processes_share_refresh():
+    storage = InMemoryStorage()
+    started = threading.Event()
+    released = threading.Event()
+
+    def slow_refresh(key):
+        started.set()
+        released.wait(5)
+        return Coordinates(1, 2)
+    leader, leader_flight = make_service(storage, mock.Mock(side_effect=slow_refresh), poll_interval=0.01)
+    follower_refresh = mock.Mock(return_value=Coordinates(3, 4))
+    follower, follower_flight = make_service(storage, follower_refresh, poll_interval=0.01)
+
+    with ThreadPoolExecutor(2) as executor:
+        leader_future = executor.submit(leader.get, 'address')
+        assert started.wait(5)
+        follower_future = executor.submit(follower.get, 'address')
+        released.set()
+        assert leader_future.result() == Coordinates(1, 2)
+        assert follower_future.result() == Coordinates(1, 2)
+    follower_refresh.assert_not_called()
+    assert (leader_flight.stats.leads, follower_flight.stats.waited) == (1, 1)
+
+
+def test_single_flight_takes_over_and_times_out():
+    storage = InMemoryStorage()
+    refresh = mock.Mock(return_value=Coordinates(1, 2))
+    service, single_flight = make_service(storage, refresh, poll_interval=0.01, wait_timeout=0.1)
+
+    storage.set('lock:{coordinates:crashed}', 'other', px=30)  # holder crashed, lease expires
+    assert service.get('crashed') == Coordinates(1, 2)
+    assert single_flight.stats.leads == 1
+
+    storage.set('lock:{coordinates:stuck}', 'other', px=10000)
+    assert service.get('stuck') == Coordinates(1, 2)
+    assert single_flight.stats.wait_timeouts == 1
+    assert storage.get('coordinates:stuck') == b'1,2'
+
+
+def test_single_flight_fences_stale_writer():
+    storage = InMemoryStorage()
+
+    def refresh(key):
+        # lease expired during refresh and was taken by another process
+        storage.set('lock:{coordinates:address}', 'other', px=10000)
+        return Coordinates(1, 2)
+    service, single_flight = make_service(storage, refresh)
+
+    assert service.get('address') == Coordinates(1, 2)
+    assert single_flight.stats.fenced == 1
+    assert storage.get('coordinates:address') is None
+    assert storage.get('lock:{coordinates:address}') == b'other'  # lease of another process is kept
+
+
+def test_single_flight_fences_lease_lost_before_save(tmp_path):
+    for storage in (InMemoryStorage(), SqliteStorage(str(tmp_path / 'cache.db'))):
+        def take_lease(storage=storage):
+            # lease expired after refresh and was taken by another process, which cached newer value
+            storage.set('lock:{coordinates:address}', 'other', px=10000)
+            storage.set('coordinates:address', '3,4')
+        service, single_flight = make_service(storage, mock.Mock(return_value=Coordinates(1, 2)), take_lease)
+
+        assert service.get('address') == Coordinates(1, 2)
+        assert single_flight.stats.fenced == 1
+        assert storage.get('coordinates:address') == b'3,4'
+
+    redis = mock.Mock(spec=['get', 'set', 'eval'])
+    redis.get.return_value = None
+    redis.eval.return_value = 0
+    service, single_flight = make_service(redis, mock.Mock(return_value=Coordinates(1, 2)))
+    assert service.get('address') == Coordinates(1, 2)
+    assert single_flight.stats.fenced == 1
+    token = redis.set.call_args_list[0][0][1]
+    redis.eval.assert_any_call(
+        SET_IF_EQUAL_SCRIPT, 2, 'coordinates:address', 'lock:{coordinates:address}', '1,2', token,
+        CacheStorageCoordinates.expire_time * 1000,
+    )
+
+
+def test_single_flight_through_storage_wrappers():
+    remote = InMemoryStorage()
+    sharded = ShardedStorage({'a': InMemoryStorage(), 'b': InMemoryStorage(), 'c': InMemoryStorage()})
+    for storage in (
+            BucketedStorage(remote), WriteBehindStorage(remote), StaleCopyStorage(remote),
+            BloomGuardedStorage(remote), sharded,
+    ):
+        refresh = mock.Mock(return_value=Coordinates(1, 2))
+        service, single_flight = make_service(storage, refresh)
+        assert service.get('address') == Coordinates(1, 2)
+        assert (single_flight.stats.leads, single_flight.stats.fenced, single_flight.stats.local) == (1, 0, 0)
+        assert storage.get('coordinates:address') == b'1,2'
+        assert storage.get('lock:{coordinates:address}') is None
+        remote.flushall()
+
+    lock_storage = mock.Mock(spec=['set', 'get', 'eval'])
+    lock_storage.get.return_value = None
+    refresh = mock.Mock(return_value=Coordinates(1, 2))
+    service, _ = make_service(InMemoryStorage(), refresh, lock_storage=lock_storage)
+    service.get('address')
+    token = lock_storage.set.call_args[0][1]
+    lock_storage.eval.assert_called_once_with(RELEASE_SCRIPT, 1, 'lock:{coordinates:address}', token)
+
+
+def test_single_flight_falls_back_to_local():
+    lock_storage = mock.Mock()
+    lock_storage.set.side_effect = ConnectionError('lock backend is down')
+    refresh = mock.Mock(return_value=Coordinates(1, 2))
+    service, single_flight = make_service(InMemoryStorage(), refresh, lock_storage=lock_storage)
+
+    assert service.get('address') == Coordinates(1, 2)
+    assert service.get('other') == Coordinates(1, 2)
+    assert lock_storage.set.call_count == 1  # lease backend is skipped for cooldown
+    assert single_flight.stats.local == 2
+    assert service.cache_storage.get('coordinates:address') == b'1,2'
+
+    with mock.patch('geo_garry.singleflight.time.monotonic', return_value=single_flight.local_until + 1):
+        lock_storage.set.side_effect = None
+        lock_storage.get.return_value = None
+        assert service.get('third') == Coordinates(1, 2)
+    assert lock_storage.set.call_count == 2
@@ -0,0 +1,129 @@
+import io
+import time
+from unittest import mock
+
+import pytest
+
+from geo_garry import snapshot
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService
+
+
+class FakeRedis:
+    def __init__(self, data=None):
+        self.data = dict(data or {})  # key -> (value, ttl ms)
+        self.commands = []
+
+    def scan_iter(self, match, count=None):
+        return [key for key in self.data if key.startswith(match.rstrip('*').encode())]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def get(self, key):
+        self.commands.append(self.redis.data.get(key, (None, -2))[0])
+
+    def pttl(self, key):
+        self.commands.append(self.redis.data.get(key, (None, -2))[1])
+
+    def set(self, key, value, ex=None):
+        self.redis.data[key] = (value, ex * 1000 if ex else -1)
+
+    def execute(self):
+        self.redis.commands.append(len(self.commands))
+        return self.commands
+
+
+def test_snapshot_export_import(tmpdir):
+    path = str(tmpdir.join('cache.snapshot'))
+    source = FakeRedis({
+        b'geo:1.0,2.0': (b'1,2;address;city;77', 10000),
+        b'coordinates:Moscow': (b'55.7,37.6', -1),
+        b'coordinates:empty': (b'', 5000),
+        b'distance:1,2': (b'12345', 20000),
+        b'other:key': (b'value', -1),
+        b'distance:3,4': (b'1000', 0),  # expiring, not exported as never expiring
+    })
+    with open(path, 'wb') as stream:
+        assert snapshot.export_snapshot(source, stream, batch_size=2) == 4
+
+    storage = snapshot.SnapshotStorage(path)
+    assert len(storage) == 4
+    assert [key for key, _, _ in storage.iter_records()] == [
+        b'coordinates:Moscow', b'coordinates:empty', b'distance:1,2', b'geo:1.0,2.0',
+    ]
+    assert storage.get('coordinates:Moscow') == b'55.7,37.6'
+    assert storage.get('coordinates:empty') == b''
+    assert storage.exists('coordinates:empty') == 1
+    assert storage.exists('coordinates:empty', 'coordinates:Mos', 'distance:1,2') == 2
+    assert storage.set('coordinates:Moscow', '1,2', px=100) is None
+    pipeline = storage.pipeline()
+    pipeline.set('distance:5,6', 1, px=100)
+    assert pipeline.execute() == []
+    assert storage.get('coordinates:Moscow') == b'55.7,37.6'
+    assert storage.get('coordinates:Mos') is None
+    assert storage.get('zzz') is None
+    assert storage.mget(['distance:1,2', 'other:key']) == [b'12345', None]
+    storage.close()
+
+    target = FakeRedis()
+    assert snapshot.import_snapshot(target, path, batch_size=3) == 4
+    assert target.data[b'coordinates:Moscow'] == (b'55.7,37.6', -1)
+    value, ttl = target.data[b'geo:1.0,2.0']
+    assert value == b'1,2;address;city;77'
+    assert 9000 <= ttl <= 11000
+
+
+def test_snapshot_expired_records(tmpdir):
+    path = str(tmpdir.join('cache.snapshot'))
+    with open(path, 'wb') as stream:
+        snapshot.write_snapshot(stream, [
+            (b'coordinates:a', b'1,2', int(time.time()) - 10),
+            (b'coordinates:b', b'3,4', int(time.time()) + 1000),
+        ])
+    storage = snapshot.SnapshotStorage(path)
+    assert storage.get('coordinates:a') is None
+    assert storage.get('coordinates:b') == b'3,4'
+
+    target = FakeRedis()
+    assert snapshot.import_snapshot(target, path) == 1
+
+    with pytest.raises(ValueError):
+        snapshot.write_snapshot(io.BytesIO(), [(b'b', b'', 0), (b'a', b'', 0)])
+
+
+def test_snapshot_storage_serves_service(tmpdir):
+    path = str(tmpdir.join('cache.snapshot'))
+    with open(path, 'wb') as stream:
+        snapshot.write_snapshot(stream, [(b'coordinates:Moscow', b'55.7,37.6', 0)])
+    api_mock = mock.Mock(get_coordinates=mock.Mock(return_value=(1, 2)))
+    service = GmapsCacheableGeocodeService(storage=snapshot.SnapshotStorage(path), api=api_mock)
+
+    assert service.get_coordinates('Moscow') == Coordinates(55.7, 37.6)
+    assert service.get_coordinates_many(['Moscow', 'Tver']) == [Coordinates(55.7, 37.6), Coordinates(1, 2)]
+    assert service.get_coordinates('Tver') == Coordinates(1, 2)
+    assert api_mock.get_coordinates.call_count == 2
+
+
+def test_snapshot_format_error(tmpdir):
+    path = str(tmpdir.join('broken.snapshot'))
+    with open(path, 'wb') as stream:
+        stream.write(b'not a snapshot file at all, not a snapshot file')
+    with pytest.raises(snapshot.SnapshotFormatError):
+        snapshot.SnapshotStorage(path)
+
+
+def test_snapshot_empty_file(tmpdir):
+    path = str(tmpdir.join('empty.snapshot'))
+    open(path, 'wb').close()
+    storage = snapshot.SnapshotStorage(path)
+    assert len(storage) == 0
+    assert storage.get('coordinates:Moscow') is None
+    assert list(storage.iter_records()) == []
+    storage.close()
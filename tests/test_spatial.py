@@ -0,0 +1,38 @@
+from geo_garry import distance
+from geo_garry.spatial import NearestPointsIndex
+
+
+def test_nearest_points_index():
+    index = NearestPointsIndex([(0, 0), (1, 1), (3, 4), (-1, 0)])
+    assert len(index) == 4
+
+    dists, indexes = index.query((0.1, 0), k=2)
+    assert indexes == [0, 3]
+    assert [round(dist, 5) for dist in dists] == [0.1, 1.1]
+
+    dists, indexes = index.query((3, 3), k=1)
+    assert indexes == [2]
+    assert dists == [1.0]
+
+    dists, indexes = index.query((0, 0), k=10)
+    assert indexes == [0, 3, 1, 2]
+    assert dists[-1] == 5.0
+
+
+def test_nearest_points_index_many():
+    index = NearestPointsIndex([(0, 0), (1, 1), (3, 4)])
+    dists, indexes = index.query_many([(0, 0.1), (3, 3.9)], k=2)
+    assert indexes.tolist() == [[0, 1], [2, 1]]
+    assert dists.shape == (2, 2)
+    assert round(float(dists[0][0]), 5) == 0.1
+
+    for point in [(0.5, 0.4), (2, 2), (-3, 8)]:
+        dists, indexes = index.query(point, k=3)
+        many_dists, many_indexes = index.query_many([point], k=3)
+        assert many_indexes[0].tolist() == indexes
+        assert [round(dist, 9) for dist in many_dists[0].tolist()] == [round(dist, 9) for dist in dists]
+
+
+def test_mkad_exits_index():
+    _, indexes = distance.MKAD_TREE.query((123.10, 123.10), k=7)
+    assert indexes == [88, 40, 42, 89, 90, 91, 0]
@@ -0,0 +1,120 @@
+import multiprocessing
+import time
+from unittest import mock
+
+import pytest
+
+from geo_garry.cache import InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService
+from geo_garry.sqlite_storage import SqliteStorage
+
+
+@pytest.fixture(params=['sqlite', 'memory'])
+def storage(request, tmpdir):
+    if request.param == 'memory':
+        yield InMemoryStorage()
+        return
+    storage = SqliteStorage(str(tmpdir.join('cache.db')))
+    yield storage
+    storage.close()
+
+
+def test_storage_get_set_ttl(storage):
+    assert storage.get('key') is None
+    assert storage.set('key', 'value', ex=10)
+    storage.set(b'forever', b'\x00bytes')
+    storage.set('short', 1, px=1)
+    time.sleep(0.01)
+
+    assert storage.get(b'key') == b'value'
+    assert storage.get('forever') == b'\x00bytes'
+    assert storage.get('short') is None
+    assert storage.exists('key') == 1
+    assert storage.exists('short') == 0
+    assert 9000 < storage.pttl('key') <= 10000
+    assert storage.pttl('forever') == -1
+    assert storage.pttl('short') == -2
+    assert storage.mget(['forever', 'absent', 'key']) == [b'\x00bytes', None, b'value']
+    assert sorted(storage.scan_iter(match='k*')) == ['key']
+    assert storage.delete('key', 'absent') == 1
+    assert storage.get('key') is None
+
+
+def test_storage_pipeline(storage):
+    pipeline = storage.pipeline(transaction=False)
+    pipeline.set('a', '1', ex=100)
+    pipeline.set('b', '2')
+    pipeline.get('a')
+    pipeline.pttl('b')
+    pipeline.set('c', '3')
+    assert pipeline.execute() == [True, True, b'1', -1, True]
+    assert storage.mget(['a', 'b', 'c']) == [b'1', b'2', b'3']
+
+
+def test_storage_scan_iter_count(storage):
+    for key in ['a', 'b:1', 'b:2', 'b:3', 'b:4', 'b:5', 'c']:
+        storage.set(key, 1)
+    storage.set('b:expired', 1, px=1)
+    time.sleep(0.01)
+    assert sorted(storage.scan_iter(match='b:*', count=2)) == ['b:1', 'b:2', 'b:3', 'b:4', 'b:5']
+    assert sorted(storage.scan_iter(match='b:1', count=1)) == ['b:1']
+    assert len(list(storage.scan_iter(count=3))) == 7
+
+
+def test_sqlite_storage_transaction_pipeline(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('cache.db')))
+    pipeline = storage.pipeline().set('a', '1').get('a').set('b', '2', ex='not a number')
+    with pytest.raises(TypeError):
+        pipeline.execute()
+    assert storage.mget(['a', 'b']) == [None, None]  # commands before the failed one are rolled back
+
+    assert storage.pipeline().set('a', '1').get('a').set('b', '2').execute() == [True, b'1', True]
+    assert storage.mget(['a', 'b']) == [b'1', b'2']
+
+
+def test_sqlite_storage_compaction(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('cache.db')))
+    storage.set('expired', 'value', px=1)
+    storage.set('alive', 'value', ex=100)
+    time.sleep(0.01)
+    assert storage.compact() == 1
+    assert storage.connection.execute('SELECT key FROM cache').fetchall() == [('alive',)]
+
+    storage.set('expired', 'value', px=1)
+    storage.start_compaction(0.01)
+    time.sleep(0.1)
+    storage.close()
+    assert SqliteStorage(str(tmpdir.join('cache.db'))).connection.execute(
+        'SELECT count(*) FROM cache'
+    ).fetchone() == (1,)
+
+
+def write_keys(path, worker):
+    storage = SqliteStorage(path)
+    for index in range(50):
+        storage.set('{}:{}'.format(worker, index), str(index), ex=100)
+
+
+def test_sqlite_storage_concurrent_processes(tmpdir):
+    path = str(tmpdir.join('cache.db'))
+    SqliteStorage(path)
+    processes = [multiprocessing.Process(target=write_keys, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+    assert len(list(SqliteStorage(path).scan_iter())) == 200
+
+
+def test_sqlite_storage_with_service(tmpdir):
+    storage = SqliteStorage(str(tmpdir.join('cache.db')))
+    api_mock = mock.Mock(get_coordinates=lambda address: (55.7, 37.6) if address == 'Moscow' else None)
+    service = GmapsCacheableGeocodeService(storage=storage, api=api_mock)
+
+    assert service.get_many(['Moscow', 'nowhere']) == [Coordinates(55.7, 37.6), None]
+    api_mock.get_coordinates = mock.Mock()
+    assert service.get('Moscow') == Coordinates(55.7, 37.6)
+    assert service.get_many(['Moscow', 'nowhere']) == [Coordinates(55.7, 37.6), None]
+    api_mock.get_coordinates.assert_not_called()
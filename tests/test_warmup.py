@@ -0,0 +1,52 @@
+from collections import Counter
+from unittest import mock
+
+from geo_garry import distance, warmup
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.geocode import GmapsCacheableGeocodeService
+
+
+def test_count_queries():
+    counter = warmup.count_queries(['Москва, Тверская 1', '55.75, 37.61', '', 'Москва, Тверская 1', '55.75;37.61'])
+    assert counter == Counter({'Москва, Тверская 1': 2, Coordinates(55.75, 37.61): 2})
+
+
+def test_iter_grid():
+    grid = list(warmup.iter_grid(55.0, 37.0, 55.01, 37.02, 500))
+    assert grid[0] == Coordinates(55.0, 37.0)
+    assert len(grid) == 3 * 3
+    assert round((grid[1].longitude - grid[0].longitude) * 111320 * 0.5736) == 500
+
+
+def test_warm_queries_by_frequency_within_budget():
+    api_mock = mock.Mock(get_coordinates=mock.Mock(return_value=(1, 2)))
+    storage_mock = mock.Mock(mget=mock.Mock(side_effect=lambda keys: [
+        b'3,4' if key == 'coordinates:cached' else None for key in keys
+    ]))
+    service = GmapsCacheableGeocodeService(storage=storage_mock, api=api_mock)
+    warmer = warmup.CacheWarmer(geocode_service=service, budget=2, workers=1)
+
+    stats = warmer.warm_queries(Counter({'rare': 1, 'cached': 5, 'popular': 10, 'medium': 3}))
+    assert stats == warmup.WarmupStats(cached=1, refreshed=2, failed=0, skipped=1)
+    assert [call[0][0] for call in api_mock.get_coordinates.call_args_list] == ['popular', 'medium']
+    storage_mock.mget.assert_called_once_with([
+        'coordinates:popular', 'coordinates:cached', 'coordinates:medium', 'coordinates:rare',
+    ])
+    assert storage_mock.pipeline.return_value.set.call_count == 2
+
+
+@mock.patch('geo_garry.distance.NearestExitsGoogleDistanceCalculator.calc_distance')
+def test_warm_grid_distances(calc_mock):
+    calc_mock.return_value = 12345
+    storage_mock = mock.Mock(mget=mock.Mock(side_effect=lambda keys: [None] * len(keys)))
+    calculator = distance.MkadDistanceCalculator(storage=storage_mock, gmaps_client=mock.Mock())
+    warmer = warmup.CacheWarmer(distance_calculators=[calculator])
+
+    inside_mkad = Coordinates(latitude=55.6892209716432, longitude=37.752854389528585)
+    outside_mkad = Coordinates(latitude=50.4254225, longitude=36.9020654)
+    stats = warmer.warm_grid([inside_mkad, outside_mkad])
+    assert stats == warmup.WarmupStats(cached=0, refreshed=1, failed=0, skipped=0)
+    calc_mock.assert_called_once_with(outside_mkad)
+    storage_mock.pipeline.return_value.set.assert_called_once_with(
+        'distance:50.4254225,36.9020654', '12345', ex=60*60*24*30,
+    )
@@ -0,0 +1,137 @@
+import threading
+import time
+from unittest import mock
+
+from geo_garry.cache import CacheableServiceAbstract, InMemoryStorage
+from geo_garry.dataclasses import Coordinates
+from geo_garry.gmaps.cache import CacheStorageCoordinates
+from geo_garry.write_behind import WriteBehindStorage
+
+
+def test_write_behind_visibility_and_flush():
+    remote = InMemoryStorage()
+    storage = WriteBehindStorage(remote, flush_interval=60)
+    storage.set('coordinates:1', '1,2', ex=100)
+    storage.set('coordinates:2', 'old')
+    storage.set('coordinates:2', '3,4')
+    remote.set('coordinates:3', '5,6')
+
+    assert remote.get('coordinates:1') is None  # not written yet
+    assert storage.get('coordinates:1') == b'1,2'
+    assert storage.mget(['coordinates:3', 'coordinates:2', 'absent']) == [b'5,6', b'3,4', None]
+    assert storage.exists('coordinates:1', 'coordinates:3', 'absent') == 2
+    pipeline = storage.pipeline(transaction=False)
+    pipeline.pttl('coordinates:1').pttl('coordinates:2').get('coordinates:3').set('coordinates:4', '7,8')
+    ttl, never, value, written = pipeline.execute()
+    assert 99000 < ttl <= 100000
+    assert (never, value, written) == (-1, b'5,6', True)
+
+    assert storage.flush(timeout=5)
+    assert remote.get('coordinates:1') == b'1,2'
+    assert 99000 < remote.pttl('coordinates:1') <= 100000
+    assert remote.mget(['coordinates:2', 'coordinates:4']) == [b'3,4', b'7,8']
+    assert (storage.stats.queued, storage.stats.coalesced, storage.stats.written) == (4, 1, 3)
+
+    storage.set('coordinates:5', '9,9')
+    storage.close()
+    assert remote.get('coordinates:5') == b'9,9'
+    storage.set('coordinates:6', '1,1')  # closed storage writes synchronously
+    assert remote.get('coordinates:6') == b'1,1'
+
+
+def test_write_behind_backpressure():
+    remote = mock.Mock()
+    released = threading.Event()
+    writing = threading.Event()
+
+    def execute():
+        writing.set()
+        released.wait(5)
+    remote.pipeline.return_value.execute.side_effect = execute
+    storage = WriteBehindStorage(remote, flush_interval=0, max_pending=2, block_timeout=0.05)
+
+    storage.set('key0', 'value')
+    assert writing.wait(5)  # key0 is being written, queue is free
+    storage.set('key1', 'value')
+    storage.set('key2', 'value')
+    storage.set('key1', 'newer')  # queued key is replaced without waiting
+    storage.set('key3', 'value', ex=10)  # queue is full
+    remote.set.assert_called_once_with('key3', 'value', ex=10)
+    assert storage.stats.sync_writes == 1
+    assert storage.get('key0') == b'value'
+    assert storage.get('key1') == b'newer'
+
+    released.set()
+    storage.close()
+    assert storage.stats.written == 3
+    assert storage.pending == {} and storage.in_flight == {}
+    remote.pipeline.return_value.set.assert_any_call('key1', 'newer')
+
+
+def test_write_behind_conditional_sets_and_deletes():
+    remote = InMemoryStorage()
+    storage = WriteBehindStorage(remote, flush_interval=60)
+    assert storage.set('lock:1', 'token', px=1000, nx=True)
+    assert storage.set('lock:1', 'other', px=1000, nx=True) is None
+    storage.set('coordinates:1', '1,2')
+    assert storage.set('coordinates:1', '3,4', nx=True) is None  # queued write is written first
+    assert remote.get('coordinates:1') == b'1,2'
+
+    storage.set('coordinates:2', '5,6')
+    storage.delete('coordinates:2')
+    pipeline = storage.pipeline(transaction=False)
+    pipeline.set('coordinates:3', '7,8').delete('coordinates:3').set('coordinates:4', '9,9')
+    assert pipeline.execute() == [True, 0, True]
+    assert storage.flush(timeout=5)
+    assert remote.mget(['coordinates:2', 'coordinates:3', 'coordinates:4']) == [None, None, b'9,9']
+    storage.close()
+
+
+def test_write_behind_delete_waits_for_write_in_flight():
+    released = threading.Event()
+    writing = threading.Event()
+
+    class BlockingStorage(InMemoryStorage):
+        def pipeline(self, transaction=True):
+            pipeline = super().pipeline(transaction)
+            execute = pipeline.execute
+
+            def blocked_execute():
+                writing.set()
+                released.wait(5)
+                return execute()
+            pipeline.execute = blocked_execute
+            return pipeline
+
+    remote = BlockingStorage()
+    storage = WriteBehindStorage(remote, flush_interval=0)
+    storage.set('coordinates:1', '1,2')
+    assert writing.wait(5)
+    deleting = threading.Thread(target=storage.delete, args=('coordinates:1',))
+    deleting.start()
+    time.sleep(0.05)
+    released.set()
+    deleting.join(5)
+    storage.close()
+    assert remote.get('coordinates:1') is None
+
+
+def test_write_behind_service_reads_own_writes():
+    remote = InMemoryStorage()
+    storage = WriteBehindStorage(remote, flush_interval=60)
+    refresh = mock.Mock(return_value=Coordinates(1, 2))
+
+    class TestService(CacheableServiceAbstract):
+        storage_class = CacheStorageCoordinates
+
+        def refresh_value(self, key):
+            return refresh(key)
+
+    service = TestService(storage=storage)
+    assert service.get('address') == Coordinates(1, 2)
+    assert service.get('address') == Coordinates(1, 2)
+    assert service.get_many(['address', 'other']) == [Coordinates(1, 2)] * 2
+    assert refresh.call_count == 2
+    assert remote.get('coordinates:address') is None
+    storage.close()
+    assert remote.mget(['coordinates:address', 'coordinates:other']) == [b'1,2', b'1,2']